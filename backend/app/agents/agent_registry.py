@@ -0,0 +1,143 @@
+"""Registry that reuses Azure AI Foundry agents across process restarts.
+
+Each agent definition is fingerprinted from its model, instructions and
+tool schemas, and the fingerprint is stored in the agent's metadata. On
+startup existing agents with a matching fingerprint are reused and an agent
+is only created when its definition changed, so replicas and scale-from-zero
+starts stop leaving orphaned agents behind.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import Agent, FunctionTool, ToolSet
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(definition: dict) -> str:
+    """Stable hash of the parts of a definition that change agent behavior."""
+    canonical = json.dumps(
+        {
+            "model": definition["model"],
+            "instructions": definition["instructions"],
+            "tools": definition.get("tools", []),
+        },
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AgentRegistry:
+    """Resolves agent definitions to existing or newly created agents."""
+
+    def __init__(self, project_client: AIProjectClient):
+        self.project_client = project_client
+        # Optional local file remembering agent IDs by definition key
+        self.cache_path = os.getenv("AGENT_REGISTRY_PATH")
+        self.reused = 0
+        self.created = 0
+
+    async def ensure_agents(self, definitions: dict[str, dict]) -> dict[str, Agent]:
+        """Get an agent for every definition, creating only changed ones."""
+        fingerprints = {key: fingerprint(d) for key, d in definitions.items()}
+
+        # Validate remembered agent IDs concurrently
+        known = self._load_cache()
+        resolved = dict(zip(definitions, await asyncio.gather(*(
+            self._get_known_agent(known.get(key), fingerprints[key])
+            for key in definitions
+        ))))
+
+        # Fall back to one paged scan of the project for the rest
+        missing = [key for key, agent in resolved.items() if agent is None]
+        if missing:
+            existing = await self._index_agents()
+            for key in missing:
+                resolved[key] = existing.get(fingerprints[key])
+
+        # Create whatever is still missing concurrently
+        to_create = [key for key, agent in resolved.items() if agent is None]
+        created = await asyncio.gather(*(
+            self._create_agent(key, definitions[key], fingerprints[key])
+            for key in to_create
+        ))
+        resolved.update(zip(to_create, created))
+
+        self.created += len(to_create)
+        self.reused += len(definitions) - len(to_create)
+        logger.info(f"Agents ready: {len(definitions) - len(to_create)} reused, {len(to_create)} created")
+
+        self._save_cache({key: agent.id for key, agent in resolved.items()})
+        return resolved
+
+    async def _get_known_agent(self, agent_id: Optional[str], expected: str) -> Optional[Agent]:
+        """Get a remembered agent if it still exists with the same fingerprint."""
+        if not agent_id:
+            return None
+        try:
+            agent = await self.project_client.agents.get_agent(agent_id)
+        except Exception:
+            return None
+        if (agent.metadata or {}).get("fingerprint") != expected:
+            return None
+        return agent
+
+    async def _index_agents(self) -> dict[str, Agent]:
+        """Index the project's agents by fingerprint, newest first."""
+        index = {}
+        after = None
+        while True:
+            page = await self.project_client.agents.list_agents(limit=100, after=after)
+            for agent in page.data:
+                agent_fingerprint = (agent.metadata or {}).get("fingerprint")
+                if agent_fingerprint and agent_fingerprint not in index:
+                    index[agent_fingerprint] = agent
+            if not page.has_more:
+                return index
+            after = page.last_id
+
+    async def _create_agent(self, key: str, definition: dict, agent_fingerprint: str) -> Agent:
+        """Create an agent tagged with its definition fingerprint."""
+        toolset = None
+        if definition.get("tools"):
+            toolset = ToolSet()
+            for tool in definition["tools"]:
+                toolset.add(FunctionTool(**tool))
+
+        logger.info(f"Creating agent {definition['name']} ({agent_fingerprint[:12]})")
+        return await self.project_client.agents.create_agent(
+            model=definition["model"],
+            name=definition["name"],
+            instructions=definition["instructions"],
+            tools=toolset,
+            metadata={"role": key, "fingerprint": agent_fingerprint},
+        )
+
+    def _load_cache(self) -> dict:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load agent registry cache: {e}")
+            return {}
+
+    def _save_cache(self, agent_ids: dict):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(agent_ids, f)
+        except OSError as e:
+            logger.warning(f"Failed to save agent registry cache: {e}")
+
+    def get_metrics(self) -> dict:
+        return {"reused": self.reused, "created": self.created}
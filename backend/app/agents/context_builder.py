@@ -0,0 +1,223 @@
+"""Token-budgeted conversation context for agent runs.
+
+Instead of a fixed number of recent messages, each agent gets a token
+budget. The newest messages of the agent's thread that fit the budget are
+sent verbatim; older turns are rolled into a running summary cached on the
+session for each agent, and the entities the customer mentioned most
+recently (order IDs, emails, product names) are pinned so they survive
+truncation, their tokens taken from the budget. Prompt size therefore
+stays bounded however long the conversation gets.
+"""
+
+import os
+import re
+import logging
+from typing import Callable, Optional
+
+from agents.prefetch import EMAIL_PATTERN, ORDER_ID_PATTERN
+from services.cosmos_service import CosmosService
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional
+    _encoding = None
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+# Fixed per-message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally, estimating ~4 characters per token without tiktoken."""
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _summarize_message(message: dict, max_words: int = 30) -> str:
+    """One-line extractive summary of a message: its first sentence, capped."""
+    first_sentence = SENTENCE_END.split(message["content"].strip(), maxsplit=1)[0]
+    words = first_sentence.split()
+    text = " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+    return f"{message['role']}: {text}"
+
+
+class ContextBuilder:
+    """Chooses the context window and pinned memory for an agent run."""
+
+    def __init__(
+        self,
+        cosmos_service: CosmosService,
+        match_product_names: Optional[Callable[[str], list]] = None
+    ):
+        self.cosmos_service = cosmos_service
+        self.match_product_names = match_product_names or (lambda text: [])
+        self.default_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+        self.summary_budget = int(os.getenv("CONTEXT_SUMMARY_TOKEN_BUDGET", "300"))
+        self.max_pinned = int(os.getenv("CONTEXT_MAX_PINNED_ENTITIES", "5"))
+
+    def budget_for(self, agent_type: str) -> int:
+        """Token budget for an agent, e.g. CONTEXT_TOKEN_BUDGET_ORDER."""
+        return int(os.getenv(f"CONTEXT_TOKEN_BUDGET_{agent_type.upper()}", self.default_budget))
+
+    async def build(
+        self,
+        session_id: str,
+        agent_type: str,
+        history: list,
+        new_thread: bool = False,
+        state: Optional[dict] = None
+    ) -> dict:
+        """Build the context for the latest message in history.
+
+        Each agent has its own thread, which holds the messages it was
+        seeded with and its own turns since, so the window and summary are
+        kept per agent. Returns "messages", the newest thread messages that
+        fit the agent's budget (at least the current one), "instructions"
+        with the agent's running summary, turns of other agents and pinned
+        entities, and "prompt_tokens" as counted locally. With new_thread,
+        the window is of the whole history, to seed a new thread with.
+        Pass the session state when it has already been read for the turn.
+        """
+        if state is None:
+            state = await self.cosmos_service.get_session_state(session_id)
+        memory = state.get("memory", {})
+        memory.setdefault("entities", {})
+        agents = memory.setdefault("agents", {})
+        agent_memory = agents.setdefault(agent_type, {"summary": [], "summarizedCount": 0})
+        if new_thread:
+            agent_memory.pop("threadStart", None)
+
+        # Pinned entities are sent with every run, so they come out of the budget
+        pinned_updated = self._pin_entities(memory, history)
+        pinned = self._pinned(memory)
+        pinned_tokens = count_tokens(pinned) if pinned else 0
+
+        thread = self._thread_positions(agent_type, history, agent_memory)
+        budget = self.budget_for(agent_type) - pinned_tokens
+        window = 0
+        used = 0
+        for position in reversed(thread):
+            tokens = count_tokens(history[position]["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if window and used + tokens > budget:
+                break
+            used += tokens
+            window += 1
+        window_positions = thread[len(thread) - window:]
+        start = window_positions[0]
+        if new_thread:
+            agent_memory["threadStart"] = start
+            agent_memory["threadSeeded"] = len(history)
+
+        # Everything before the window is summarized; turns of other agents
+        # within it are not in the thread and are listed individually
+        updated = self._roll_summary(agent_memory, history[:start]) or new_thread or pinned_updated
+        if updated:
+            await self.cosmos_service.update_session_state(session_id, memory=memory)
+
+        in_window = set(window_positions)
+        others = [history[p] for p in range(start, len(history)) if p not in in_window]
+        instructions = self._instructions(agent_memory, others, pinned)
+        return {
+            "messages": [history[p] for p in window_positions],
+            "instructions": instructions,
+            "prompt_tokens": used + (count_tokens(instructions) if instructions else 0),
+        }
+
+    @staticmethod
+    def _thread_positions(agent_type: str, history: list, agent_memory: dict) -> list[int]:
+        """Positions in history of the messages in the agent's thread.
+
+        These are the messages the thread was seeded with, then the
+        agent's own replies and the customer messages routed to it,
+        including the current one. Without a thread it is all of history.
+        """
+        if "threadStart" not in agent_memory:
+            return list(range(len(history)))
+
+        seeded = min(agent_memory.get("threadSeeded", 0), len(history))
+        positions = list(range(min(agent_memory["threadStart"], seeded), seeded))
+        last = len(history) - 1
+        for position in range(seeded, len(history)):
+            message = history[position]
+            if message["role"] == "user":
+                following = history[position + 1] if position < last else None
+                if following is None or following.get("agent") == agent_type:
+                    positions.append(position)
+            elif message.get("agent") == agent_type:
+                positions.append(position)
+        if not positions or positions[-1] != last:
+            positions.append(last)
+        return positions
+
+    def _roll_summary(self, memory: dict, dropped: list) -> bool:
+        """Add newly dropped turns to the summary, keeping it within budget."""
+        start = memory["summarizedCount"]
+        if len(dropped) <= start:
+            return False
+
+        summary = memory["summary"] + [_summarize_message(m) for m in dropped[start:]]
+        while len(summary) > 1 and count_tokens("\n".join(summary)) > self.summary_budget:
+            summary.pop(0)
+        memory["summary"] = summary
+        memory["summarizedCount"] = len(dropped)
+        return True
+
+    def _pin_entities(self, memory: dict, history: list) -> bool:
+        """Pin the most recent order IDs, emails and product names from customer messages."""
+        entities = memory["entities"]
+        found = {"orderIds": [], "emails": [], "products": []}
+        for message in history[memory.get("scannedCount", 0):]:
+            if message["role"] != "user":
+                continue
+            text = message["content"]
+            found["orderIds"] += [o.upper() for o in ORDER_ID_PATTERN.findall(text)]
+            found["emails"] += [e.lower() for e in EMAIL_PATTERN.findall(text)]
+            found["products"] += self.match_product_names(text)
+        memory["scannedCount"] = len(history)
+
+        updated = False
+        for key, values in found.items():
+            pinned = list(entities.get(key, []))
+            if not values and len(pinned) <= self.max_pinned:
+                continue
+            # Mentioned again means most recent: move to the end, then keep the last ones
+            for value in values:
+                if value in pinned:
+                    pinned.remove(value)
+                pinned.append(value)
+            pinned = pinned[-self.max_pinned:] if self.max_pinned > 0 else []
+            if pinned != entities.get(key, []):
+                entities[key] = pinned
+                updated = True
+        return updated
+
+    @staticmethod
+    def _pinned(memory: dict) -> str:
+        """Render the pinned entities."""
+        labels = {"orderIds": "Order IDs", "emails": "Emails", "products": "Products"}
+        pinned = [
+            f"- {labels[key]}: {', '.join(values)}"
+            for key, values in memory["entities"].items() if values
+        ]
+        if not pinned:
+            return ""
+        return "Details the customer has provided:\n" + "\n".join(pinned)
+
+    def _instructions(self, agent_memory: dict, others: list, pinned: str) -> str:
+        """Render the summary, other agents' turns and pinned entities as additional instructions."""
+        parts = []
+        if agent_memory["summary"]:
+            parts.append("Summary of earlier conversation:\n" + "\n".join(agent_memory["summary"]))
+        if others:
+            parts.append(
+                "Meanwhile, handled by other agents:\n"
+                + "\n".join(_summarize_message(m) for m in others)
+            )
+        if pinned:
+            parts.append(pinned)
+        return "\n\n".join(parts)
@@ -0,0 +1,318 @@
+"""In-process intent classifiers for the triage fast path.
+
+The orchestrator asks a local classifier first and only pays for a triage
+agent run when the classifier's confidence is below a threshold. Two
+classifiers are provided and can be combined:
+
+- KeywordIntentClassifier: the keyword rules used by the mock triage path,
+  with per-rule confidences calibrated against logged triage outputs.
+- TfidfIntentClassifier: TF-IDF features with a softmax linear model,
+  trained on logged triage outputs and temperature-calibrated.
+
+Logged triage outputs are JSON lines with "message" and "classification"
+keys, written by the orchestrator when TRIAGE_LOG_PATH is set.
+"""
+
+import os
+import re
+import json
+import math
+import random
+import logging
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LABELS = ["PRODUCT", "ORDER", "GENERAL"]
+
+SUMMARIES = {
+    "ORDER": "Order-related inquiry",
+    "PRODUCT": "Product inquiry",
+    "GENERAL": "General inquiry",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase word unigrams and bigrams."""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def load_examples(path: str) -> list[dict]:
+    """Load logged triage outputs that have a known classification."""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            label = str(record.get("classification", "")).upper()
+            if record.get("message") and label in LABELS:
+                examples.append({**record, "classification": label})
+    return examples
+
+
+class IntentClassifier:
+    """Base class for local intent classifiers."""
+
+    # Whether confidences were fitted to logged triage outputs; only then
+    # can they be trusted to skip the triage agent
+    calibrated = True
+
+    def predict(self, message: str) -> dict:
+        """Classify a message.
+
+        Returns a dict with "classification", "summary" and "confidence",
+        the calibrated probability that the classification matches what the
+        triage agent would return.
+        """
+        raise NotImplementedError
+
+    def _prediction(self, label: str, confidence: float) -> dict:
+        return {
+            "classification": label,
+            "summary": SUMMARIES[label],
+            "confidence": round(confidence, 4),
+        }
+
+
+class KeywordIntentClassifier(IntentClassifier):
+    """Keyword rules from the mock triage path with calibrated confidences."""
+
+    KEYWORDS = {
+        "ORDER": ["order", "delivery", "track", "return", "refund"],
+        "PRODUCT": ["product", "ingredient", "recommend", "shampoo", "detergent", "soap"],
+    }
+
+    # Confidence by (label, keyword hits capped at 2) until calibrated
+    DEFAULT_CONFIDENCE = {
+        "ORDER:1": 0.8,
+        "ORDER:2": 0.92,
+        "PRODUCT:1": 0.75,
+        "PRODUCT:2": 0.9,
+        "GENERAL:0": 0.4,
+    }
+
+    def __init__(self, confidence: Optional[dict] = None):
+        self.confidence = {**self.DEFAULT_CONFIDENCE, **(confidence or {})}
+        self.calibrated = bool(confidence)
+
+    def _match(self, message: str) -> tuple[str, int]:
+        """Apply the rules in mock-path order and count keyword hits."""
+        text = message.lower()
+        for label in ("ORDER", "PRODUCT"):
+            hits = sum(1 for word in self.KEYWORDS[label] if word in text)
+            if hits:
+                return label, min(hits, 2)
+        return "GENERAL", 0
+
+    def predict(self, message: str) -> dict:
+        label, hits = self._match(message)
+        return self._prediction(label, self.confidence[f"{label}:{hits}"])
+
+    def calibrate(self, examples: list[dict]):
+        """Set each rule's confidence to its smoothed empirical precision."""
+        correct = Counter()
+        total = Counter()
+        for example in examples:
+            label, hits = self._match(example["message"])
+            key = f"{label}:{hits}"
+            total[key] += 1
+            correct[key] += label == example["classification"]
+
+        for key in total:
+            # Laplace smoothing towards the uncalibrated prior
+            prior = self.DEFAULT_CONFIDENCE[key]
+            self.confidence[key] = (correct[key] + 2 * prior) / (total[key] + 2)
+        self.calibrated = True
+
+
+class TfidfIntentClassifier(IntentClassifier):
+    """TF-IDF features with a temperature-calibrated softmax linear model."""
+
+    def __init__(
+        self,
+        idf: Optional[dict] = None,
+        weights: Optional[dict] = None,
+        bias: Optional[dict] = None,
+        temperature: float = 1.0
+    ):
+        self.idf: dict[str, float] = idf or {}
+        self.weights: dict[str, dict[str, float]] = weights or {label: {} for label in LABELS}
+        self.bias: dict[str, float] = bias or {label: 0.0 for label in LABELS}
+        self.temperature = temperature
+
+    def _features(self, message: str) -> dict[str, float]:
+        """Sublinear TF-IDF vector, L2 normalized, over known terms."""
+        counts = Counter(t for t in tokenize(message) if t in self.idf)
+        features = {t: (1 + math.log(c)) * self.idf[t] for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+        return {t: v / norm for t, v in features.items()}
+
+    def _logits(self, features: dict[str, float]) -> dict[str, float]:
+        return {
+            label: self.bias[label] + sum(
+                self.weights[label].get(t, 0.0) * v for t, v in features.items()
+            )
+            for label in LABELS
+        }
+
+    @staticmethod
+    def _softmax(logits: dict[str, float], temperature: float = 1.0) -> dict[str, float]:
+        peak = max(logits.values())
+        exp = {k: math.exp((v - peak) / temperature) for k, v in logits.items()}
+        total = sum(exp.values())
+        return {k: v / total for k, v in exp.items()}
+
+    def predict(self, message: str) -> dict:
+        probs = self._softmax(self._logits(self._features(message)), self.temperature)
+        label = max(probs, key=probs.get)
+        return self._prediction(label, probs[label])
+
+    def fit(
+        self,
+        examples: list[dict],
+        epochs: int = 30,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+        seed: int = 13
+    ):
+        """Train the model with SGD and calibrate it on a held-out split."""
+        rng = random.Random(seed)
+        shuffled = examples[:]
+        rng.shuffle(shuffled)
+        split = max(1, int(len(shuffled) * 0.8))
+        train, holdout = shuffled[:split], shuffled[split:]
+
+        self._train(train, epochs, learning_rate, l2, rng)
+        if holdout:
+            self.temperature = self._fit_temperature(holdout)
+        # Refit on all data, keeping the calibrated temperature
+        self._train(shuffled, epochs, learning_rate, l2, rng)
+
+    def _train(self, examples, epochs, learning_rate, l2, rng):
+        document_frequency = Counter()
+        for example in examples:
+            document_frequency.update(set(tokenize(example["message"])))
+        n = len(examples)
+        self.idf = {
+            t: math.log((1 + n) / (1 + df)) + 1
+            for t, df in document_frequency.items()
+        }
+        self.weights = {label: {} for label in LABELS}
+        self.bias = {label: 0.0 for label in LABELS}
+
+        data = [(self._features(e["message"]), e["classification"]) for e in examples]
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for features, target in data:
+                probs = self._softmax(self._logits(features))
+                for label in LABELS:
+                    gradient = probs[label] - (label == target)
+                    self.bias[label] -= rate * gradient
+                    weights = self.weights[label]
+                    for t, v in features.items():
+                        w = weights.get(t, 0.0)
+                        weights[t] = w - rate * (gradient * v + l2 * w)
+
+    def _fit_temperature(self, examples: list[dict]) -> float:
+        """Pick the softmax temperature minimizing held-out log loss."""
+        logits = [
+            (self._logits(self._features(e["message"])), e["classification"])
+            for e in examples
+        ]
+        best, best_loss = 1.0, float("inf")
+        for step in range(1, 41):
+            temperature = step * 0.125
+            loss = -sum(
+                math.log(max(self._softmax(l, temperature)[target], 1e-12))
+                for l, target in logits
+            )
+            if loss < best_loss:
+                best, best_loss = temperature, loss
+        return best
+
+    def to_dict(self) -> dict:
+        return {
+            "idf": self.idf,
+            "weights": {
+                label: {t: round(w, 6) for t, w in weights.items() if abs(w) > 1e-6}
+                for label, weights in self.weights.items()
+            },
+            "bias": self.bias,
+            "temperature": self.temperature,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TfidfIntentClassifier":
+        return cls(
+            idf=data["idf"],
+            weights=data["weights"],
+            bias=data["bias"],
+            temperature=data.get("temperature", 1.0),
+        )
+
+
+class EnsembleIntentClassifier(IntentClassifier):
+    """Combines classifiers, trusting agreement and discounting conflicts."""
+
+    def __init__(self, classifiers: list[IntentClassifier]):
+        self.classifiers = classifiers
+        self.calibrated = all(c.calibrated for c in classifiers)
+
+    def predict(self, message: str) -> dict:
+        predictions = sorted(
+            (c.predict(message) for c in self.classifiers),
+            key=lambda p: p["confidence"],
+            reverse=True
+        )
+        best = predictions[0]
+        labels = {p["classification"] for p in predictions}
+        if len(labels) == 1:
+            return best
+        # On disagreement keep only the margin over the strongest dissent
+        dissent = max(
+            p["confidence"] for p in predictions
+            if p["classification"] != best["classification"]
+        )
+        return {**best, "confidence": round(best["confidence"] - dissent, 4)}
+
+
+def save_model(path: str, keyword: KeywordIntentClassifier, tfidf: TfidfIntentClassifier):
+    """Save calibrated keyword confidences and the TF-IDF model as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"keyword": keyword.confidence, "tfidf": tfidf.to_dict()}, f)
+
+
+def load_intent_classifier() -> Optional[IntentClassifier]:
+    """Build the classifier selected by INTENT_CLASSIFIER.
+
+    Supported values are "keyword", "tfidf", "ensemble" (the default) and
+    "none". Models are read from INTENT_MODEL_PATH; without a model file the
+    keyword rules are used with their default confidences, which are not
+    calibrated and so never skip the triage agent.
+    """
+    kind = os.getenv("INTENT_CLASSIFIER", "ensemble").lower()
+    if kind == "none":
+        return None
+
+    model = {}
+    model_path = os.getenv("INTENT_MODEL_PATH")
+    if model_path and os.path.exists(model_path):
+        with open(model_path, encoding="utf-8") as f:
+            model = json.load(f)
+        logger.info(f"Loaded intent model from {model_path}")
+
+    keyword = KeywordIntentClassifier(model.get("keyword"))
+    tfidf = TfidfIntentClassifier.from_dict(model["tfidf"]) if "tfidf" in model else None
+
+    if kind == "tfidf" and tfidf:
+        return tfidf
+    if kind == "ensemble" and tfidf:
+        return EnsembleIntentClassifier([keyword, tfidf])
+    return keyword
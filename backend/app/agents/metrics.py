@@ -0,0 +1,33 @@
+"""Lightweight in-process latency metrics."""
+
+from collections import deque
+
+
+class LatencyRecorder:
+    """Keeps a bounded window of latency samples and reports percentiles."""
+
+    def __init__(self, window: int = 1000):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, milliseconds: float):
+        """Record a latency sample in milliseconds."""
+        self.samples.append(milliseconds)
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        """Get the p-th percentile of the current window."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(int(len(ordered) * p / 100), len(ordered) - 1)
+        return round(ordered[index], 1)
+
+    def get_metrics(self) -> dict:
+        """Get sample count and percentiles in milliseconds."""
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+        }
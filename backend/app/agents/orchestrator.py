@@ -8,22 +8,38 @@ This module coordinates between specialized agents:
 
 import os
 import json
+import time
+import asyncio
 import logging
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
 from azure.identity.aio import DefaultAzureCredential
 from azure.ai.projects.aio import AIProjectClient
 from azure.ai.projects.models import (
     Agent,
     AgentThread,
+    MessageDeltaChunk,
     MessageRole,
-    ToolSet,
-    FunctionTool,
-    CodeInterpreterTool,
+    ThreadMessageOptions,
+    ThreadRun,
+    TruncationObject,
 )
 
 from services.cosmos_service import CosmosService
 from services.search_service import SearchService
+from services.projection import fields_from_env, project, project_all
+from agents.thread_registry import ThreadRegistry
+from agents.run_waiter import RunWaiter
+from agents.agent_registry import AgentRegistry
+from agents.metrics import LatencyRecorder
+from agents.intent_classifier import SUMMARIES, KeywordIntentClassifier, load_intent_classifier
+from agents.triage_cache import TriageCache
+from agents.tool_registry import ToolRegistry
+from agents.tool_output import DEFAULT_ORDER_FIELDS, DEFAULT_PRODUCT_FIELDS
+from agents.prefetch import RequestContext, search_key, start_prefetch
+from agents.context_builder import ContextBuilder
+from agents.routing import StickyRouter
+from agents.turn_gate import SessionTurnGate, Turn
 
 logger = logging.getLogger(__name__)
 
@@ -41,9 +57,43 @@ class AgentOrchestrator:
         self.project_client: AIProjectClient = None
         self.agents: dict[str, Agent] = {}
         self.credential = DefaultAzureCredential()
+        self.thread_registry = ThreadRegistry(cosmos_service)
+        self.context_builder = ContextBuilder(
+            cosmos_service,
+            match_product_names=search_service.match_product_names
+        )
+        self.run_waiter: RunWaiter = None
+        self.agent_registry: AgentRegistry = None
+        self.time_to_first_token = LatencyRecorder()
+        self.intent_classifier = load_intent_classifier()
+        self.intent_confidence_threshold = float(
+            os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.85")
+        )
+        self.triage_log_path = os.getenv("TRIAGE_LOG_PATH")
+        self.triage_latency = LatencyRecorder()
+        self.triage_cache = TriageCache()
+        self.router = StickyRouter(
+            cosmos_service,
+            self.intent_classifier or KeywordIntentClassifier()
+        )
+        self.tools = ToolRegistry()
+        self._register_tools()
+        # Fields of tool results sent to the agents; "*" sends whole documents
+        self.product_fields = fields_from_env("PRODUCT_TOOL_FIELDS", DEFAULT_PRODUCT_FIELDS)
+        self.order_fields = fields_from_env("ORDER_TOOL_FIELDS", DEFAULT_ORDER_FIELDS)
+        self.turn_gate = SessionTurnGate(cosmos_service)
+        # Background tasks, referenced until they finish
+        self._background: set[asyncio.Task] = set()
+        # Idle threads are swept at most once per interval, one sweep at a time
+        self.thread_sweep_interval = float(os.getenv("AGENT_THREAD_SWEEP_INTERVAL_SECONDS", "300"))
+        self._last_thread_sweep = 0.0
+        self._thread_sweep_running = False
+        self.prefetch_started = 0
+        self.prefetch_hits = 0
+        self.triage_fast_path = 0
         
     async def initialize(self):
-        """Initialize the AI Foundry project client and create agents."""
+        """Initialize the AI Foundry project client and its agents."""
         project_endpoint = os.getenv("AI_FOUNDRY_PROJECT_ENDPOINT")
         
         if not project_endpoint:
@@ -54,18 +104,24 @@ class AgentOrchestrator:
             endpoint=project_endpoint,
             credential=self.credential
         )
+        self.run_waiter = RunWaiter(self.project_client)
+        self.agent_registry = AgentRegistry(self.project_client)
         
         # Create specialized agents
         await self._create_agents()
+    
+    async def close(self):
+        """Persist caches before shutdown."""
+        await asyncio.to_thread(self.triage_cache.save)
         
-    async def _create_agents(self):
-        """Create the specialized customer support agents."""
-        
-        # Triage Agent - Classifies customer intent
-        self.agents["triage"] = await self.project_client.agents.create_agent(
-            model="gpt-4o",
-            name="Triage Agent",
-            instructions="""You are a customer support triage agent for CleanHome, a consumer goods company selling cleaning and personal care products.
+    def _agent_definitions(self) -> dict[str, dict]:
+        """Definitions of the specialized customer support agents."""
+        return {
+            # Triage Agent - Classifies customer intent
+            "triage": {
+                "model": "gpt-4o",
+                "name": "Triage Agent",
+                "instructions": """You are a customer support triage agent for CleanHome, a consumer goods company selling cleaning and personal care products.
 
 Your role is to:
 1. Greet customers warmly
@@ -80,34 +136,13 @@ Classify inquiries into:
 Respond with a JSON object: {"classification": "PRODUCT|ORDER|GENERAL", "summary": "brief summary of the request"}
 
 Be friendly and professional. If unclear, ask clarifying questions.""",
-        )
-        
-        # Product Expert Agent - RAG-powered product knowledge
-        product_tools = ToolSet()
-        product_tools.add(FunctionTool(
-            name="search_products",
-            description="Search the product catalog for information about CleanHome products",
-            parameters={
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query for products"
-                    },
-                    "category": {
-                        "type": "string",
-                        "description": "Product category filter",
-                        "enum": ["shampoo", "detergent", "soap", "cleaner", "all"]
-                    }
-                },
-                "required": ["query"]
-            }
-        ))
-        
-        self.agents["product"] = await self.project_client.agents.create_agent(
-            model="gpt-4o",
-            name="Product Expert",
-            instructions="""You are a Product Expert for CleanHome, specializing in cleaning and personal care products.
+                "tools": [],
+            },
+            # Product Expert Agent - RAG-powered product knowledge
+            "product": {
+                "model": "gpt-4o",
+                "name": "Product Expert",
+                "instructions": """You are a Product Expert for CleanHome, specializing in cleaning and personal care products.
 
 You have deep knowledge of:
 - Shampoos and hair care products
@@ -118,71 +153,43 @@ You have deep knowledge of:
 
 When helping customers:
 1. Use the search_products tool to find accurate product information
-2. Explain ingredients and their benefits
+2. Explain ingredients and their benefits (search with include_ingredients to get ingredient lists)
 3. Provide usage instructions and tips
 4. Make personalized recommendations based on customer needs
 5. Compare products when asked
 
 Always be helpful, accurate, and safety-conscious. If a product isn't suitable for someone's needs, honestly recommend alternatives.""",
-            tools=product_tools,
-        )
-        
-        # Order Support Agent - Order management with tools
-        order_tools = ToolSet()
-        order_tools.add(FunctionTool(
-            name="lookup_order",
-            description="Look up order details by order ID or customer email",
-            parameters={
-                "type": "object",
-                "properties": {
-                    "order_id": {
-                        "type": "string",
-                        "description": "Order ID to look up"
-                    },
-                    "email": {
-                        "type": "string",
-                        "description": "Customer email to find orders"
-                    }
-                }
-            }
-        ))
-        order_tools.add(FunctionTool(
-            name="track_delivery",
-            description="Get delivery tracking information for an order",
-            parameters={
-                "type": "object",
-                "properties": {
-                    "order_id": {
-                        "type": "string",
-                        "description": "Order ID to track"
-                    }
-                },
-                "required": ["order_id"]
-            }
-        ))
-        order_tools.add(FunctionTool(
-            name="initiate_return",
-            description="Start a return request for an order item",
-            parameters={
-                "type": "object",
-                "properties": {
-                    "order_id": {
-                        "type": "string",
-                        "description": "Order ID for the return"
-                    },
-                    "reason": {
-                        "type": "string",
-                        "description": "Reason for return"
+                "tools": [
+                    {
+                        "name": "search_products",
+                        "description": "Search the product catalog for information about CleanHome products",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "query": {
+                                    "type": "string",
+                                    "description": "Search query for products"
+                                },
+                                "category": {
+                                    "type": "string",
+                                    "description": "Product category filter",
+                                    "enum": ["shampoo", "detergent", "soap", "cleaner", "all"]
+                                },
+                                "include_ingredients": {
+                                    "type": "boolean",
+                                    "description": "Include full ingredient lists, only when the customer asks about ingredients"
+                                }
+                            },
+                            "required": ["query"]
+                        }
                     }
-                },
-                "required": ["order_id", "reason"]
-            }
-        ))
-        
-        self.agents["order"] = await self.project_client.agents.create_agent(
-            model="gpt-4o",
-            name="Order Support Specialist",
-            instructions="""You are an Order Support Specialist for CleanHome.
+                ],
+            },
+            # Order Support Agent - Order management with tools
+            "order": {
+                "model": "gpt-4o",
+                "name": "Order Support Specialist",
+                "instructions": """You are an Order Support Specialist for CleanHome.
 
 You help customers with:
 - Order status and tracking
@@ -198,168 +205,363 @@ Use your tools to:
 
 Be empathetic and solution-oriented. Always confirm order details before making changes.
 If you can't resolve an issue, explain the escalation process.""",
-            tools=order_tools,
-        )
+                "tools": [
+                    {
+                        "name": "lookup_order",
+                        "description": "Look up order details by order ID or customer email",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "order_id": {
+                                    "type": "string",
+                                    "description": "Order ID to look up"
+                                },
+                                "email": {
+                                    "type": "string",
+                                    "description": "Customer email to find orders"
+                                }
+                            }
+                        }
+                    },
+                    {
+                        "name": "track_delivery",
+                        "description": "Get delivery tracking information for an order",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "order_id": {
+                                    "type": "string",
+                                    "description": "Order ID to track"
+                                }
+                            },
+                            "required": ["order_id"]
+                        }
+                    },
+                    {
+                        "name": "initiate_return",
+                        "description": "Start a return request for an order item",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "order_id": {
+                                    "type": "string",
+                                    "description": "Order ID for the return"
+                                },
+                                "reason": {
+                                    "type": "string",
+                                    "description": "Reason for return"
+                                }
+                            },
+                            "required": ["order_id", "reason"]
+                        }
+                    }
+                ],
+            },
+        }
+    
+    async def _create_agents(self):
+        """Reuse or create the specialized customer support agents."""
+        self.agents = await self.agent_registry.ensure_agents(self._agent_definitions())
+        logger.info("All agents ready")
         
-        logger.info("All agents created successfully")
+    async def begin_turn(self, session_id: str, message: str) -> Turn:
+        """Start a turn of a session under its concurrency policy.
         
+        Raises SessionBusyError if the session is busy and the policy
+        rejects the turn or the wait for it times out.
+        """
+        return await self.turn_gate.begin(session_id, message)
+    
     async def process_message(
         self,
         session_id: str,
-        message: str
+        message: str,
+        turn: Optional[Turn] = None
     ) -> dict:
-        """Process a customer message through the appropriate agent."""
+        """Process a customer message through the appropriate agent.
         
-        # Store the user message
-        await self.cosmos_service.add_message(
-            session_id=session_id,
-            role="user",
-            content=message
-        )
-        
-        thought_process = []
+        Turns of a session run one at a time; pass a turn started with
+        begin_turn, or one is started here.
+        """
+        turn = turn or await self.begin_turn(session_id, message)
+        if turn.coalesced:
+            return await turn.result()
         
-        # Step 1: Triage the message
-        thought_process.append({
-            "agent": "Triage Agent",
-            "action": "Classifying customer intent..."
-        })
-        
-        classification = await self._triage_message(session_id, message)
-        thought_process.append({
-            "agent": "Triage Agent",
-            "action": f"Classified as: {classification['classification']}",
-            "details": classification.get('summary', '')
-        })
-        
-        # Step 2: Route to appropriate agent
-        agent_type = classification.get("classification", "GENERAL").upper()
+        try:
+            result = await self._process_turn(session_id, message)
+            turn.complete(result)
+            return result
+        except BaseException as e:
+            turn.fail(e)
+            raise
+        finally:
+            await turn.release()
+    
+    async def _process_turn(self, session_id: str, message: str) -> dict:
+        context = self._start_prefetch(message)
         
-        if agent_type == "PRODUCT":
-            active_agent = "product"
+        try:
+            # Store the user message
+            await self.cosmos_service.add_message(
+                session_id=session_id,
+                role="user",
+                content=message
+            )
+            
+            thought_process = []
+            
+            # Step 1: Triage the message
             thought_process.append({
-                "agent": "Product Expert",
-                "action": "Searching product knowledge base..."
+                "agent": "Triage Agent",
+                "action": "Classifying customer intent..."
             })
-        elif agent_type == "ORDER":
-            active_agent = "order"
+            
+            # The session state and history are read once for the turn
+            state, history = await self._load_turn(session_id)
+            classification = await self._route_message(session_id, message, state, history)
             thought_process.append({
-                "agent": "Order Support Specialist",
-                "action": "Looking up order information..."
+                "agent": "Triage Agent",
+                "action": f"Classified as: {classification['classification']}",
+                "details": classification.get('summary', '')
             })
-        else:
-            active_agent = "triage"
+            
+            # Step 2: Route to appropriate agent
+            agent_type = classification.get("classification", "GENERAL").upper()
+            
+            if agent_type == "PRODUCT":
+                active_agent = "product"
+                thought_process.append({
+                    "agent": "Product Expert",
+                    "action": "Searching product knowledge base..."
+                })
+            elif agent_type == "ORDER":
+                active_agent = "order"
+                thought_process.append({
+                    "agent": "Order Support Specialist",
+                    "action": "Looking up order information..."
+                })
+            else:
+                active_agent = "triage"
+                thought_process.append({
+                    "agent": "Triage Agent",
+                    "action": "Handling general inquiry..."
+                })
+            
+            # Step 3: Get response from the selected agent
+            response = await self._get_agent_response(
+                session_id=session_id,
+                message=message,
+                agent_type=active_agent,
+                classification=classification,
+                state=state,
+                history=history,
+                context=context
+            )
+            
             thought_process.append({
-                "agent": "Triage Agent",
-                "action": "Handling general inquiry..."
+                "agent": self._get_agent_display_name(active_agent),
+                "action": "Generated response"
             })
-        
-        # Step 3: Get response from the selected agent
-        response = await self._get_agent_response(
-            session_id=session_id,
-            message=message,
-            agent_type=active_agent,
-            classification=classification
-        )
-        
-        thought_process.append({
-            "agent": self._get_agent_display_name(active_agent),
-            "action": "Generated response"
-        })
-        
-        # Store the assistant response
-        await self.cosmos_service.add_message(
-            session_id=session_id,
-            role="assistant",
-            content=response,
-            agent=active_agent
-        )
-        
-        return {
-            "response": response,
-            "agent": self._get_agent_display_name(active_agent),
-            "thought_process": thought_process
-        }
+            
+            # Store the assistant response
+            await self.cosmos_service.add_message(
+                session_id=session_id,
+                role="assistant",
+                content=response,
+                agent=active_agent
+            )
+            
+            return {
+                "response": response,
+                "agent": self._get_agent_display_name(active_agent),
+                "thought_process": thought_process
+            }
+        finally:
+            if context:
+                context.close()
     
     async def process_message_stream(
         self,
         session_id: str,
-        message: str
+        message: str,
+        turn: Optional[Turn] = None
     ) -> AsyncGenerator[str, None]:
-        """Stream the response for real-time updates."""
+        """Stream the response for real-time updates.
+        
+        A turn coalesced into a running one streams that turn's response
+        as a single content event.
+        """
+        turn = turn or await self.begin_turn(session_id, message)
+        if turn.coalesced:
+            result = await turn.result()
+            yield json.dumps({"type": "agent_switch", "agent": result["agent"]})
+            yield json.dumps({"type": "content", "content": result["response"], "agent": result["agent"]})
+            yield json.dumps({"type": "done"})
+            return
         
-        # Store user message
-        await self.cosmos_service.add_message(
-            session_id=session_id,
-            role="user",
-            content=message
-        )
+        try:
+            async for chunk in self._process_turn_stream(session_id, message, turn):
+                yield chunk
+        except BaseException as e:
+            turn.fail(e)
+            raise
+        finally:
+            await turn.release()
+    
+    async def _process_turn_stream(
+        self,
+        session_id: str,
+        message: str,
+        turn: Turn
+    ) -> AsyncGenerator[str, None]:
+        started = time.perf_counter()
+        context = self._start_prefetch(message)
         
-        # Emit triage start
-        yield json.dumps({
-            "type": "thought",
-            "agent": "Triage Agent",
-            "content": "Analyzing your request..."
-        })
-        
-        # Triage
-        classification = await self._triage_message(session_id, message)
-        agent_type = classification.get("classification", "GENERAL").upper()
-        
-        yield json.dumps({
-            "type": "thought",
-            "agent": "Triage Agent",
-            "content": f"Routing to {self._get_agent_display_name(agent_type.lower())}..."
-        })
-        
-        # Select agent
-        if agent_type == "PRODUCT":
-            active_agent = "product"
-        elif agent_type == "ORDER":
-            active_agent = "order"
-        else:
-            active_agent = "triage"
-        
-        yield json.dumps({
-            "type": "agent_switch",
-            "agent": self._get_agent_display_name(active_agent)
-        })
-        
-        # Stream response
-        response_text = ""
-        async for chunk in self._stream_agent_response(
-            session_id=session_id,
-            message=message,
-            agent_type=active_agent,
-            classification=classification
-        ):
-            response_text += chunk
+        try:
+            # Store user message
+            await self.cosmos_service.add_message(
+                session_id=session_id,
+                role="user",
+                content=message
+            )
+            
+            # Emit triage start
             yield json.dumps({
-                "type": "content",
-                "agent": self._get_agent_display_name(active_agent),
-                "content": chunk
+                "type": "thought",
+                "agent": "Triage Agent",
+                "content": "Analyzing your request..."
             })
-        
-        # Store response
-        await self.cosmos_service.add_message(
-            session_id=session_id,
-            role="assistant",
-            content=response_text,
-            agent=active_agent
+            
+            # Triage; the session state and history are read once for the turn
+            state, history = await self._load_turn(session_id)
+            classification = await self._route_message(session_id, message, state, history)
+            agent_type = classification.get("classification", "GENERAL").upper()
+            
+            yield json.dumps({
+                "type": "thought",
+                "agent": "Triage Agent",
+                "content": f"Routing to {self._get_agent_display_name(agent_type.lower())}..."
+            })
+            
+            # Select agent
+            if agent_type == "PRODUCT":
+                active_agent = "product"
+            elif agent_type == "ORDER":
+                active_agent = "order"
+            else:
+                active_agent = "triage"
+            
+            yield json.dumps({
+                "type": "agent_switch",
+                "agent": self._get_agent_display_name(active_agent)
+            })
+            
+            # Stream response
+            response_text = ""
+            first_token = True
+            async for event in self._stream_agent_response(
+                session_id=session_id,
+                message=message,
+                agent_type=active_agent,
+                classification=classification,
+                state=state,
+                history=history,
+                context=context
+            ):
+                event["agent"] = self._get_agent_display_name(active_agent)
+                if event["type"] == "content":
+                    if first_token:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                        self.time_to_first_token.record(ttft_ms)
+                        logger.info(f"Time to first token: {ttft_ms:.0f}ms ({active_agent})")
+                        first_token = False
+                    response_text += event["content"]
+                yield json.dumps(event)
+            
+            # Store response
+            await self.cosmos_service.add_message(
+                session_id=session_id,
+                role="assistant",
+                content=response_text,
+                agent=active_agent
+            )
+            turn.complete({
+                "response": response_text,
+                "agent": self._get_agent_display_name(active_agent)
+            })
+            
+            yield json.dumps({"type": "done"})
+        finally:
+            if context:
+                context.close()
+    
+    async def _load_turn(self, session_id: str) -> tuple[dict, list]:
+        """Read the session state and history the steps of a turn share."""
+        state, history = await asyncio.gather(
+            self.cosmos_service.get_session_state(session_id),
+            self.cosmos_service.get_conversation_history(session_id)
         )
-        
-        yield json.dumps({"type": "done"})
+        return state, history
+    
+    async def _route_message(self, session_id: str, message: str, state: dict, history: list) -> dict:
+        """Classify the message, keeping follow-ups with the active specialist.
+        
+        The route is only persisted when the message was triaged, so sticky
+        follow-ups cost no session write.
+        """
+        classification = self.router.get_route(state, history, message)
+        if classification is None:
+            classification = await self._triage_message(session_id, message)
+            agent_type = classification.get("classification", "GENERAL").lower()
+            await self.router.record(
+                session_id,
+                state,
+                history,
+                classification,
+                agent_type if agent_type in ("product", "order") else "triage"
+            )
+        return classification
     
     async def _triage_message(self, session_id: str, message: str) -> dict:
-        """Use triage agent to classify the message."""
+        """Classify the message, using the triage agent only when needed.
+        
+        Cached classifications of equivalent messages are reused, then the
+        local intent classifier answers when it is calibrated and confident
+        enough; otherwise the triage agent is run and its output is cached
+        and logged so the classifier can be retrained on it.
+        """
+        classifier = self.intent_classifier or KeywordIntentClassifier()
+        prediction = classifier.predict(message)
+        
         if not self.project_client:
             # Mock response for development
-            if any(word in message.lower() for word in ["order", "delivery", "track", "return", "refund"]):
-                return {"classification": "ORDER", "summary": "Order-related inquiry"}
-            elif any(word in message.lower() for word in ["product", "ingredient", "recommend", "shampoo", "detergent", "soap"]):
-                return {"classification": "PRODUCT", "summary": "Product inquiry"}
-            return {"classification": "GENERAL", "summary": "General inquiry"}
+            return prediction
+        
+        cached = self.triage_cache.get(message)
+        if cached:
+            return cached
         
+        if classifier.calibrated and prediction["confidence"] >= self.intent_confidence_threshold:
+            self.triage_fast_path += 1
+            return prediction
+        
+        started = time.perf_counter()
+        classification = await self._run_triage_agent(message)
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.triage_latency.record(latency_ms)
+        
+        label = str(classification.get("classification", "GENERAL")).upper()
+        if label in SUMMARIES:
+            # Cache the route only; the agent's summary is message specific
+            self.triage_cache.set(message, {"classification": label, "summary": SUMMARIES[label]})
+        
+        if self.triage_log_path:
+            await asyncio.to_thread(self._log_triage, message, classification, latency_ms, prediction)
+        
+        return classification
+    
+    async def _run_triage_agent(self, message: str) -> dict:
+        """Use triage agent to classify the message."""
         # Use actual agent
         thread = await self.project_client.agents.create_thread()
         await self.project_client.agents.create_message(
@@ -368,18 +570,11 @@ If you can't resolve an issue, explain the escalation process.""",
             content=message
         )
         
-        run = await self.project_client.agents.create_run(
+        await self.run_waiter.run_to_completion(
             thread_id=thread.id,
             agent_id=self.agents["triage"].id
         )
         
-        # Wait for completion
-        while run.status in ["queued", "in_progress"]:
-            run = await self.project_client.agents.get_run(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-        
         messages = await self.project_client.agents.list_messages(thread_id=thread.id)
         response = messages.data[0].content[0].text.value
         
@@ -388,12 +583,35 @@ If you can't resolve an issue, explain the escalation process.""",
         except json.JSONDecodeError:
             return {"classification": "GENERAL", "summary": response}
     
+    def _log_triage(
+        self,
+        message: str,
+        classification: dict,
+        latency_ms: float,
+        prediction: dict
+    ):
+        """Append a triage agent output to the training log."""
+        record = {
+            "message": message,
+            "classification": str(classification.get("classification", "GENERAL")).upper(),
+            "latency_ms": round(latency_ms, 1),
+            "local_prediction": prediction,
+        }
+        try:
+            with open(self.triage_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to log triage output: {e}")
+    
     async def _get_agent_response(
         self,
         session_id: str,
         message: str,
         agent_type: str,
-        classification: dict
+        classification: dict,
+        state: dict,
+        history: list,
+        context: Optional[RequestContext] = None
     ) -> str:
         """Get response from the selected agent."""
         if not self.project_client:
@@ -402,108 +620,316 @@ If you can't resolve an issue, explain the escalation process.""",
         
         agent = self.agents.get(agent_type, self.agents["triage"])
         
-        # Get conversation history
-        history = await self.cosmos_service.get_conversation_history(session_id)
-        
-        # Create thread with history
-        thread = await self.project_client.agents.create_thread()
-        
-        for msg in history[-5:]:  # Last 5 messages for context
-            await self.project_client.agents.create_message(
-                thread_id=thread.id,
-                role=MessageRole.USER if msg["role"] == "user" else MessageRole.ASSISTANT,
-                content=msg["content"]
-            )
-        
-        # Add current message
-        await self.project_client.agents.create_message(
-            thread_id=thread.id,
-            role=MessageRole.USER,
-            content=message
-        )
+        thread_id, run_options = await self._prepare_run(session_id, agent_type, message, state, history)
         
         # Run agent
         run = await self.project_client.agents.create_run(
-            thread_id=thread.id,
-            agent_id=agent.id
+            thread_id=thread_id,
+            agent_id=agent.id,
+            **run_options
         )
         
-        # Handle tool calls if needed
-        while run.status in ["queued", "in_progress", "requires_action"]:
-            if run.status == "requires_action":
-                tool_outputs = await self._handle_tool_calls(
-                    run.required_action.submit_tool_outputs.tool_calls
-                )
-                run = await self.project_client.agents.submit_tool_outputs(
-                    thread_id=thread.id,
-                    run_id=run.id,
-                    tool_outputs=tool_outputs
-                )
-            else:
-                run = await self.project_client.agents.get_run(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
+        # Wait for completion, handling tool calls as they are requested;
+        # one deadline bounds the run however many tool calls it makes
+        deadline = self.run_waiter.deadline()
+        run = await self.run_waiter.wait(thread_id=thread_id, run=run, deadline=deadline)
+        while run.status == "requires_action":
+            tool_outputs = await self._handle_tool_calls(
+                run.required_action.submit_tool_outputs.tool_calls,
+                context
+            )
+            run = await self.project_client.agents.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=tool_outputs
+            )
+            run = await self.run_waiter.wait(
+                thread_id=thread_id, run=run, resumed=True, deadline=deadline
+            )
         
-        messages = await self.project_client.agents.list_messages(thread_id=thread.id)
+        messages = await self.project_client.agents.list_messages(thread_id=thread_id)
         return messages.data[0].content[0].text.value
     
-    async def _stream_agent_response(
+    async def _prepare_run(
         self,
         session_id: str,
-        message: str,
         agent_type: str,
-        classification: dict
-    ) -> AsyncGenerator[str, None]:
-        """Stream response from agent."""
-        # For now, yield the full response in chunks
-        # In production, use streaming API
-        response = await self._get_agent_response(
-            session_id, message, agent_type, classification
+        message: str,
+        state: dict,
+        history: list
+    ) -> tuple[str, dict]:
+        """Get the thread and token-budgeted run options for an agent turn.
+        
+        The run only sees the newest thread messages that fit the agent's
+        token budget; older turns and pinned entities are passed as
+        additional instructions. state and history are the turn's reads
+        of the session.
+        """
+        entry = await self.thread_registry.get(session_id, agent_type, state)
+        if entry and self.thread_registry.is_expired(entry):
+            self._discard_threads([entry["threadId"]])
+            entry = None
+        context_window = await self.context_builder.build(
+            session_id, agent_type, history, new_thread=entry is None, state=state
+        )
+        logger.debug(f"Prompt context for {agent_type}: ~{context_window['prompt_tokens']} tokens")
+        
+        thread_id = await self._get_session_thread(
+            session_id, agent_type, message, entry, context_window["messages"]
         )
         
-        # Simulate streaming
-        words = response.split()
-        for i in range(0, len(words), 3):
-            chunk = " ".join(words[i:i+3]) + " "
-            yield chunk
+        run_options = {
+            "truncation_strategy": TruncationObject(
+                type="last_messages",
+                last_messages=max(len(context_window["messages"]), 1)
+            )
+        }
+        if context_window["instructions"]:
+            run_options["additional_instructions"] = context_window["instructions"]
+        return thread_id, run_options
     
-    async def _handle_tool_calls(self, tool_calls) -> list:
-        """Handle tool calls from agents."""
-        outputs = []
+    async def _get_session_thread(
+        self,
+        session_id: str,
+        agent_type: str,
+        message: str,
+        entry: Optional[dict],
+        recent_messages: list
+    ) -> str:
+        """Get the session's thread for an agent with the new message appended.
         
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            arguments = json.loads(tool_call.function.arguments)
-            
-            if function_name == "search_products":
-                result = await self.search_service.search_products(
-                    query=arguments.get("query", ""),
-                    category=arguments.get("category")
-                )
-            elif function_name == "lookup_order":
-                result = await self.cosmos_service.lookup_order(
-                    order_id=arguments.get("order_id"),
-                    email=arguments.get("email")
-                )
-            elif function_name == "track_delivery":
-                result = await self.cosmos_service.track_delivery(
-                    order_id=arguments["order_id"]
-                )
-            elif function_name == "initiate_return":
-                result = await self.cosmos_service.initiate_return(
-                    order_id=arguments["order_id"],
-                    reason=arguments["reason"]
-                )
-            else:
-                result = {"error": f"Unknown function: {function_name}"}
+        An existing thread (its registry entry, unless expired) only
+        receives the new user message. Otherwise a new thread is created,
+        seeded with the recent messages in the same call.
+        """
+        self._schedule_thread_sweep()
+        
+        if entry:
+            await self.project_client.agents.create_message(
+                thread_id=entry["threadId"],
+                role=MessageRole.USER,
+                content=message
+            )
+            await self.thread_registry.touch(session_id, agent_type, entry)
+            return entry["threadId"]
+        
+        # The current message is already stored last in the recent messages
+        seed = [
+            ThreadMessageOptions(
+                role=MessageRole.USER if msg["role"] == "user" else MessageRole.ASSISTANT,
+                content=msg["content"]
+            )
+            for msg in recent_messages[:-1]
+        ]
+        seed.append(ThreadMessageOptions(role=MessageRole.USER, content=message))
+        
+        thread = await self.project_client.agents.create_thread(messages=seed)
+        await self.thread_registry.put(session_id, agent_type, thread.id)
+        return thread.id
+    
+    def _spawn(self, coro):
+        """Run a coroutine in the background, keeping a reference to its task."""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    def _discard_threads(self, thread_ids: list[str]):
+        """Delete expired threads in the background."""
+        for thread_id in thread_ids:
+            self._spawn(self._delete_thread(thread_id))
+    
+    def _schedule_thread_sweep(self):
+        """Start an idle thread sweep unless one is running or ran recently."""
+        now = time.monotonic()
+        if self._thread_sweep_running or now - self._last_thread_sweep < self.thread_sweep_interval:
+            return
+        self._last_thread_sweep = now
+        self._thread_sweep_running = True
+        self._spawn(self._release_idle_threads())
+    
+    async def _release_idle_threads(self):
+        """Delete the threads of the registry that have been idle too long."""
+        try:
+            for thread_id in await self.thread_registry.evict_idle():
+                await self._delete_thread(thread_id)
+        finally:
+            self._thread_sweep_running = False
+    
+    async def _delete_thread(self, thread_id: str):
+        """Delete a thread, ignoring failures."""
+        try:
+            await self.project_client.agents.delete_thread(thread_id)
+        except Exception as e:
+            logger.warning(f"Failed to delete thread {thread_id}: {e}")
+    
+    async def _stream_agent_response(
+        self,
+        session_id: str,
+        message: str,
+        agent_type: str,
+        classification: dict,
+        state: dict,
+        history: list,
+        context: Optional[RequestContext] = None
+    ) -> AsyncGenerator[dict, None]:
+        """Stream response events from agent.
+        
+        Yields content deltas as they arrive from the streaming run API,
+        interleaved with tool_call events whenever the run requires action.
+        """
+        if not self.project_client or not hasattr(self.project_client.agents, "create_stream"):
+            response = await self._get_agent_response(
+                session_id, message, agent_type, classification, state, history, context
+            )
             
-            outputs.append({
-                "tool_call_id": tool_call.id,
-                "output": json.dumps(result)
-            })
+            # Simulate streaming
+            words = response.split()
+            for i in range(0, len(words), 3):
+                chunk = " ".join(words[i:i+3]) + " "
+                yield {"type": "content", "content": chunk}
+            return
         
-        return outputs
+        agent = self.agents.get(agent_type, self.agents["triage"])
+        thread_id, run_options = await self._prepare_run(session_id, agent_type, message, state, history)
+        
+        async with asyncio.timeout(self.run_waiter.max_wait):
+            async with await self.project_client.agents.create_stream(
+                thread_id=thread_id,
+                agent_id=agent.id,
+                **run_options
+            ) as stream:
+                async for _, event_data, _ in stream:
+                    if isinstance(event_data, MessageDeltaChunk):
+                        if event_data.text:
+                            yield {"type": "content", "content": event_data.text}
+                    elif isinstance(event_data, ThreadRun):
+                        if event_data.status == "requires_action":
+                            tool_calls = event_data.required_action.submit_tool_outputs.tool_calls
+                            for tool_call in tool_calls:
+                                try:
+                                    tool_input = json.loads(tool_call.function.arguments or "{}")
+                                except json.JSONDecodeError:
+                                    # The tool output is an error envelope the agent can retry on
+                                    tool_input = tool_call.function.arguments
+                                yield {
+                                    "type": "tool_call",
+                                    "tool": tool_call.function.name,
+                                    "input": tool_input
+                                }
+                            tool_outputs = await self._handle_tool_calls(tool_calls, context)
+                            # Continue consuming the same stream with the resumed run
+                            await self.project_client.agents.submit_tool_outputs_to_stream(
+                                thread_id=thread_id,
+                                run_id=event_data.id,
+                                tool_outputs=tool_outputs,
+                                event_handler=stream
+                            )
+                        elif event_data.status in ("failed", "cancelled", "expired"):
+                            raise RuntimeError(
+                                f"Agent run {event_data.id} ended with status {event_data.status}"
+                            )
+    
+    def _register_tools(self):
+        """Register the handlers for the agents' function tools."""
+        self.tools.register("search_products", self._search_products)
+        self.tools.register("lookup_order", self._lookup_order)
+        self.tools.register("track_delivery", self._track_delivery)
+        self.tools.register("initiate_return", self._initiate_return)
+    
+    async def _handle_tool_calls(
+        self,
+        tool_calls,
+        context: Optional[RequestContext] = None
+    ) -> list:
+        """Handle tool calls from agents concurrently."""
+        return await self.tools.dispatch(tool_calls, context)
+    
+    def _start_prefetch(self, message: str) -> Optional[RequestContext]:
+        """Start speculative lookups for entities mentioned in the message."""
+        if not self.project_client:
+            return None
+        context = start_prefetch(message, self.cosmos_service, self.search_service)
+        self.prefetch_started += context.size
+        return context
+    
+    async def _prefetched(self, context: Optional[RequestContext], key: tuple) -> tuple:
+        """Read a prefetched result from the request context."""
+        if not context:
+            return False, None
+        found, result = await context.get(key)
+        if found:
+            self.prefetch_hits += 1
+        return found, result
+    
+    async def _prefetched_order(self, context: Optional[RequestContext], order_id: str):
+        """Get a prefetched order, or None if it was not prefetched."""
+        _, order = await self._prefetched(context, ("order", order_id.upper()))
+        return order
+    
+    async def _search_products(self, arguments: dict, context: Optional[RequestContext]):
+        query = arguments.get("query", "")
+        category = arguments.get("category")
+        fields = self.product_fields
+        if fields is not None and arguments.get("include_ingredients") and "ingredients" not in fields:
+            fields = fields + ["ingredients"]
+        found, result = await self._prefetched(context, search_key(query, category))
+        if found:
+            return project_all(result, fields)
+        return await self.search_service.search_products(
+            query=query,
+            category=category,
+            select=fields
+        )
+    
+    async def _lookup_order(self, arguments: dict, context: Optional[RequestContext]):
+        order_id = arguments.get("order_id")
+        email = arguments.get("email")
+        if order_id:
+            order = await self._prefetched_order(context, order_id)
+            if order:
+                return {"found": True, "order": project(order, self.order_fields)}
+        elif email:
+            found, result = await self._prefetched(context, ("orders_by_email", email.lower()))
+            if found and "orders" in result:
+                return {**result, "orders": project_all(result["orders"], self.order_fields)}
+        return await self.cosmos_service.lookup_order(
+            order_id=order_id,
+            email=email,
+            fields=self.order_fields
+        )
+    
+    async def _track_delivery(self, arguments: dict, context: Optional[RequestContext]):
+        return await self.cosmos_service.track_delivery(
+            order_id=arguments["order_id"],
+            order=await self._prefetched_order(context, arguments["order_id"])
+        )
+    
+    async def _initiate_return(self, arguments: dict, context: Optional[RequestContext]):
+        return await self.cosmos_service.initiate_return(
+            order_id=arguments["order_id"],
+            reason=arguments["reason"],
+            order=await self._prefetched_order(context, arguments["order_id"])
+        )
+    
+    def get_metrics(self) -> dict:
+        """Get orchestrator performance counters."""
+        return {
+            "runs": self.run_waiter.get_metrics() if self.run_waiter else {},
+            "agents": self.agent_registry.get_metrics() if self.agent_registry else {},
+            "time_to_first_token": self.time_to_first_token.get_metrics(),
+            "triage": {
+                "fast_path": self.triage_fast_path,
+                "agent_runs": self.triage_latency.get_metrics(),
+                "cache": self.triage_cache.get_metrics(),
+            },
+            "routing": self.router.get_metrics(),
+            "tools": self.tools.get_metrics(),
+            "prefetch": {
+                "started": self.prefetch_started,
+                "hits": self.prefetch_hits,
+            },
+            "sessions": self.turn_gate.get_metrics(),
+        }
     
     def _get_agent_display_name(self, agent_type: str) -> str:
         """Get display name for agent type."""
@@ -0,0 +1,98 @@
+"""Speculative prefetch of order and product data for a single request.
+
+Cheap regexes spot order IDs, email addresses and product names in the
+incoming message, and the matching Cosmos DB and Azure AI Search lookups
+are started while the message is still being triaged. Tool handlers read
+the request context first, so a later lookup_order or search_products call
+finds its answer already in memory.
+"""
+
+import re
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+from services.cosmos_service import CosmosService
+from services.search_service import SearchService
+
+logger = logging.getLogger(__name__)
+
+ORDER_ID_PATTERN = re.compile(r"\bORD-\d+\b", re.IGNORECASE)
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+# Prefetching is speculative; cap the fan-out per message
+MAX_PREFETCHES = 4
+
+
+class RequestContext:
+    """Holds in-flight prefetches for one request, keyed by lookup."""
+
+    def __init__(self):
+        self._tasks: dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+
+    def prefetch(self, key: tuple, lookup: Awaitable[Any]):
+        """Start a lookup in the background unless it is already running."""
+        if key in self._tasks or len(self._tasks) >= MAX_PREFETCHES:
+            lookup.close()
+            return
+        task = asyncio.create_task(lookup)
+        # Retrieve failures of unused prefetches so they are not reported
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[key] = task
+
+    async def get(self, key: tuple) -> tuple[bool, Any]:
+        """Await a prefetched lookup, returning (found, result)."""
+        task = self._tasks.get(key)
+        if task is None:
+            return False, None
+        try:
+            # Shielded so a tool call timing out does not cancel the prefetch
+            # for later readers of the same key
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                # Cancelled by close(), not this caller: look it up live
+                return False, None
+            raise
+        except Exception as e:
+            logger.warning(f"Prefetch {key} failed: {e}")
+            return False, None
+        self.hits += 1
+        return True, result
+
+    def close(self):
+        """Cancel prefetches that were never needed."""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    @property
+    def size(self) -> int:
+        return len(self._tasks)
+
+
+def start_prefetch(
+    message: str,
+    cosmos_service: CosmosService,
+    search_service: SearchService
+) -> RequestContext:
+    """Detect entities in a message and start their lookups."""
+    context = RequestContext()
+
+    for order_id in ORDER_ID_PATTERN.findall(message):
+        order_id = order_id.upper()
+        context.prefetch(("order", order_id), cosmos_service.get_order(order_id))
+
+    for email in EMAIL_PATTERN.findall(message):
+        context.prefetch(("orders_by_email", email.lower()), cosmos_service.lookup_order(email=email))
+
+    for name in search_service.match_product_names(message):
+        context.prefetch(search_key(name, None), search_service.search_products(query=name))
+
+    return context
+
+
+def search_key(query: str, category: Optional[str]) -> tuple:
+    """Context key for a search_products call."""
+    return ("search", query.strip().lower(), None if category in (None, "all") else category)
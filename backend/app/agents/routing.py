@@ -0,0 +1,105 @@
+"""Sticky session routing for follow-up turns.
+
+Once a session has been routed to a specialist, follow-up turns such as
+"and when will it arrive?" stay with that specialist without another
+triage. The route is persisted with the session when a message is triaged,
+and re-triaged when a cheap topic-shift detector fires or after a number
+of sticky turns, counted from the conversation history.
+"""
+
+import os
+import re
+import logging
+from typing import Optional
+
+from agents.intent_classifier import IntentClassifier
+from services.cosmos_service import CosmosService
+
+logger = logging.getLogger(__name__)
+
+# Only specialist routes are sticky; general inquiries are always re-triaged
+STICKY_CLASSIFICATIONS = ("PRODUCT", "ORDER")
+
+TOPIC_SHIFT_PATTERN = re.compile(
+    r"\b(another|different|new|unrelated|separate) (question|topic|issue|thing)\b"
+    r"|\bsomething else\b|\bby the way\b|\bbtw\b|\bchange of subject\b",
+    re.IGNORECASE
+)
+
+
+class StickyRouter:
+    """Keeps follow-up turns with the session's active specialist."""
+
+    def __init__(self, cosmos_service: CosmosService, classifier: IntentClassifier):
+        self.cosmos_service = cosmos_service
+        self.classifier = classifier
+        self.max_turns = int(os.getenv("STICKY_ROUTING_MAX_TURNS", "5"))
+        self.shift_confidence = float(os.getenv("STICKY_ROUTING_SHIFT_CONFIDENCE", "0.7"))
+        self.sticky_turns = 0
+        self.topic_shifts = 0
+
+    def get_route(self, state: dict, history: list, message: str) -> Optional[dict]:
+        """Get the sticky classification, or None if the message needs triage.
+
+        state and history are the turn's reads of the session, the history
+        ending with the message. Sticky turns are counted from the history,
+        so following a route needs no session write.
+        """
+        if self.max_turns <= 0:
+            return None
+
+        routing = state.get("routing")
+        if not routing or routing["classification"] not in STICKY_CLASSIFICATIONS:
+            return None
+        if "triagedAt" not in routing:
+            # Routes recorded with a turn counter are re-triaged once
+            return None
+        turns = sum(1 for m in history[routing["triagedAt"]:-1] if m["role"] == "user")
+        if turns >= self.max_turns:
+            return None
+        if self.is_topic_shift(routing["classification"], message):
+            self.topic_shifts += 1
+            return None
+
+        self.sticky_turns += 1
+        return {
+            "classification": routing["classification"],
+            "summary": "Follow-up to the previous inquiry",
+            "sticky": True,
+            # Turns since the last full triage, including this one
+            "turns": turns + 1,
+        }
+
+    def is_topic_shift(self, classification: str, message: str) -> bool:
+        """Detect an explicit or confidently classified change of topic."""
+        if TOPIC_SHIFT_PATTERN.search(message):
+            return True
+        prediction = self.classifier.predict(message)
+        return (
+            prediction["classification"] != classification
+            and prediction["classification"] in STICKY_CLASSIFICATIONS
+            and prediction["confidence"] >= self.shift_confidence
+        )
+
+    async def record(self, session_id: str, state: dict, history: list, classification: dict, agent: str):
+        """Persist the route of a triaged turn, unless it changes nothing.
+
+        Sticky routes restart their turn count at this message; other
+        routes are only written when they replace a different one.
+        """
+        label = classification.get("classification", "GENERAL").upper()
+        previous = state.get("routing")
+        if (
+            label not in STICKY_CLASSIFICATIONS
+            and previous
+            and previous.get("classification") == label
+            and previous.get("agent") == agent
+        ):
+            return
+
+        routing = {"classification": label, "agent": agent, "triagedAt": len(history) - 1}
+        await self.cosmos_service.update_session_state(session_id, routing=routing)
+        state["routing"] = routing
+
+    def get_metrics(self) -> dict:
+        return {"sticky_turns": self.sticky_turns, "topic_shifts": self.topic_shifts}
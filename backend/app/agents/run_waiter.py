@@ -0,0 +1,201 @@
+"""Shared run completion waiter for Azure AI Foundry agent runs.
+
+Replaces busy-wait polling with the streaming run API where the SDK
+provides it, and jittered exponential backoff polling otherwise. Runs that
+exceed the maximum wait or whose waiter is cancelled are cancelled on the
+service so they stop consuming quota.
+"""
+
+import os
+import random
+import asyncio
+import logging
+from typing import Optional
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import ThreadRun
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATUSES = ("queued", "in_progress", "cancelling")
+
+
+class RunTimeoutError(TimeoutError):
+    """Raised when a run does not finish within the maximum wait."""
+
+
+class RunWaiter:
+    """Waits for agent runs to leave the queued and in-progress states."""
+
+    def __init__(self, project_client: AIProjectClient):
+        self.project_client = project_client
+        self.initial_delay = float(os.getenv("RUN_POLL_INITIAL_DELAY_SECONDS", "0.25"))
+        self.max_delay = float(os.getenv("RUN_POLL_MAX_DELAY_SECONDS", "2.0"))
+        self.max_wait = float(os.getenv("RUN_MAX_WAIT_SECONDS", "120"))
+        self.use_streaming = os.getenv("RUN_USE_STREAMING", "true").lower() == "true"
+
+        # Counters
+        self.runs = 0
+        self.streamed_runs = 0
+        self.polls = 0
+        self.max_polls_per_run = 0
+        self.timeouts = 0
+        self.cancellations = 0
+
+    async def run_to_completion(
+        self,
+        thread_id: str,
+        agent_id: str,
+        max_wait: Optional[float] = None
+    ) -> ThreadRun:
+        """Create a run and wait for it, streaming events when available."""
+        max_wait = max_wait or self.max_wait
+
+        if self.use_streaming and hasattr(self.project_client.agents, "create_stream"):
+            return await self._stream_to_completion(thread_id, agent_id, max_wait)
+
+        run = await self.project_client.agents.create_run(
+            thread_id=thread_id,
+            agent_id=agent_id
+        )
+        return await self.wait(thread_id, run, max_wait=max_wait)
+
+    async def wait(
+        self,
+        thread_id: str,
+        run: ThreadRun,
+        max_wait: Optional[float] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+        resumed: bool = False,
+        deadline: Optional[float] = None
+    ) -> ThreadRun:
+        """Poll a run with jittered exponential backoff until it settles.
+
+        Returns the run once it is no longer queued or in progress, which
+        includes ``requires_action``. Raises RunTimeoutError after max_wait
+        seconds, or at deadline (see deadline()) when one is given. Setting
+        cancel_event, or cancelling the awaiting task, cancels the run on
+        the service. Pass resumed=True when waiting again on a run after
+        submitting tool outputs, with the deadline of the first wait so
+        tool calls do not extend the run's time.
+        """
+        if not resumed:
+            self.runs += 1
+        if deadline is None:
+            deadline = self.deadline(max_wait)
+        return await self._poll(thread_id, run, deadline, cancel_event)
+
+    def deadline(self, max_wait: Optional[float] = None) -> float:
+        """Event loop time by which a run started now must finish."""
+        return asyncio.get_running_loop().time() + (max_wait or self.max_wait)
+
+    async def _poll(
+        self,
+        thread_id: str,
+        run: ThreadRun,
+        deadline: float,
+        cancel_event: Optional[asyncio.Event] = None
+    ) -> ThreadRun:
+        """Poll a run until it settles or the event loop time reaches deadline.
+
+        Does not count the run as a new one.
+        """
+        loop = asyncio.get_running_loop()
+        delay = self.initial_delay
+        polls = 0
+
+        try:
+            while run.status in PENDING_STATUSES:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    await self._cancel_run(thread_id, run.id)
+                    raise RunTimeoutError(f"Run {run.id} did not finish in time")
+
+                # Equal jitter keeps a floor on the delay while spreading load
+                sleep = min(delay / 2 + random.uniform(0, delay / 2), remaining)
+                if cancel_event:
+                    try:
+                        await asyncio.wait_for(cancel_event.wait(), timeout=sleep)
+                        raise asyncio.CancelledError()
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(sleep)
+
+                run = await self.project_client.agents.get_run(
+                    thread_id=thread_id,
+                    run_id=run.id
+                )
+                polls += 1
+                delay = min(delay * 2, self.max_delay)
+        except asyncio.CancelledError:
+            self.cancellations += 1
+            await asyncio.shield(self._cancel_run(thread_id, run.id))
+            raise
+        finally:
+            self.polls += polls
+            self.max_polls_per_run = max(self.max_polls_per_run, polls)
+
+        return run
+
+    async def _stream_to_completion(
+        self,
+        thread_id: str,
+        agent_id: str,
+        max_wait: float
+    ) -> ThreadRun:
+        """Create a run through the streaming API and wait for its final state."""
+        run = None
+        self.runs += 1
+        self.streamed_runs += 1
+        # One deadline for the stream and any polling after it
+        deadline = self.deadline(max_wait)
+
+        try:
+            async with asyncio.timeout_at(deadline):
+                async with await self.project_client.agents.create_stream(
+                    thread_id=thread_id,
+                    agent_id=agent_id
+                ) as stream:
+                    async for _, event_data, _ in stream:
+                        if isinstance(event_data, ThreadRun):
+                            run = event_data
+        except TimeoutError:
+            self.timeouts += 1
+            if run:
+                await self._cancel_run(thread_id, run.id)
+            raise RunTimeoutError(f"Streamed run on thread {thread_id} did not finish in time")
+        except asyncio.CancelledError:
+            self.cancellations += 1
+            if run:
+                await asyncio.shield(self._cancel_run(thread_id, run.id))
+            raise
+
+        if run is None:
+            raise RuntimeError(f"Run stream on thread {thread_id} ended without a run")
+
+        # Streams end on a terminal event; poll if one was not observed
+        return await self._poll(thread_id, run, deadline)
+
+    async def _cancel_run(self, thread_id: str, run_id: str):
+        """Cancel a run on the service, ignoring failures."""
+        try:
+            await self.project_client.agents.cancel_run(
+                thread_id=thread_id,
+                run_id=run_id
+            )
+        except Exception as e:
+            logger.warning(f"Failed to cancel run {run_id}: {e}")
+
+    def get_metrics(self) -> dict:
+        """Get run waiting counters."""
+        return {
+            "runs": self.runs,
+            "streamed_runs": self.streamed_runs,
+            "polls": self.polls,
+            "polls_per_run": round(self.polls / self.runs, 2) if self.runs else 0.0,
+            "max_polls_per_run": self.max_polls_per_run,
+            "timeouts": self.timeouts,
+            "cancellations": self.cancellations,
+        }
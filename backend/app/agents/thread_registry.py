@@ -0,0 +1,147 @@
+"""Session to agent thread registry.
+
+Keeps one Azure AI Foundry thread per (session, agent) pair so that each
+turn only appends the new user message instead of rebuilding the whole
+conversation on a fresh thread. Thread references are persisted with the
+session in Cosmos DB and fronted by a small in-process LRU cache.
+"""
+
+import os
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from services.cosmos_service import CosmosService
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadRegistry:
+    """Maps (session, agent) pairs to persistent agent threads."""
+
+    def __init__(self, cosmos_service: CosmosService):
+        self.cosmos_service = cosmos_service
+        self.idle_ttl = timedelta(
+            seconds=int(os.getenv("AGENT_THREAD_IDLE_TTL_SECONDS", "3600"))
+        )
+        self.max_cached = int(os.getenv("AGENT_THREAD_CACHE_SIZE", "1000"))
+        # Only write lastUsedAt back to Cosmos when the stored one is this stale
+        self.touch_interval = timedelta(
+            seconds=int(os.getenv("AGENT_THREAD_TOUCH_INTERVAL_SECONDS", "60"))
+        )
+        self._cache: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        # Entries pushed out of the full cache, watched until they are idle
+        # so their threads are still deleted
+        self._evicted: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        self.max_evicted = self.max_cached * 10
+
+    async def get(self, session_id: str, agent_type: str, state: Optional[dict] = None) -> Optional[dict]:
+        """Get the thread entry for a session and agent, if one exists.
+
+        Pass the session state when it has already been read for the turn.
+        """
+        key = (session_id, agent_type)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        if state is None:
+            state = await self.cosmos_service.get_session_state(session_id)
+        entry = state.get("threads", {}).get(agent_type)
+        if entry:
+            self._remember(key, entry)
+        return entry
+
+    def is_expired(self, entry: dict) -> bool:
+        """Check whether a thread has been idle longer than the TTL."""
+        last_used = datetime.fromisoformat(entry["lastUsedAt"])
+        return datetime.utcnow() - last_used > self.idle_ttl
+
+    async def put(self, session_id: str, agent_type: str, thread_id: str) -> dict:
+        """Register a new thread for a session and agent."""
+        now = datetime.utcnow().isoformat()
+        entry = {"threadId": thread_id, "createdAt": now, "lastUsedAt": now, "persistedAt": now}
+        await self._persist(session_id, agent_type, entry)
+        return entry
+
+    async def touch(self, session_id: str, agent_type: str, entry: dict):
+        """Mark a thread as used, persisting at most once per touch interval.
+
+        The interval is measured from the last write, not the last use, so
+        a thread in constant use still has a recent lastUsedAt in Cosmos
+        for other replicas and after restarts.
+        """
+        now = datetime.utcnow()
+        persisted = datetime.fromisoformat(entry.get("persistedAt", entry["lastUsedAt"]))
+        entry = {**entry, "lastUsedAt": now.isoformat()}
+
+        if now - persisted < self.touch_interval:
+            self._remember((session_id, agent_type), entry)
+            return
+
+        entry["persistedAt"] = entry["lastUsedAt"]
+        await self._persist(session_id, agent_type, entry)
+
+    async def evict_idle(self) -> list[str]:
+        """Drop idle threads and return the IDs of those that can be deleted.
+
+        Covers cached threads and threads evicted from the cache since. A
+        thread is only released once its session agrees that it is idle,
+        since another replica may have used it more recently, and its
+        reference is then removed from the session.
+        """
+        candidates = [
+            (key, self._cache.pop(key))
+            for key, entry in list(self._cache.items())
+            if self.is_expired(entry)
+        ]
+        candidates += [
+            (key, self._evicted.pop(key))
+            for key, entry in list(self._evicted.items())
+            if self.is_expired(entry)
+        ]
+
+        released = []
+        for (session_id, agent_type), entry in candidates:
+            try:
+                if await self._release(session_id, agent_type, entry["threadId"]):
+                    released.append(entry["threadId"])
+            except Exception as e:
+                logger.warning(f"Failed to release thread {entry['threadId']}: {e}")
+        return released
+
+    async def _release(self, session_id: str, agent_type: str, thread_id: str) -> bool:
+        """Remove an idle thread from its session, returning whether it is unused."""
+        state = await self.cosmos_service.get_session_state(session_id)
+        threads = state.get("threads", {})
+        stored = threads.get(agent_type)
+        if not stored or stored["threadId"] != thread_id:
+            # Already replaced by a newer thread
+            return True
+        if not self.is_expired(stored):
+            return False
+        await self.cosmos_service.update_session_state(
+            session_id,
+            threads={k: v for k, v in threads.items() if k != agent_type}
+        )
+        return True
+
+    async def _persist(self, session_id: str, agent_type: str, entry: dict):
+        """Store a thread entry with the session and in the local cache."""
+        state = await self.cosmos_service.get_session_state(session_id)
+        threads = {**state.get("threads", {}), agent_type: entry}
+        await self.cosmos_service.update_session_state(session_id, threads=threads)
+        self._remember((session_id, agent_type), entry)
+
+    def _remember(self, key: tuple[str, str], entry: dict):
+        """Add an entry to the LRU cache, evicting the oldest if full."""
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        self._evicted.pop(key, None)
+        while len(self._cache) > self.max_cached:
+            evicted_key, evicted = self._cache.popitem(last=False)
+            self._evicted[evicted_key] = evicted
+        while len(self._evicted) > self.max_evicted:
+            (session_id, agent_type), dropped = self._evicted.popitem(last=False)
+            logger.warning(f"No longer tracking thread {dropped['threadId']} of session {session_id}")
@@ -0,0 +1,150 @@
+"""Compact, size-capped serialization of agent tool outputs.
+
+Tool outputs are added to the agent's prompt, so every token they carry
+costs latency and money on each tool turn. Handlers project results to
+the fields the agents need (see DEFAULT_PRODUCT_FIELDS and
+DEFAULT_ORDER_FIELDS); the shaper here serializes them without
+whitespace and caps them at TOOL_OUTPUT_MAX_TOKENS. Over the cap, long
+strings are shortened and trailing list items dropped, nested lists and
+documents included, leaving "truncated" markers so the agent knows the
+answer is incomplete. Lists always keep their first item, reduced field
+by field if it is over the cap on its own.
+"""
+
+import os
+import json
+from typing import Any, Callable, NamedTuple
+
+from agents.context_builder import count_tokens
+
+# Product fields returned by search_products; ingredients on request
+DEFAULT_PRODUCT_FIELDS = ["id", "name", "category", "price", "size", "description", "benefits"]
+
+# Order fields returned by lookup_order
+DEFAULT_ORDER_FIELDS = [
+    "id",
+    "status",
+    "items",
+    "total",
+    "orderDate",
+    "estimatedDelivery",
+    "deliveredDate",
+    "trackingNumber",
+    "carrier",
+]
+
+ELLIPSIS = "…"
+
+
+def compact_json(value: Any) -> str:
+    """Serialize without whitespace or escaped non-ASCII characters."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _shorten_strings(value: Any, max_chars: int) -> Any:
+    """Copy of a value with strings longer than max_chars cut short."""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars].rstrip() + ELLIPSIS
+    if isinstance(value, dict):
+        return {k: _shorten_strings(v, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shorten_strings(v, max_chars) for v in value]
+    return value
+
+
+class ShapedOutput(NamedTuple):
+    output: str
+    tokens_before: int
+    tokens_after: int
+    truncated: bool
+
+
+class ToolOutputShaper:
+    """Serializes tool results compactly within a token budget."""
+
+    def __init__(self):
+        self.max_tokens = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "1500"))
+        self.max_string_chars = int(os.getenv("TOOL_OUTPUT_MAX_STRING_CHARS", "400"))
+
+    def shape(self, result: Any) -> ShapedOutput:
+        """Serialize a tool result, counting tokens before and after shaping.
+
+        The "before" count is of the plain json.dumps serialization that
+        tool outputs used to be sent as.
+        """
+        tokens_before = count_tokens(json.dumps(result, default=str))
+        output = compact_json(result)
+        tokens = count_tokens(output)
+        truncated = self.max_tokens > 0 and tokens > self.max_tokens
+        if truncated:
+            output = compact_json(self._truncate(result))
+            tokens = count_tokens(output)
+        return ShapedOutput(output, tokens_before, tokens, truncated)
+
+    def _fits(self, value: Any) -> bool:
+        return count_tokens(compact_json(value)) <= self.max_tokens
+
+    def _keep_count(self, items, fits: Callable[[int], bool]) -> int:
+        """Largest number of leading items (or characters) for which fits(count) holds."""
+        low, high = 0, len(items)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _truncate(self, result: Any) -> Any:
+        value = _shorten_strings(result, self.max_string_chars)
+        return self._reduce(value, self._fits)
+
+    def _reduce(self, value: Any, fits: Callable[[Any], bool]) -> Any:
+        """Largest part of a value for which fits(part) holds, as far as possible."""
+        if fits(value):
+            return value
+        if isinstance(value, list):
+            return self._reduce_list(value, fits)
+        if isinstance(value, dict):
+            return self._reduce_dict(value, fits)
+        if isinstance(value, str):
+            def build(count):
+                return value[:count].rstrip() + ELLIPSIS
+            return build(self._keep_count(value, lambda count: fits(build(count))))
+        return value
+
+    def _reduce_list(self, items: list, fits: Callable[[Any], bool]) -> list:
+        # Drop trailing items, ending the list with a marker
+        def build(count):
+            return items[:count] + [{"truncated": len(items) - count}]
+        count = self._keep_count(items, lambda count: fits(build(count)))
+        if count or not items:
+            return build(count)
+
+        # Even the first item alone is over the budget: keep it reduced,
+        # so the agent still gets some data
+        rest = [{"truncated": len(items) - 1}] if len(items) > 1 else []
+        return [self._reduce(items[0], lambda item: fits([item] + rest))] + rest
+
+    def _reduce_dict(self, document: dict, fits: Callable[[Any], bool]) -> dict:
+        # Keep the smallest fields whole and reduce larger ones to the budget
+        # left, dropping those that do not fit even reduced. Each field is
+        # fitted as if all larger fields were dropped, so naming dropped
+        # fields never pushes the kept ones over the budget.
+        keys = sorted(document, key=lambda key: len(compact_json(document[key])))
+        kept = {}
+        dropped = []
+        for index, key in enumerate(keys):
+            def build(field, key=key, later=keys[index + 1:]):
+                marker = dropped + later
+                return {**kept, key: field, "truncated": marker} if marker else {**kept, key: field}
+            field = self._reduce(document[key], lambda field: fits(build(field)))
+            if fits(build(field)):
+                kept[key] = field
+            else:
+                dropped.append(key)
+
+        reduced = {key: kept[key] for key in document if key in kept}
+        if dropped:
+            reduced["truncated"] = dropped
+        return reduced
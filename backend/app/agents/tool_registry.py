@@ -0,0 +1,102 @@
+"""Registry and concurrent dispatcher for agent function tools."""
+
+import os
+import json
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Optional
+
+from agents.tool_output import ToolOutputShaper
+
+logger = logging.getLogger(__name__)
+
+# Handlers receive the parsed arguments and the per-request context
+ToolHandler = Callable[[dict, Optional[Any]], Awaitable[Any]]
+
+
+class ToolRegistry:
+    """Maps tool names to async handlers and runs tool calls concurrently.
+
+    Every call runs under its own timeout, and failures are returned to the
+    agent as an error envelope instead of failing the whole batch. Outputs
+    are serialized compactly within a token budget (see tool_output), and
+    their token counts before and after shaping are recorded per tool.
+    """
+
+    def __init__(self):
+        self.default_timeout = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+        self._handlers: dict[str, tuple[ToolHandler, float]] = {}
+        self.calls = Counter()
+        self.errors = Counter()
+        self.timeouts = Counter()
+        self.output = ToolOutputShaper()
+        self.tokens_before = Counter()
+        self.tokens_after = Counter()
+        self.truncated = Counter()
+
+    def register(self, name: str, handler: ToolHandler, timeout: Optional[float] = None):
+        """Register a handler for a tool."""
+        self._handlers[name] = (handler, timeout or self.default_timeout)
+
+    async def dispatch(self, tool_calls, context: Optional[Any] = None) -> list:
+        """Run tool calls concurrently, returning outputs in call order."""
+        results = await asyncio.gather(*(
+            self.call(tool_call.function.name, tool_call.function.arguments, context)
+            for tool_call in tool_calls
+        ))
+        return [
+            {"tool_call_id": tool_call.id, "output": self.serialize(tool_call.function.name, result)}
+            for tool_call, result in zip(tool_calls, results)
+        ]
+
+    def serialize(self, name: str, result: Any) -> str:
+        """Shape a tool result into its output, recording its token counts."""
+        shaped = self.output.shape(result)
+        self.tokens_before[name] += shaped.tokens_before
+        self.tokens_after[name] += shaped.tokens_after
+        if shaped.truncated:
+            self.truncated[name] += 1
+        logger.debug(
+            f"Tool {name} output: {shaped.tokens_before} -> {shaped.tokens_after} tokens"
+            + (" (truncated)" if shaped.truncated else "")
+        )
+        return shaped.output
+
+    async def call(self, name: str, arguments: str, context: Optional[Any] = None) -> Any:
+        """Run a single tool call, wrapping failures in an error envelope."""
+        if name not in self._handlers:
+            return {"error": f"Unknown function: {name}"}
+
+        handler, timeout = self._handlers[name]
+        self.calls[name] += 1
+        try:
+            args = json.loads(arguments or "{}")
+        except json.JSONDecodeError as e:
+            self.errors[name] += 1
+            logger.warning(f"Tool {name} called with malformed arguments: {e}")
+            return {"error": f"{name} arguments are not valid JSON: {e}", "tool": name, "retryable": True}
+        try:
+            return await asyncio.wait_for(handler(args, context), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts[name] += 1
+            logger.warning(f"Tool {name} timed out after {timeout}s")
+            return {"error": f"{name} timed out", "tool": name, "retryable": True}
+        except Exception as e:
+            self.errors[name] += 1
+            logger.error(f"Tool {name} failed: {e}")
+            return {"error": f"{name} failed: {e}", "tool": name, "retryable": False}
+
+    def get_metrics(self) -> dict:
+        """Get per-tool call, error, timeout and output token counters."""
+        return {
+            name: {
+                "calls": self.calls[name],
+                "errors": self.errors[name],
+                "timeouts": self.timeouts[name],
+                "output_tokens_before": self.tokens_before[name],
+                "output_tokens_after": self.tokens_after[name],
+                "truncated": self.truncated[name],
+            }
+            for name in self._handlers
+        }
@@ -0,0 +1,76 @@
+"""Triage classification cache keyed on normalized message text.
+
+Near-identical messages ("where is my order ORD-001?", "Where is my order
+ORD-002") share one cache entry, so repeated intents are routed without a
+triage agent run. The cache can be persisted to a JSON file across restarts.
+"""
+
+import os
+import re
+import json
+import logging
+from typing import Optional
+
+from services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+ORDER_ID_PATTERN = re.compile(r"\bord-?\d[a-z0-9-]*\b")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s<>]")
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, mask emails and order IDs, and strip punctuation."""
+    text = message.lower()
+    text = EMAIL_PATTERN.sub(" <email> ", text)
+    text = ORDER_ID_PATTERN.sub(" <order_id> ", text)
+    text = PUNCTUATION_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+
+class TriageCache:
+    """Bounded LRU + TTL cache of triage classifications."""
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=int(os.getenv("TRIAGE_CACHE_SIZE", "10000")),
+            ttl_seconds=float(os.getenv("TRIAGE_CACHE_TTL_SECONDS", "86400"))
+        )
+        self.persist_path = os.getenv("TRIAGE_CACHE_PATH")
+        if self.persist_path:
+            self.load()
+
+    def get(self, message: str) -> Optional[dict]:
+        """Get the cached classification for a message."""
+        return self.cache.get(normalize_message(message))
+
+    def set(self, message: str, classification: dict):
+        """Cache the classification for a message."""
+        self.cache.set(normalize_message(message), classification)
+
+    def load(self):
+        """Load persisted entries, ignoring a missing or corrupt file."""
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                self.cache.restore(json.load(f))
+            logger.info(f"Loaded {len(self.cache)} triage cache entries")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load triage cache: {e}")
+
+    def save(self):
+        """Persist live entries if a persist path is configured."""
+        if not self.persist_path:
+            return
+        try:
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.cache.export(), f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.warning(f"Failed to save triage cache: {e}")
+
+    def get_metrics(self) -> dict:
+        return self.cache.get_metrics()
@@ -0,0 +1,218 @@
+"""Per-session serialization of conversation turns.
+
+Overlapping requests for the same session (double submits, retries,
+several open tabs) would otherwise run triage and agent runs in parallel
+and race on the session's thread and state. Turns of a session are
+serialized by an in-process lock and, optionally, by a lease on the session
+document so replicas serialize too. What happens to a turn that arrives
+while another is running is set by the policy:
+
+- queue: wait for the running turn, then run
+- reject: fail immediately with SessionBusyError (HTTP 409)
+- coalesce: a repeat of the running turn's message gets that turn's
+  result instead of running again; other messages queue
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Optional
+
+from services.cosmos_service import CosmosService
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("queue", "reject", "coalesce")
+
+
+class SessionBusyError(Exception):
+    """A turn could not start because the session is busy."""
+
+
+class Turn:
+    """A started turn, either running or coalesced into a running one."""
+
+    def __init__(self, gate: "SessionTurnGate", session_id: str, message: str, leader: Optional["Turn"] = None):
+        self.gate = gate
+        self.session_id = session_id
+        self.message = message
+        self.owner = f"{gate.instance_id}-{uuid.uuid4().hex[:8]}"
+        # The running turn whose result this one shares, if coalesced
+        self.leader = leader
+        self._result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._released = False
+        # Renews the session lease while the turn runs
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    @property
+    def coalesced(self) -> bool:
+        return self.leader is not None
+
+    async def result(self) -> Any:
+        """Wait for the result of the running turn this one was coalesced into."""
+        return await asyncio.shield(self.leader._result)
+
+    def complete(self, result: Any):
+        if not self._result.done():
+            self._result.set_result(result)
+
+    def fail(self, error: BaseException):
+        if not self._result.done():
+            self._result.set_exception(error)
+            # Coalesced turns receive the error; mark it retrieved here
+            self._result.exception()
+
+    async def release(self):
+        """End the turn and let the next one of the session start."""
+        if self._released or self.coalesced:
+            return
+        self._released = True
+        if not self._result.done():
+            self.fail(SessionBusyError("The turn ended without a result"))
+        await self.gate._release(self)
+
+
+class SessionTurnGate:
+    """Admits one turn per session at a time according to a policy."""
+
+    def __init__(self, cosmos_service: CosmosService):
+        self.cosmos_service = cosmos_service
+        self.policy = os.getenv("SESSION_CONCURRENCY_POLICY", "queue").lower()
+        if self.policy not in POLICIES:
+            logger.warning(f"Unknown SESSION_CONCURRENCY_POLICY {self.policy}, using queue")
+            self.policy = "queue"
+        self.max_wait = float(os.getenv("SESSION_QUEUE_MAX_WAIT_SECONDS", "60"))
+        self.distributed = os.getenv("SESSION_LOCK_DISTRIBUTED", "false").lower() == "true"
+        self.lease_duration = float(os.getenv("SESSION_LEASE_SECONDS", "180"))
+        # Turns can outlast the lease (agent runs, tool calls), so it is
+        # renewed on a heartbeat until the turn is released
+        self.lease_renew_interval = self.lease_duration / 3
+        self.instance_id = uuid.uuid4().hex[:8]
+
+        # Locks are created on demand and dropped once nobody holds or waits
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._users: dict[str, int] = {}
+        self._running: dict[str, Turn] = {}
+
+        # Counters
+        self.turns = 0
+        self.queued = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.leases_lost = 0
+
+    async def begin(self, session_id: str, message: str) -> Turn:
+        """Start a turn, waiting or failing if the session is busy.
+
+        The caller must release the returned turn, and complete or fail it,
+        unless it was coalesced.
+        """
+        # Decide before the first await so overlapping requests see each other
+        if self._users.get(session_id):
+            running = self._running.get(session_id)
+            if self.policy == "reject":
+                self.rejected += 1
+                raise SessionBusyError(f"Session {session_id} is already processing a message")
+            if (
+                self.policy == "coalesce"
+                and running
+                and running.message.strip() == message.strip()
+            ):
+                self.coalesced += 1
+                return Turn(self, session_id, message, leader=running)
+            self.queued += 1
+
+        turn = Turn(self, session_id, message)
+        if not self._users.get(session_id):
+            # Nobody holds the lock, so this turn runs next
+            self._running[session_id] = turn
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._users[session_id] = self._users.get(session_id, 0) + 1
+        deadline = time.monotonic() + self.max_wait
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._drop_user(session_id)
+            raise SessionBusyError(f"Timed out waiting for session {session_id}")
+        except BaseException:
+            self._drop_user(session_id)
+            raise
+
+        if self.distributed:
+            try:
+                await self._acquire_lease(turn, deadline)
+            except BaseException:
+                if self._running.get(session_id) is turn:
+                    del self._running[session_id]
+                lock.release()
+                self._drop_user(session_id)
+                raise
+            turn._heartbeat = asyncio.create_task(self._renew_lease(turn))
+
+        self._running[session_id] = turn
+        self.turns += 1
+        return turn
+
+    async def _acquire_lease(self, turn: Turn, deadline: float):
+        """Take the session lease, retrying with backoff under the queue policy."""
+        delay = 0.1
+        while not await self.cosmos_service.acquire_session_lease(
+            turn.session_id, turn.owner, self.lease_duration
+        ):
+            if self.policy == "reject":
+                self.rejected += 1
+                raise SessionBusyError(f"Session {turn.session_id} is busy on another replica")
+            if time.monotonic() + delay > deadline:
+                raise SessionBusyError(f"Timed out waiting for session {turn.session_id}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    async def _renew_lease(self, turn: Turn):
+        """Renew the session lease of a running turn until it is cancelled."""
+        while True:
+            await asyncio.sleep(self.lease_renew_interval)
+            try:
+                renewed = await self.cosmos_service.acquire_session_lease(
+                    turn.session_id, turn.owner, self.lease_duration
+                )
+            except Exception as e:
+                # Retried on the next beat, well within the lease
+                logger.warning(f"Failed to renew lease of session {turn.session_id}: {e}")
+                continue
+            if not renewed:
+                self.leases_lost += 1
+                logger.error(f"Lost the lease of session {turn.session_id} during a turn")
+                return
+
+    async def _release(self, turn: Turn):
+        session_id = turn.session_id
+        if self._running.get(session_id) is turn:
+            del self._running[session_id]
+        if turn._heartbeat:
+            turn._heartbeat.cancel()
+        if self.distributed:
+            try:
+                await self.cosmos_service.release_session_lease(session_id, turn.owner)
+            except Exception as e:
+                logger.warning(f"Failed to release lease of session {session_id}: {e}")
+        self._locks[session_id].release()
+        self._drop_user(session_id)
+
+    def _drop_user(self, session_id: str):
+        self._users[session_id] -= 1
+        if not self._users[session_id]:
+            del self._users[session_id]
+            del self._locks[session_id]
+
+    def get_metrics(self) -> dict:
+        return {
+            "policy": self.policy,
+            "active": len(self._running),
+            "turns": self.turns,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+            "leases_lost": self.leases_lost,
+        }
@@ -6,17 +6,21 @@ customer support system using Azure AI Foundry Agent Service.
 
 import os
 import uuid
+import hashlib
 import logging
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Literal
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
 from agents.orchestrator import AgentOrchestrator
+from agents.turn_gate import SessionBusyError
 from services.cosmos_service import CosmosService
+from services.local_store import create_local_store
 from services.search_service import SearchService
 
 # Configure logging
@@ -36,14 +40,17 @@ async def lifespan(app: FastAPI):
     
     logger.info("Initializing services...")
     
-    # Initialize services
-    cosmos_service = CosmosService()
-    search_service = SearchService()
+    # Initialize services, which serve local data from one shared store
+    local_store = create_local_store()
+    cosmos_service = CosmosService(local_store=local_store)
+    search_service = SearchService(local_store=local_store)
     orchestrator = AgentOrchestrator(
         cosmos_service=cosmos_service,
         search_service=search_service
     )
     
+    await cosmos_service.start()
+    await search_service.start()
     await orchestrator.initialize()
     logger.info("Services initialized successfully")
     
@@ -51,6 +58,10 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     logger.info("Shutting down services...")
+    await orchestrator.close()
+    await cosmos_service.close()
+    await search_service.close()
+    await local_store.close()
 
 
 app = FastAPI(
@@ -122,6 +133,8 @@ async def chat(request: ChatRequest):
             agent=result["agent"],
             thought_process=result.get("thought_process")
         )
+    except SessionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -132,16 +145,25 @@ async def chat_stream(request: ChatRequest):
     """Stream chat response for real-time UI updates."""
     session_id = request.session_id or str(uuid.uuid4())
     
+    # Start the turn before streaming so a busy session can still get a 409
+    try:
+        turn = await orchestrator.begin_turn(session_id, request.message)
+    except SessionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
     async def generate() -> AsyncGenerator[str, None]:
         try:
             async for chunk in orchestrator.process_message_stream(
                 session_id=session_id,
-                message=request.message
+                message=request.message,
+                turn=turn
             ):
                 yield f"data: {chunk}\n\n"
         except Exception as e:
             logger.error(f"Streaming error: {e}")
             yield f"data: {{\"error\": \"{str(e)}\"}}\n\n"
+        finally:
+            await turn.release()
     
     return StreamingResponse(
         generate(),
@@ -149,32 +171,94 @@ async def chat_stream(request: ChatRequest):
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-        }
+        },
+        # Also ends the turn if the client disconnects before streaming starts
+        background=BackgroundTask(turn.release)
     )
 
 
 @app.get("/api/session/{session_id}/history")
-async def get_session_history(session_id: str):
-    """Get conversation history for a session."""
+async def get_session_history(
+    session_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    order: Literal["asc", "desc"] = "asc",
+    since: str | None = None,
+    continuation: str | None = None,
+    if_none_match: str | None = Header(None)
+):
+    """Get a page of conversation history for a session.
+    
+    Messages are returned oldest first, or newest first with order=desc,
+    optionally only those after the ISO timestamp since. Pass the returned
+    continuation to get the next page. Responses carry an ETag, and a
+    request with a matching If-None-Match gets 304 Not Modified.
+    """
     try:
-        history = await cosmos_service.get_conversation_history(session_id)
-        return {"session_id": session_id, "messages": history}
+        version = await cosmos_service.get_history_version(session_id)
+        etag = '"' + hashlib.sha256(
+            f"{version}|{limit}|{order}|{since}|{continuation}".encode("utf-8")
+        ).hexdigest()[:32] + '"'
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or etag in [tag.strip() for tag in if_none_match.split(",")]
+        ):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        page = await cosmos_service.get_conversation_history_page(
+            session_id,
+            limit=limit,
+            newest_first=order == "desc",
+            since=since,
+            continuation=continuation
+        )
+        return JSONResponse(
+            content={"session_id": session_id, **page},
+            headers={"ETag": etag, "Cache-Control": "no-cache"}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/products")
-async def get_products():
-    """Get list of products for the catalog."""
+async def get_products(
+    accept_encoding: str | None = Header(None),
+    if_none_match: str | None = Header(None)
+):
+    """Get list of products for the catalog.
+    
+    Served from the precomputed catalog snapshot, gzip-compressed when the
+    client accepts it. A request with a matching If-None-Match gets 304.
+    """
     try:
-        products = await search_service.get_all_products()
-        return {"products": products}
+        snapshot = await search_service.get_catalog_snapshot()
+        headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if snapshot.matches(if_none_match):
+            return Response(status_code=304, headers=headers)
+        if snapshot.gzip_body and "gzip" in (accept_encoding or "").lower():
+            return Response(
+                content=snapshot.gzip_body,
+                media_type="application/json",
+                headers={**headers, "Content-Encoding": "gzip"}
+            )
+        return Response(content=snapshot.body, media_type="application/json", headers=headers)
     except Exception as e:
         logger.error(f"Error getting products: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Get performance counters for the agent orchestrator and services."""
+    return {
+        **orchestrator.get_metrics(),
+        "cosmos": cosmos_service.get_metrics(),
+        "search": search_service.get_metrics(),
+    }
+
+
 @app.get("/api/orders/{order_id}")
 async def get_order(order_id: str):
     """Get order details by order ID."""
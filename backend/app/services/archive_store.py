@@ -0,0 +1,206 @@
+"""Compressed archive of cold conversation sessions.
+
+An archived session is one JSONL blob: the session document on the first
+line followed by one line per message item, compressed with gzip or, when
+the zstandard package is installed, zstd. Blobs are kept in Azure Blob
+Storage (or Azurite through a connection string) or in a local directory.
+"""
+
+import os
+import gzip
+import json
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import quote
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity.aio import DefaultAzureCredential
+from azure.storage.blob.aio import BlobServiceClient
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional
+    zstandard = None
+
+EXTENSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data)
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def encode_session(session: dict, items: list[dict]) -> bytes:
+    """Serialize a session document and its message items as JSONL."""
+    lines = [json.dumps(record, separators=(",", ":")) for record in [session, *items]]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def decode_session(data: bytes) -> tuple[dict, list[dict]]:
+    """Parse JSONL produced by encode_session."""
+    records = [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+    return records[0], records[1:]
+
+
+class LocalArchiveStore:
+    """Archive blobs as files in a local directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    async def put(self, name: str, data: bytes):
+        def write():
+            path = self._path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        await asyncio.to_thread(write)
+
+    async def get(self, name: str) -> Optional[bytes]:
+        def read():
+            try:
+                with open(self._path(name), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        return await asyncio.to_thread(read)
+
+    async def delete(self, name: str):
+        try:
+            await asyncio.to_thread(os.remove, self._path(name))
+        except FileNotFoundError:
+            pass
+
+    async def close(self):
+        pass
+
+
+class BlobArchiveStore:
+    """Archive blobs in an Azure Blob Storage container."""
+
+    def __init__(self, client: BlobServiceClient, container: str):
+        self.client = client
+        self.container = client.get_container_client(container)
+
+    async def put(self, name: str, data: bytes):
+        try:
+            await self.container.upload_blob(name, data, overwrite=True)
+        except ResourceNotFoundError:
+            # A fresh Azurite account has no container yet
+            await self.container.create_container()
+            await self.container.upload_blob(name, data, overwrite=True)
+
+    async def get(self, name: str) -> Optional[bytes]:
+        try:
+            downloader = await self.container.download_blob(name)
+        except ResourceNotFoundError:
+            return None
+        return await downloader.readall()
+
+    async def delete(self, name: str):
+        try:
+            await self.container.delete_blob(name)
+        except ResourceNotFoundError:
+            pass
+
+    async def close(self):
+        await self.client.close()
+
+
+class SessionArchive:
+    """Writes and reads archived sessions in an archive store."""
+
+    def __init__(self, store, compression: str = "gzip"):
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, archiving with gzip")
+            compression = "gzip"
+        self.store = store
+        self.compression = compression
+
+        # Counters
+        self.archived = 0
+        self.rehydrated = 0
+
+    @staticmethod
+    def _compression_of(name: str) -> str:
+        return "zstd" if name.endswith(EXTENSIONS["zstd"]) else "gzip"
+
+    def name_for(self, session_id: str) -> str:
+        """Blob name of a session archived with the configured compression."""
+        return f"sessions/{quote(session_id, safe='')}{EXTENSIONS[self.compression]}"
+
+    async def save(self, session: dict, items: list[dict]) -> dict:
+        """Archive a session, returning the marker to record with it.
+
+        The marker names the blob and its compression, so archives stay
+        readable after ARCHIVE_COMPRESSION is changed.
+        """
+        name = self.name_for(session["id"])
+        compression = self.compression
+        data = await asyncio.to_thread(
+            lambda: compress(encode_session(session, items), compression)
+        )
+        await self.store.put(name, data)
+        self.archived += 1
+        return {"blob": name, "compression": compression}
+
+    async def load(self, marker: dict) -> Optional[tuple[dict, list[dict]]]:
+        """Load the session document and message items of an archive marker."""
+        name = marker["blob"]
+        # Markers written before the compression was recorded
+        compression = marker.get("compression") or self._compression_of(name)
+        data = await self.store.get(name)
+        if data is None:
+            return None
+        self.rehydrated += 1
+        return await asyncio.to_thread(
+            lambda: decode_session(decompress(data, compression))
+        )
+
+    async def delete(self, marker: dict):
+        await self.store.delete(marker["blob"])
+
+    async def close(self):
+        await self.store.close()
+
+    def get_metrics(self) -> dict:
+        return {
+            "compression": self.compression,
+            "archived": self.archived,
+            "rehydrated": self.rehydrated,
+        }
+
+
+def create_session_archive() -> Optional[SessionArchive]:
+    """Create the session archive configured by environment, if any.
+
+    ARCHIVE_BLOB_CONNECTION_STRING (e.g. UseDevelopmentStorage=true for
+    Azurite) or ARCHIVE_BLOB_ENDPOINT with Entra ID selects Blob Storage;
+    ARCHIVE_LOCAL_DIR selects a local directory.
+    """
+    compression = os.getenv("ARCHIVE_COMPRESSION", "gzip").lower()
+    container = os.getenv("ARCHIVE_BLOB_CONTAINER", "conversation-archive")
+
+    if os.getenv("ARCHIVE_BLOB_CONNECTION_STRING"):
+        client = BlobServiceClient.from_connection_string(os.getenv("ARCHIVE_BLOB_CONNECTION_STRING"))
+        return SessionArchive(BlobArchiveStore(client, container), compression)
+    if os.getenv("ARCHIVE_BLOB_ENDPOINT"):
+        client = BlobServiceClient(os.getenv("ARCHIVE_BLOB_ENDPOINT"), credential=DefaultAzureCredential())
+        return SessionArchive(BlobArchiveStore(client, container), compression)
+    if os.getenv("ARCHIVE_LOCAL_DIR"):
+        return SessionArchive(LocalArchiveStore(os.getenv("ARCHIVE_LOCAL_DIR")), compression)
+    return None
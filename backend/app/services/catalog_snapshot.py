@@ -0,0 +1,121 @@
+"""In-process snapshot of the product catalog for GET /api/products.
+
+The snapshot holds the whole catalog together with its serialized and
+gzip-compressed response bodies and an ETag, so requests are answered
+without querying the search index or serializing anything. It is rebuilt
+in the background on a schedule, or on demand, and only replaced when the
+catalog actually changed, keeping the ETag stable for clients.
+"""
+
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """An immutable catalog with its precomputed response bodies."""
+
+    def __init__(self, products: list[dict], gzip_min_bytes: int = 1024):
+        self.products = products
+        self.body = json.dumps({"products": products}, separators=(",", ":")).encode("utf-8")
+        # Weak, since the gzip and identity representations share it
+        self.etag = 'W/"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.gzip_body = (
+            gzip.compress(self.body, compresslevel=6) if len(self.body) >= gzip_min_bytes else None
+        )
+        self.built_at = time.time()
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header names this snapshot (weak comparison)."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return self.etag.removeprefix("W/") in tags
+
+
+class CatalogSnapshotCache:
+    """Keeps a catalog snapshot fresh by reloading it in the background."""
+
+    def __init__(self, load: Callable[[], Awaitable[list[dict]]]):
+        self.load = load
+        self.refresh_interval = float(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+        self.gzip_min_bytes = int(os.getenv("CATALOG_GZIP_MIN_BYTES", "1024"))
+        self.snapshot: Optional[CatalogSnapshot] = None
+        # Called with the new snapshot whenever the catalog changed
+        self.listeners: list[Callable[[CatalogSnapshot], Awaitable[None]]] = []
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters
+        self.refreshes = 0
+        self.changes = 0
+        self.errors = 0
+
+    async def get(self) -> CatalogSnapshot:
+        """Get the current snapshot, building the first one if needed."""
+        if self.snapshot is None:
+            await self.refresh()
+        return self.snapshot
+
+    async def refresh(self) -> bool:
+        """Reload the catalog, returning whether it changed."""
+        async with self._lock:
+            products = await self.load()
+            snapshot = await asyncio.to_thread(CatalogSnapshot, products, self.gzip_min_bytes)
+            self.refreshes += 1
+            if self.snapshot and snapshot.etag == self.snapshot.etag:
+                return False
+            self.snapshot = snapshot
+            self.changes += 1
+            logger.info(f"Catalog snapshot of {len(products)} products ({len(snapshot.body)} bytes)")
+
+        for listener in self.listeners:
+            try:
+                await listener(snapshot)
+            except Exception as e:
+                logger.error(f"Catalog change listener failed: {e}")
+        return True
+
+    def start(self):
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the last good snapshot
+                self.errors += 1
+                logger.error(f"Failed to refresh the catalog snapshot: {e}")
+
+    def get_metrics(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "products": len(snapshot.products) if snapshot else 0,
+            "bytes": len(snapshot.body) if snapshot else 0,
+            "gzip_bytes": len(snapshot.gzip_body) if snapshot and snapshot.gzip_body else 0,
+            "age_seconds": round(time.time() - snapshot.built_at, 1) if snapshot else None,
+            "refreshes": self.refreshes,
+            "changes": self.changes,
+            "errors": self.errors,
+        }
@@ -0,0 +1,334 @@
+"""Change-feed processor for keeping derived data in sync with a container.
+
+The processor polls a change-feed source from its last continuation token
+and hands each batch of changed items to its handlers. A batch is only
+acknowledged once every handler succeeded, so a failed batch is read again
+on the next poll; handlers must therefore be idempotent.
+
+With a checkpoint store the continuation survives restarts, and a lease
+ensures only one replica runs a processor of a given name at a time.
+Without one, every process consumes the feed itself, which is what
+per-process caches need.
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+
+logger = logging.getLogger(__name__)
+
+ChangeHandler = Callable[[list[dict]], Awaitable[None]]
+
+
+class LeaseLostError(Exception):
+    """Raised when a checkpoint is written by a processor that lost its lease."""
+
+
+class CosmosChangeFeedSource:
+    """Reads the change feed of a Cosmos DB container page by page."""
+
+    def __init__(self, container, page_size: int = 100, start_from: str = "Beginning"):
+        self.container = container
+        self.page_size = page_size
+        # "Beginning" or "Now"; only used without a continuation token
+        self.start_from = start_from
+
+    async def read(self, continuation: Optional[str]) -> tuple[list[dict], Optional[str]]:
+        """Read the next page of changes after a continuation token."""
+        options = {"max_item_count": self.page_size}
+        if continuation:
+            options["continuation"] = continuation
+        else:
+            options["start_time"] = self.start_from
+
+        pages = self.container.query_items_change_feed(**options).by_page()
+        async for page in pages:
+            items = [item async for item in page]
+            # The pager tracks the continuation (the response ETag) of its
+            # own requests; the client's last response headers are shared
+            # with concurrent requests
+            return items, pages.continuation_token or continuation
+        return [], continuation
+
+
+class LocalChangeFeedSource:
+    """Change feed stand-in that watches a local JSON data file.
+
+    Whenever the file is modified the items that differ from the previous
+    version are emitted, stamped with the file time as their _ts. The
+    continuation token is the file's modification time. Starting from
+    "Now", the first read without a continuation only takes a baseline.
+    """
+
+    def __init__(self, path: str, load: Callable[[str], list[dict]], start_from: str = "Beginning"):
+        self.path = path
+        self.load = load
+        self.start_from = start_from
+        self._snapshot: Optional[dict] = None
+
+    async def read(self, continuation: Optional[str]) -> tuple[list[dict], Optional[str]]:
+        mtime = os.stat(self.path).st_mtime_ns
+        if continuation == str(mtime) and self._snapshot is not None:
+            return [], continuation
+
+        items = await asyncio.to_thread(self.load, self.path)
+        if continuation == str(mtime) or (continuation is None and self.start_from == "Now"):
+            # Resumed from a checkpoint of this version, or starting from
+            # now: only take a baseline
+            changed = []
+        else:
+            previous = self._snapshot or {}
+            changed = [item for item in items if previous.get(item["id"]) != item]
+        self._snapshot = {item["id"]: item for item in items}
+
+        timestamp = mtime / 1e9
+        return [{**item, "_ts": timestamp} for item in changed], str(mtime)
+
+
+class FileCheckpointStore:
+    """Keeps continuation tokens in a local JSON file for a single process."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    async def acquire(self, name: str, owner: str, duration: float) -> bool:
+        return True
+
+    async def release(self, name: str, owner: str):
+        pass
+
+    async def load(self, name: str) -> Optional[str]:
+        return (await asyncio.to_thread(self._read)).get(name)
+
+    async def save(self, name: str, continuation: str):
+        def write():
+            checkpoints = self._read()
+            checkpoints[name] = continuation
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(checkpoints, f)
+        await asyncio.to_thread(write)
+
+
+class CosmosCheckpointStore:
+    """Keeps continuation tokens and processor leases in a Cosmos DB container.
+
+    Each processor has one lease document holding its continuation, owner
+    and lease expiry. Leases are taken, and checkpoints written, with
+    optimistic concurrency on the document ETag, so a replica whose lease
+    was taken over cannot overwrite the new owner's checkpoint.
+    """
+
+    def __init__(self, container):
+        self.container = container
+        # Lease document ETag as of this replica's last write, by name
+        self._etags: dict[str, str] = {}
+
+    async def _read(self, name: str) -> Optional[dict]:
+        try:
+            return await self.container.read_item(item=name, partition_key=name)
+        except CosmosResourceNotFoundError:
+            return None
+
+    async def acquire(self, name: str, owner: str, duration: float) -> bool:
+        """Acquire or renew the lease, returning whether owner holds it."""
+        lease = await self._read(name)
+        now = time.time()
+        if lease and lease.get("owner") not in (None, owner) and lease.get("leaseExpiresAt", 0) > now:
+            return False
+
+        body = {**(lease or {"id": name}), "owner": owner, "leaseExpiresAt": now + duration}
+        try:
+            if lease:
+                written = await self.container.replace_item(
+                    item=name,
+                    body=body,
+                    etag=lease["_etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+            else:
+                written = await self.container.create_item(body=body)
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+            # Another replica took the lease first
+            self._etags.pop(name, None)
+            return False
+        self._etags[name] = written["_etag"]
+        return True
+
+    async def release(self, name: str, owner: str):
+        """Give up the lease so another replica can take over immediately."""
+        lease = await self._read(name)
+        self._etags.pop(name, None)
+        if lease and lease.get("owner") == owner:
+            try:
+                await self.container.patch_item(
+                    item=name,
+                    partition_key=name,
+                    patch_operations=[{"op": "set", "path": "/leaseExpiresAt", "value": 0}],
+                    etag=lease["_etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+            except CosmosAccessConditionFailedError:
+                pass  # Taken over meanwhile
+
+    async def load(self, name: str) -> Optional[str]:
+        lease = await self._read(name)
+        return lease.get("continuation") if lease else None
+
+    async def save(self, name: str, continuation: str):
+        """Write the checkpoint if the lease document is unchanged since this replica's last write."""
+        if name not in self._etags:
+            raise LeaseLostError(name)
+        try:
+            written = await self.container.patch_item(
+                item=name,
+                partition_key=name,
+                patch_operations=[{"op": "set", "path": "/continuation", "value": continuation}],
+                etag=self._etags[name],
+                match_condition=MatchConditions.IfNotModified
+            )
+        except CosmosAccessConditionFailedError:
+            self._etags.pop(name, None)
+            raise LeaseLostError(name)
+        self._etags[name] = written["_etag"]
+
+
+class ChangeFeedProcessor:
+    """Polls a change-feed source and dispatches changes to handlers."""
+
+    def __init__(
+        self,
+        name: str,
+        source,
+        handlers: list[ChangeHandler],
+        checkpoints=None
+    ):
+        self.name = name
+        self.source = source
+        self.handlers = handlers
+        self.checkpoints = checkpoints
+        self.poll_interval = float(os.getenv("CHANGE_FEED_POLL_INTERVAL_SECONDS", "1.0"))
+        self.lease_duration = float(os.getenv("CHANGE_FEED_LEASE_SECONDS", "30"))
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        self.continuation: Optional[str] = None
+        self.leased = False
+        self._lease_renew_at = 0.0
+        self._task: asyncio.Task = None
+
+        # Counters
+        self.batches = 0
+        self.changes = 0
+        self.errors = 0
+        # Age of the newest processed change when it was processed
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.last_poll_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start polling in the background."""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop polling and release the lease."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.checkpoints and self.leased:
+            try:
+                await self.checkpoints.release(self.name, self.owner)
+            except Exception as e:
+                logger.warning(f"Failed to release change feed lease {self.name}: {e}")
+            self.leased = False
+
+    async def _run(self):
+        while True:
+            try:
+                if self.checkpoints and not await self._hold_lease():
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                drained = await self.process_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Change feed {self.name} failed: {e}")
+                drained = True
+            if drained:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _hold_lease(self) -> bool:
+        """Acquire or renew the lease, resuming from the checkpoint when acquired."""
+        if self.leased and time.monotonic() < self._lease_renew_at:
+            return True
+
+        acquired = await self.checkpoints.acquire(self.name, self.owner, self.lease_duration)
+        if acquired and not self.leased:
+            self.continuation = await self.checkpoints.load(self.name)
+            logger.info(f"Change feed {self.name} leased by {self.owner}")
+        self.leased = acquired
+        self._lease_renew_at = time.monotonic() + self.lease_duration / 2
+        return acquired
+
+    async def process_once(self) -> bool:
+        """Process one page of changes, returning True when the feed is drained."""
+        items, continuation = await self.source.read(self.continuation)
+        if items:
+            for handler in self.handlers:
+                await handler(items)
+            self.batches += 1
+            self.changes += len(items)
+
+        now = time.time()
+        timestamps = [item["_ts"] for item in items if "_ts" in item]
+        self.lag_seconds = max(0.0, now - max(timestamps)) if timestamps else 0.0
+        self.max_lag_seconds = max(self.max_lag_seconds, self.lag_seconds)
+        self.last_poll_at = now
+
+        if continuation != self.continuation:
+            self.continuation = continuation
+            if self.checkpoints:
+                try:
+                    await self.checkpoints.save(self.name, continuation)
+                except LeaseLostError:
+                    # The new owner processes this batch again from its checkpoint
+                    logger.warning(f"Change feed {self.name} lease was taken over, stopping")
+                    self.leased = False
+                    return True
+        return not items
+
+    def get_metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "leased": self.leased if self.checkpoints else None,
+            "batches": self.batches,
+            "changes": self.changes,
+            "errors": self.errors,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+            "seconds_since_poll": (
+                round(time.time() - self.last_poll_at, 3) if self.last_poll_at else None
+            ),
+        }
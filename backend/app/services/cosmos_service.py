@@ -1,25 +1,73 @@
 """Cosmos DB service for order management and conversation history."""
 
 import os
+import time
+import uuid
+import base64
+import asyncio
 import logging
-from datetime import datetime
-from typing import Optional
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
 
+from azure.core import MatchConditions
 from azure.identity.aio import DefaultAzureCredential
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import PartitionKey
+from services.archive_store import create_session_archive
+from services.change_feed import (
+    ChangeFeedProcessor,
+    CosmosChangeFeedSource,
+    CosmosCheckpointStore,
+    FileCheckpointStore,
+    LocalChangeFeedSource,
+)
+from services.local_data import load_orders
+from services.local_store import create_local_store
+from services.projection import cosmos_select, project
+from services.session_store import SessionStore
+from services.ttl_cache import TTLCache
+from services.write_behind import WriteBehindQueue
+
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosBatchOperationError,
+    CosmosHttpResponseError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def email_key(email: str) -> str:
+    """Normalized email usable as a Cosmos DB item ID."""
+    return quote(email.strip().lower(), safe="@.+-_")
+
+
+def _encode_token(token: str) -> str:
+    """URL-safe form of a continuation token."""
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_token(token: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+    except ValueError:
+        raise ValueError("Invalid continuation token")
+
+
 class CosmosService:
     """Service for managing orders and conversations in Cosmos DB."""
     
-    def __init__(self):
+    def __init__(self, local_store=None):
         self.endpoint = os.getenv("COSMOS_ENDPOINT")
         self.database_name = "customer-support"
         self.orders_container = "orders"
         self.conversations_container = "conversations"
+        self.order_emails_container = "order-emails"
+        self.leases_container = "leases"
         self.client: CosmosClient = None
         self.database = None
         self._initialized = False
@@ -54,7 +102,44 @@ class CosmosService:
                 "deliveredDate": "2026-01-10"
             }
         }
-        self._mock_conversations = {}
+        # Without Cosmos DB orders come from a local store, seeded with the
+        # mock orders or a data file whose later edits are picked up through
+        # a local change feed
+        self.local_orders_path = os.getenv("LOCAL_ORDERS_PATH")
+        # A store shared with the search service can be passed in
+        self._owns_local_store = local_store is None
+        if local_store is None:
+            local_store = create_local_store(orders=list(self._mock_orders.values()))
+        else:
+            local_store.add_defaults(orders=list(self._mock_orders.values()))
+        self.local_store = local_store
+        self._mock_conversations = SessionStore()
+        self._last_seq = 0
+        
+        # Messages are written behind the request path when enabled
+        self.write_behind_enabled = os.getenv("COSMOS_WRITE_BEHIND", "true").lower() == "true"
+        self.message_queue = WriteBehindQueue(self._write_message_batch)
+        
+        # Orders are read by ID several times per agent run
+        self.order_cache = TTLCache(
+            max_size=int(os.getenv("ORDER_CACHE_SIZE", "5000")),
+            ttl_seconds=float(os.getenv("ORDER_CACHE_TTL_SECONDS", "30"))
+        )
+        
+        # Email lookups read an email -> order IDs index kept in sync by
+        # the orders change feed instead of querying every partition
+        self.email_index_enabled = os.getenv("ORDER_EMAIL_INDEX", "true").lower() == "true"
+        self.lookup_max_orders = int(os.getenv("ORDER_LOOKUP_MAX_ORDERS", "20"))
+        
+        # Change feeds keep the email index and the order cache in sync
+        self.change_feed_enabled = os.getenv("ORDER_CHANGE_FEED", "true").lower() == "true"
+        self.change_feed_checkpoint_path = os.getenv("CHANGE_FEED_CHECKPOINT_PATH")
+        self.order_feeds: list[ChangeFeedProcessor] = []
+        
+        # Idle sessions are moved to compressed blobs by the archival job
+        # (scripts/archive_sessions.py) and restored when next read
+        self.archive = create_session_archive()
+        self.archive_idle_days = float(os.getenv("ARCHIVE_IDLE_DAYS", "30"))
     
     async def _ensure_initialized(self):
         """Initialize Cosmos client if not already done."""
@@ -63,6 +148,7 @@ class CosmosService:
             
         if not self.endpoint:
             logger.warning("COSMOS_ENDPOINT not set, using mock data")
+            await self.local_store.open()
             self._initialized = True
             return
         
@@ -74,16 +160,22 @@ class CosmosService:
             logger.info("Cosmos DB initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Cosmos DB: {e}")
+            await self.local_store.open()
             self._initialized = True  # Use mock data
     
     async def create_session(self, session_id: str) -> dict:
-        """Create a new conversation session."""
+        """Create a new conversation session.
+        
+        In Cosmos DB the session document only holds metadata and state;
+        each message is stored as its own item in the session's partition.
+        """
         await self._ensure_initialized()
         
         session = {
             "id": session_id,
             "sessionId": session_id,
-            "messages": [],
+            "type": "session",
+            "state": {},
             "createdAt": datetime.utcnow().isoformat(),
             "updatedAt": datetime.utcnow().isoformat()
         }
@@ -92,10 +184,108 @@ class CosmosService:
             container = self.database.get_container_client(self.conversations_container)
             await container.create_item(body=session)
         else:
-            self._mock_conversations[session_id] = session
+            session["messages"] = []
+            await self._mock_conversations.put(session_id, session)
         
         return session
     
+    async def start(self):
+        """Start background work such as the message write-behind queue."""
+        await self._ensure_initialized()
+        if self.client and self.write_behind_enabled:
+            self.message_queue.start()
+        if self.change_feed_enabled:
+            self.order_feeds = self._create_order_feeds()
+            for feed in self.order_feeds:
+                feed.start()
+    
+    def _create_order_feeds(self) -> list[ChangeFeedProcessor]:
+        """Create the change-feed processors that follow order changes."""
+        if not self.client:
+            if not self.local_orders_path:
+                return []
+            checkpoints = None
+            if self.change_feed_checkpoint_path:
+                checkpoints = FileCheckpointStore(self.change_feed_checkpoint_path)
+            return [ChangeFeedProcessor(
+                "orders-local",
+                # The local store loaded the file when it was opened
+                LocalChangeFeedSource(self.local_orders_path, load_orders, start_from="Now"),
+                [self._apply_local_orders, self._refresh_cached_orders],
+                checkpoints=checkpoints
+            )]
+        
+        orders = self.database.get_container_client(self.orders_container)
+        # Every replica refreshes its own cache from changes made from now on
+        feeds = [ChangeFeedProcessor(
+            "orders-cache",
+            CosmosChangeFeedSource(orders, start_from="Now"),
+            [self._refresh_cached_orders]
+        )]
+        if self.email_index_enabled:
+            # The shared index is maintained by one leased replica at a time
+            leases = self.database.get_container_client(self.leases_container)
+            feeds.append(ChangeFeedProcessor(
+                "orders-email-index",
+                CosmosChangeFeedSource(orders),
+                [self._index_order_emails],
+                checkpoints=CosmosCheckpointStore(leases)
+            ))
+        return feeds
+    
+    async def close(self):
+        """Flush pending writes and release the client."""
+        for feed in self.order_feeds:
+            await feed.close()
+        await self.message_queue.close()
+        if self.archive:
+            await self.archive.close()
+        if self.client:
+            await self.client.close()
+        elif self._owns_local_store:
+            await self.local_store.close()
+    
+    async def _ensure_session(self, session_id: str):
+        """Create the session document unless it already exists."""
+        try:
+            await self.create_session(session_id)
+        except CosmosResourceExistsError:
+            pass
+    
+    def _next_seq(self) -> int:
+        """Monotonic sequence number used to order messages."""
+        self._last_seq = max(time.time_ns(), self._last_seq + 1)
+        return self._last_seq
+    
+    def _message_item(self, session_id: str, message: dict, seq: int, item_id: str = None) -> dict:
+        """Build the Cosmos DB item for a single message.
+        
+        Message items never expire on their own: the container TTL would
+        count from each item's write, dropping the first turns of a session
+        still in use. They live as long as the session document, which is
+        touched with every message (see purge_expired_messages).
+        """
+        return {
+            "id": item_id or f"msg-{seq}-{uuid.uuid4().hex[:8]}",
+            "sessionId": session_id,
+            "type": "message",
+            "seq": seq,
+            "ttl": -1,
+            **message
+        }
+    
+    @staticmethod
+    def _to_message(item: dict) -> dict:
+        """Strip storage fields from a message item."""
+        message = {
+            "role": item["role"],
+            "content": item["content"],
+            "timestamp": item["timestamp"]
+        }
+        if item.get("agent"):
+            message["agent"] = item["agent"]
+        return message
+    
     async def add_message(
         self,
         session_id: str,
@@ -115,18 +305,38 @@ class CosmosService:
             message["agent"] = agent
         
         if self.client:
-            container = self.database.get_container_client(self.conversations_container)
-            session = await container.read_item(
-                item=session_id,
-                partition_key=session_id
-            )
-            session["messages"].append(message)
-            session["updatedAt"] = datetime.utcnow().isoformat()
-            await container.replace_item(item=session_id, body=session)
+            item = self._message_item(session_id, message, self._next_seq())
+            if self.message_queue.running:
+                self.message_queue.enqueue(session_id, item)
+            else:
+                await self._write_message_batch(session_id, [item])
         else:
-            if session_id not in self._mock_conversations:
+            if not await self._get_mock_session(session_id):
                 await self.create_session(session_id)
-            self._mock_conversations[session_id]["messages"].append(message)
+            await self._mock_conversations.append_message(session_id, message)
+    
+    async def _write_message_batch(self, session_id: str, items: list[dict]):
+        """Write message items and touch the session in one transactional batch."""
+        container = self.database.get_container_client(self.conversations_container)
+        # Upserts keep retries of a batch with an unknown outcome idempotent
+        operations = [("upsert", (item,)) for item in items[:99]]
+        operations.append(("patch", (session_id, [
+            {"op": "set", "path": "/updatedAt", "value": items[-1]["timestamp"]}
+        ])))
+        try:
+            await container.execute_item_batch(
+                batch_operations=operations,
+                partition_key=session_id
+            )
+        except CosmosBatchOperationError:
+            # The session document does not exist yet
+            await self._ensure_session(session_id)
+            await container.execute_item_batch(
+                batch_operations=operations,
+                partition_key=session_id
+            )
+        if len(items) > 99:
+            await self._write_message_batch(session_id, items[99:])
     
     async def get_conversation_history(self, session_id: str) -> list:
         """Get conversation history for a session."""
@@ -135,74 +345,735 @@ class CosmosService:
         if self.client:
             container = self.database.get_container_client(self.conversations_container)
             try:
-                session = await container.read_item(
-                    item=session_id,
+                # Also reads the session document, which may still embed
+                # messages or have had its messages archived
+                items = container.query_items(
+                    query="SELECT * FROM c WHERE c.type = 'message' OR c.id = @sessionId",
+                    parameters=[{"name": "@sessionId", "value": session_id}],
                     partition_key=session_id
                 )
-                return session.get("messages", [])
+                messages = []
+                found = False
+                legacy = False
+                archived = None
+                async for item in items:
+                    if item.get("type") == "message":
+                        messages.append(item)
+                        continue
+                    found = True
+                    if "messages" in item:
+                        legacy = True
+                    elif "archived" in item:
+                        archived = item
+                if not found:
+                    # The session expired; its messages are purged later
+                    messages = []
+                if legacy:
+                    await self.migrate_session(session_id)
+                    return await self.get_conversation_history(session_id)
+                if archived and await self._rehydrate_session(archived):
+                    return await self.get_conversation_history(session_id)
+                
+                # Read your own writes that are still queued
+                stored = {item["id"] for item in messages}
+                messages.extend(
+                    item for item in self.message_queue.unflushed(session_id)
+                    if item["id"] not in stored
+                )
+                messages.sort(key=lambda item: item["seq"])
+                return [self._to_message(item) for item in messages]
             except:
                 return []
         else:
-            session = self._mock_conversations.get(session_id, {})
+            session = await self._get_mock_session(session_id) or {}
             return session.get("messages", [])
     
-    async def get_order(self, order_id: str) -> Optional[dict]:
-        """Get order by ID."""
+    async def get_history_version(self, session_id: str) -> str:
+        """Get an opaque version that changes whenever messages are added.
+        
+        In Cosmos DB this is the sequence number of the newest stored
+        message, read through the index, plus the number of messages still
+        queued for writing. Unlike the session document's ETag it does not
+        change with session state updates.
+        """
         await self._ensure_initialized()
         
         if self.client:
-            container = self.database.get_container_client(self.orders_container)
+            container = self.database.get_container_client(self.conversations_container)
+            items = container.query_items(
+                query="SELECT TOP 1 VALUE c.seq FROM c WHERE c.type = 'message' ORDER BY c.seq DESC",
+                partition_key=session_id
+            )
+            last_seq = None
+            async for seq in items:
+                last_seq = seq
+            pending = len(self.message_queue.unflushed(session_id))
+            if last_seq is not None:
+                return f"{last_seq}:{pending}"
+            
+            # No message items: the session may be new, or hold legacy or
+            # archived messages to restore first
             try:
-                query = f"SELECT * FROM c WHERE c.id = @orderId"
-                items = container.query_items(
-                    query=query,
-                    parameters=[{"name": "@orderId", "value": order_id}]
+                session = await container.read_item(item=session_id, partition_key=session_id)
+            except CosmosResourceNotFoundError:
+                return f"none:{pending}"
+            if "messages" in session:
+                await self.migrate_session(session_id)
+                return await self.get_history_version(session_id)
+            if "archived" in session and await self._rehydrate_session(session):
+                return await self.get_history_version(session_id)
+            return f"0:{pending}"
+        else:
+            session = await self._get_mock_session(session_id) or {}
+            messages = session.get("messages", [])
+            return f"{len(messages)}:{messages[-1]['timestamp'] if messages else ''}"
+    
+    async def get_conversation_history_page(
+        self,
+        session_id: str,
+        limit: int = 100,
+        newest_first: bool = False,
+        since: Optional[str] = None,
+        continuation: Optional[str] = None
+    ) -> dict:
+        """Get one page of a session's messages.
+        
+        Messages are ordered oldest first, or newest first, and can be
+        limited to those after an ISO timestamp. Returns "messages" and a
+        "continuation" token for the next page, None on the last page.
+        Pages hold up to limit stored messages plus any still queued for
+        writing, which are included in the page holding the newest messages.
+        """
+        await self._ensure_initialized()
+        
+        if self.client:
+            container = self.database.get_container_client(self.conversations_container)
+            if not continuation:
+                # Messages of an expired session are not history any more;
+                # archived messages are restored before reading the first page
+                try:
+                    session = await container.read_item(item=session_id, partition_key=session_id)
+                except CosmosResourceNotFoundError:
+                    session = None
+                if session is None and not self.message_queue.unflushed(session_id):
+                    return {"messages": [], "continuation": None}
+                if session and "archived" in session and self.archive:
+                    await self._rehydrate_session(session)
+            query = "SELECT * FROM c WHERE c.type = 'message'"
+            parameters = []
+            if since:
+                query += " AND c.timestamp > @since"
+                parameters.append({"name": "@since", "value": since})
+            query += f" ORDER BY c.seq {'DESC' if newest_first else 'ASC'}"
+            
+            pages = container.query_items(
+                query=query,
+                parameters=parameters,
+                partition_key=session_id,
+                max_item_count=limit
+            ).by_page(_decode_token(continuation) if continuation else None)
+            items = []
+            async for page in pages:
+                items = [item async for item in page]
+                break
+            next_token = pages.continuation_token
+            
+            # Queued messages are newer than every stored one
+            newest_page = not continuation if newest_first else not next_token
+            if newest_page:
+                stored = {item["id"] for item in items}
+                items.extend(
+                    item for item in self.message_queue.unflushed(session_id)
+                    if item["id"] not in stored and (not since or item["timestamp"] > since)
                 )
-                async for item in items:
-                    return item
-                return None
+                items.sort(key=lambda item: item["seq"], reverse=newest_first)
+            return {
+                "messages": [self._to_message(item) for item in items],
+                "continuation": _encode_token(next_token) if next_token else None
+            }
+        else:
+            session = await self._get_mock_session(session_id) or {}
+            messages = session.get("messages", [])
+            if since:
+                messages = [m for m in messages if m["timestamp"] > since]
+            if newest_first:
+                messages = messages[::-1]
+            try:
+                offset = int(_decode_token(continuation)) if continuation else 0
+            except ValueError:
+                raise ValueError("Invalid continuation token")
+            end = offset + limit
+            return {
+                "messages": messages[offset:end],
+                "continuation": _encode_token(str(end)) if end < len(messages) else None
+            }
+    
+    async def stream_conversation_history(
+        self,
+        session_id: str,
+        page_size: int = 100,
+        newest_first: bool = False,
+        since: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """Yield a session's messages page by page without loading all of them."""
+        continuation = None
+        while True:
+            page = await self.get_conversation_history_page(
+                session_id,
+                limit=page_size,
+                newest_first=newest_first,
+                since=since,
+                continuation=continuation
+            )
+            for message in page["messages"]:
+                yield message
+            continuation = page["continuation"]
+            if not continuation:
+                return
+    
+    async def migrate_session(self, session_id: str) -> int:
+        """Move messages embedded in a legacy session document to items.
+        
+        Idempotent: message items get deterministic IDs and the embedded
+        array is only removed once every message has been written.
+        Returns the number of migrated messages.
+        """
+        await self._ensure_initialized()
+        
+        if not self.client:
+            return 0
+        
+        container = self.database.get_container_client(self.conversations_container)
+        try:
+            session = await container.read_item(item=session_id, partition_key=session_id)
+        except CosmosResourceNotFoundError:
+            return 0
+        
+        if "messages" not in session:
+            return 0
+        
+        legacy = session["messages"]
+        created_at = datetime.fromisoformat(session["createdAt"]).replace(tzinfo=timezone.utc)
+        base = int(created_at.timestamp() * 1e9)
+        items = [
+            self._message_item(session_id, message, base + i, item_id=f"msg-legacy-{i:06d}")
+            for i, message in enumerate(legacy)
+        ]
+        # Transactional batches are limited to 100 operations
+        for start in range(0, len(items), 100):
+            await container.execute_item_batch(
+                batch_operations=[("upsert", (item,)) for item in items[start:start + 100]],
+                partition_key=session_id
+            )
+        await container.patch_item(
+            item=session_id,
+            partition_key=session_id,
+            patch_operations=[
+                {"op": "remove", "path": "/messages"},
+                {"op": "set", "path": "/type", "value": "session"}
+            ]
+        )
+        logger.info(f"Migrated {len(items)} messages of session {session_id}")
+        return len(items)
+    
+    async def _get_mock_session(self, session_id: str) -> Optional[dict]:
+        """Get a mock session, restoring its messages if it was archived."""
+        session = await self._mock_conversations.get(session_id)
+        if session is None or "archived" not in session:
+            return session
+        
+        marker = session["archived"]
+        loaded = await self.archive.load(marker) if self.archive else None
+        if loaded is None:
+            logger.error(f"Archive {marker['blob']} of session {session_id} is not available")
+            return None
+        _, items = loaded
+        session = {key: value for key, value in session.items() if key != "archived"}
+        session["messages"] = items
+        await self._mock_conversations.put(session_id, session)
+        await self.archive.delete(marker)
+        logger.info(f"Rehydrated session {session_id} with {len(items)} messages")
+        return session
+    
+    async def _rehydrate_session(self, session: dict) -> bool:
+        """Restore the messages of an archived session document.
+        
+        Idempotent like migrate_session: message items keep their IDs and
+        the archive marker is only removed once all of them are written.
+        Returns whether the session was restored.
+        """
+        session_id = session["id"]
+        marker = session["archived"]
+        loaded = await self.archive.load(marker) if self.archive else None
+        if loaded is None:
+            logger.error(f"Archive {marker['blob']} of session {session_id} is not available")
+            return False
+        
+        _, items = loaded
+        # Items archived before message items stopped expiring on their own
+        items = [{**item, "ttl": -1} for item in items]
+        container = self.database.get_container_client(self.conversations_container)
+        for start in range(0, len(items), 100):
+            await container.execute_item_batch(
+                batch_operations=[("upsert", (item,)) for item in items[start:start + 100]],
+                partition_key=session_id
+            )
+        try:
+            await container.patch_item(
+                item=session_id,
+                partition_key=session_id,
+                patch_operations=[{"op": "remove", "path": "/archived"}],
+                filter_predicate="FROM c WHERE IS_DEFINED(c.archived)"
+            )
+        except CosmosAccessConditionFailedError:
+            # Restored concurrently by another request
+            return True
+        await self.archive.delete(marker)
+        logger.info(f"Rehydrated session {session_id} with {len(items)} messages")
+        return True
+    
+    async def purge_expired_messages(self, limit: int = 1000) -> int:
+        """Delete the message items of sessions whose document has expired.
+        
+        Message items do not expire themselves; this removes those left
+        behind once the container TTL has removed their session document.
+        Returns the number of sessions purged.
+        """
+        await self._ensure_initialized()
+        
+        if not self.client:
+            return 0
+        
+        container = self.database.get_container_client(self.conversations_container)
+        properties = await container.read()
+        ttl = properties.get("defaultTtl")
+        if not ttl or ttl < 0:
+            return 0
+        
+        # Only sessions whose last message is older than the TTL can have expired
+        cutoff = int(time.time()) - ttl
+        session_ids = container.query_items(
+            query=(
+                "SELECT DISTINCT VALUE c.sessionId FROM c "
+                "WHERE c.type = 'message' AND c._ts < @cutoff "
+                "OFFSET 0 LIMIT @limit"
+            ),
+            parameters=[
+                {"name": "@cutoff", "value": cutoff},
+                {"name": "@limit", "value": limit}
+            ]
+        )
+        purged = 0
+        async for session_id in session_ids:
+            try:
+                await container.read_item(item=session_id, partition_key=session_id)
+                continue
+            except CosmosResourceNotFoundError:
+                pass
+            item_ids = [
+                item_id async for item_id in container.query_items(
+                    query="SELECT VALUE c.id FROM c WHERE c.type = 'message'",
+                    partition_key=session_id
+                )
+            ]
+            for start in range(0, len(item_ids), 100):
+                await container.execute_item_batch(
+                    batch_operations=[("delete", (item_id,)) for item_id in item_ids[start:start + 100]],
+                    partition_key=session_id
+                )
+            purged += 1
+        logger.info(f"Purged the messages of {purged} expired sessions")
+        return purged
+    
+    async def list_idle_sessions(self, idle_days: Optional[float] = None, limit: int = 1000) -> list[str]:
+        """Get IDs of unarchived sessions not updated for idle_days."""
+        await self._ensure_initialized()
+        
+        idle_days = self.archive_idle_days if idle_days is None else idle_days
+        cutoff = (datetime.utcnow() - timedelta(days=idle_days)).isoformat()
+        
+        if self.client:
+            container = self.database.get_container_client(self.conversations_container)
+            items = container.query_items(
+                query=(
+                    "SELECT VALUE c.id FROM c WHERE c.type = 'session' "
+                    "AND c.updatedAt < @cutoff AND NOT IS_DEFINED(c.archived) "
+                    "OFFSET 0 LIMIT @limit"
+                ),
+                parameters=[
+                    {"name": "@cutoff", "value": cutoff},
+                    {"name": "@limit", "value": limit}
+                ]
+            )
+            return [session_id async for session_id in items]
+        else:
+            idle = []
+            sessions = self._mock_conversations.sessions() + await self._mock_conversations.spilled_sessions()
+            for session_id, session in sessions:
+                if "archived" in session:
+                    continue
+                messages = session.get("messages", [])
+                updated = messages[-1]["timestamp"] if messages else session["updatedAt"]
+                if updated < cutoff:
+                    idle.append(session_id)
+            return idle[:limit]
+    
+    async def archive_session(self, session_id: str) -> bool:
+        """Move a session's messages to the archive, returning whether it was archived.
+        
+        The session document stays in Cosmos DB with its state and an
+        "archived" marker naming the blob, so the session can still be
+        resumed and its messages are restored on the next history read.
+        """
+        await self._ensure_initialized()
+        
+        if not self.archive:
+            raise RuntimeError("No session archive is configured")
+        
+        if not self.client:
+            session = await self._mock_conversations.get(session_id)
+            if session is None or "archived" in session:
+                return False
+            messages = session.get("messages", [])
+            stub = {key: value for key, value in session.items() if key != "messages"}
+            marker = await self.archive.save(stub, messages)
+            # Keep the session with a marker, so only archived sessions are
+            # looked up in the archive
+            stub["archived"] = {
+                **marker,
+                "archivedAt": datetime.utcnow().isoformat(),
+                "messageCount": len(messages)
+            }
+            await self._mock_conversations.put(session_id, stub)
+            return True
+        
+        await self.migrate_session(session_id)
+        container = self.database.get_container_client(self.conversations_container)
+        try:
+            session = await container.read_item(item=session_id, partition_key=session_id)
+        except CosmosResourceNotFoundError:
+            return False
+        if "archived" in session:
+            return False
+        
+        items = [
+            item async for item in container.query_items(
+                query="SELECT * FROM c WHERE c.type = 'message'",
+                partition_key=session_id
+            )
+        ]
+        marker = await self.archive.save(session, items)
+        
+        stub = {
+            key: session[key]
+            for key in ("id", "sessionId", "type", "state", "createdAt", "updatedAt")
+            if key in session
+        }
+        stub["archived"] = {
+            **marker,
+            "archivedAt": datetime.utcnow().isoformat(),
+            "messageCount": len(items)
+        }
+        try:
+            # Every message write touches the session document, so the ETag
+            # check fails if messages were added since they were read
+            await container.replace_item(
+                item=session_id,
+                body=stub,
+                etag=session["_etag"],
+                match_condition=MatchConditions.IfNotModified
+            )
+        except CosmosAccessConditionFailedError:
+            await self.archive.delete(marker)
+            return False
+        
+        for start in range(0, len(items), 100):
+            await container.execute_item_batch(
+                batch_operations=[("delete", (item["id"],)) for item in items[start:start + 100]],
+                partition_key=session_id
+            )
+        logger.info(f"Archived session {session_id} with {len(items)} messages to {marker['blob']}")
+        return True
+    
+    async def get_session_state(self, session_id: str) -> dict:
+        """Get orchestration state persisted with a session."""
+        await self._ensure_initialized()
+        
+        if self.client:
+            container = self.database.get_container_client(self.conversations_container)
+            try:
+                session = await container.read_item(
+                    item=session_id,
+                    partition_key=session_id
+                )
+                return session.get("state", {})
             except:
-                return None
+                return {}
+        else:
+            session = await self._get_mock_session(session_id) or {}
+            return session.get("state", {})
+    
+    async def update_session_state(self, session_id: str, **fields) -> dict:
+        """Merge fields into the orchestration state of a session.
+        
+        Uses a partial document update so concurrent updates of different
+        fields do not overwrite each other.
+        """
+        await self._ensure_initialized()
+        
+        if self.client:
+            container = self.database.get_container_client(self.conversations_container)
+            operations = [
+                {"op": "set", "path": f"/state/{key}", "value": value}
+                for key, value in fields.items()
+            ]
+            operations.append(
+                {"op": "set", "path": "/updatedAt", "value": datetime.utcnow().isoformat()}
+            )
+            try:
+                session = await container.patch_item(
+                    item=session_id,
+                    partition_key=session_id,
+                    patch_operations=operations
+                )
+            except CosmosResourceNotFoundError:
+                await self._ensure_session(session_id)
+                session = await container.patch_item(
+                    item=session_id,
+                    partition_key=session_id,
+                    patch_operations=operations
+                )
+            except CosmosHttpResponseError as e:
+                if e.status_code != 400:
+                    raise
+                # Older session documents have no state object to patch into
+                operations = [{"op": "set", "path": "/state", "value": fields}] + operations[-1:]
+                session = await container.patch_item(
+                    item=session_id,
+                    partition_key=session_id,
+                    patch_operations=operations
+                )
+            return session.get("state", {})
         else:
-            return self._mock_orders.get(order_id)
+            if not await self._get_mock_session(session_id):
+                await self.create_session(session_id)
+            return await self._mock_conversations.update_state(session_id, fields)
+    
+    async def acquire_session_lease(self, session_id: str, owner: str, duration: float) -> bool:
+        """Take or renew the turn lease of a session, returning whether owner holds it.
+        
+        The lease is set by a conditional patch of the session document, so
+        only one replica can hold an unexpired lease at a time.
+        """
+        await self._ensure_initialized()
+        
+        if not self.client:
+            # A single process is already serialized by its in-process lock
+            return True
+        
+        container = self.database.get_container_client(self.conversations_container)
+        now = time.time()
+        try:
+            await container.patch_item(
+                item=session_id,
+                partition_key=session_id,
+                patch_operations=[
+                    {"op": "set", "path": "/lease", "value": {"owner": owner, "expiresAt": now + duration}}
+                ],
+                filter_predicate=(
+                    f"FROM c WHERE NOT IS_DEFINED(c.lease) OR c.lease.expiresAt < {now} "
+                    f"OR c.lease.owner = '{owner}'"
+                )
+            )
+            return True
+        except CosmosAccessConditionFailedError:
+            return False
+        except CosmosResourceNotFoundError:
+            await self._ensure_session(session_id)
+            return await self.acquire_session_lease(session_id, owner, duration)
+    
+    async def release_session_lease(self, session_id: str, owner: str):
+        """Release a session's turn lease if owner still holds it."""
+        if not self.client:
+            return
+        
+        container = self.database.get_container_client(self.conversations_container)
+        try:
+            await container.patch_item(
+                item=session_id,
+                partition_key=session_id,
+                patch_operations=[{"op": "remove", "path": "/lease"}],
+                filter_predicate=f"FROM c WHERE c.lease.owner = '{owner}'"
+            )
+        except (CosmosAccessConditionFailedError, CosmosResourceNotFoundError):
+            pass
+    
+    def get_metrics(self) -> dict:
+        """Get Cosmos DB service counters."""
+        metrics = {
+            "write_behind": self.message_queue.get_metrics(),
+            "order_cache": self.order_cache.get_metrics(),
+        }
+        if not self.client:
+            metrics["session_store"] = self._mock_conversations.get_metrics()
+        if self.archive:
+            metrics["archive"] = self.archive.get_metrics()
+        if self.order_feeds:
+            metrics["change_feeds"] = {feed.name: feed.get_metrics() for feed in self.order_feeds}
+        return metrics
+    
+    async def get_order(self, order_id: str, customer_id: Optional[str] = None) -> Optional[dict]:
+        """Get order by ID.
+        
+        Orders are served through a short-lived cache, and concurrent
+        lookups of the same order share a single read. The orders container
+        is partitioned by /customerId, so orders whose customer is known
+        (e.g. from the email index) are point reads and others are found
+        by a query on their ID.
+        """
+        await self._ensure_initialized()
+        return await self.order_cache.get_or_load(
+            order_id,
+            lambda: self._read_order(order_id, customer_id)
+        )
+    
+    async def _read_order(self, order_id: str, customer_id: Optional[str] = None) -> Optional[dict]:
+        if not self.client:
+            return await self.local_store.get_order(order_id)
+        
+        container = self.database.get_container_client(self.orders_container)
+        try:
+            if customer_id:
+                return await container.read_item(item=order_id, partition_key=customer_id)
+            items = container.query_items(
+                query="SELECT * FROM c WHERE c.id = @orderId",
+                parameters=[{"name": "@orderId", "value": order_id}]
+            )
+            async for item in items:
+                return item
+            return None
+        except CosmosResourceNotFoundError:
+            return None
+        except CosmosHttpResponseError as e:
+            logger.error(f"Failed to read order {order_id}: {e}")
+            return None
+    
+    async def _refresh_cached_orders(self, orders: list[dict]):
+        """Replace cached orders with the versions from the change feed."""
+        for order in orders:
+            self.order_cache.refresh(order["id"], order)
+    
+    async def _apply_local_orders(self, orders: list[dict]):
+        """Apply changes of the local orders file to the local store."""
+        await self.local_store.put_orders([
+            {k: v for k, v in order.items() if k != "_ts"} for order in orders
+        ])
+    
+    async def _index_order_emails(self, orders: list[dict]):
+        """Add changed orders to the email -> order IDs index."""
+        by_email = defaultdict(list)
+        for order in orders:
+            if order.get("email"):
+                by_email[email_key(order["email"])].append((order["id"], order.get("customerId")))
+        
+        container = self.database.get_container_client(self.order_emails_container)
+        await asyncio.gather(*(
+            self._add_email_orders(container, key, order_keys)
+            for key, order_keys in by_email.items()
+        ))
+    
+    async def _add_email_orders(self, container, key: str, order_keys: list[tuple]):
+        try:
+            entry = await container.read_item(item=key, partition_key=key)
+        except CosmosResourceNotFoundError:
+            entry = {"id": key, "orderIds": []}
+        
+        # Customer IDs are the orders' partition keys, for point reads
+        customer_ids = entry.setdefault("customerIds", {})
+        changed = False
+        for order_id, customer_id in order_keys:
+            if order_id not in entry["orderIds"]:
+                entry["orderIds"].append(order_id)
+                changed = True
+            if customer_id and customer_ids.get(order_id) != customer_id:
+                customer_ids[order_id] = customer_id
+                changed = True
+        if changed:
+            entry["updatedAt"] = datetime.now(timezone.utc).isoformat()
+            await container.upsert_item(body=entry)
+    
+    async def _get_email_orders(self, email: str) -> list[tuple]:
+        """Get the indexed (order ID, customer ID) pairs of an email, oldest first."""
+        if not self.client:
+            order_ids = await self.local_store.get_order_ids_by_email(email, self.lookup_max_orders)
+            return [(order_id, None) for order_id in order_ids]
+        
+        key = email_key(email)
+        container = self.database.get_container_client(self.order_emails_container)
+        try:
+            entry = await container.read_item(item=key, partition_key=key)
+        except CosmosResourceNotFoundError:
+            return []
+        customer_ids = entry.get("customerIds", {})
+        return [(order_id, customer_ids.get(order_id)) for order_id in entry["orderIds"]]
     
     async def lookup_order(
         self,
         order_id: Optional[str] = None,
-        email: Optional[str] = None
+        email: Optional[str] = None,
+        fields: Optional[list[str]] = None
     ) -> dict:
-        """Look up order by ID or email."""
+        """Look up order by ID or email.
+        
+        With fields only those fields of each order are returned. The
+        email query projects them in Cosmos DB; reads by ID always return
+        whole documents, which are cached and projected afterwards.
+        """
         await self._ensure_initialized()
         
         if order_id:
             order = await self.get_order(order_id)
             if order:
-                return {"found": True, "order": order}
+                return {"found": True, "order": project(order, fields)}
             return {"found": False, "message": f"Order {order_id} not found"}
         
         if email:
-            # Search by email
-            if self.client:
+            if not self.client or self.email_index_enabled:
+                # One index read plus a bounded batch of cached point reads
+                order_keys = await self._get_email_orders(email)
+                orders = await asyncio.gather(*(
+                    self.get_order(order_id, customer_id)
+                    for order_id, customer_id in order_keys[-self.lookup_max_orders:]
+                ))
+                # Skip orders whose email changed since they were indexed
+                orders = [
+                    project(o, fields) for o in orders
+                    if o and email_key(o.get("email", "")) == email_key(email)
+                ]
+                return {"found": len(orders) > 0, "orders": orders}
+            else:
+                # Search by email
                 container = self.database.get_container_client(self.orders_container)
-                query = "SELECT * FROM c WHERE c.email = @email"
+                query = f"{cosmos_select(fields)} FROM c WHERE c.email = @email"
                 items = container.query_items(
                     query=query,
                     parameters=[{"name": "@email", "value": email}]
                 )
                 orders = [item async for item in items]
-                return {"found": len(orders) > 0, "orders": orders}
-            else:
-                orders = [
-                    o for o in self._mock_orders.values()
-                    if o.get("email") == email
-                ]
+                if fields is None:
+                    # Only whole documents can serve later lookups by ID
+                    for order in orders:
+                        self.order_cache.set(order["id"], order)
                 return {"found": len(orders) > 0, "orders": orders}
         
         return {"found": False, "message": "Please provide order ID or email"}
     
-    async def track_delivery(self, order_id: str) -> dict:
-        """Get delivery tracking information."""
-        order = await self.get_order(order_id)
+    async def track_delivery(self, order_id: str, order: Optional[dict] = None) -> dict:
+        """Get delivery tracking information.
+        
+        An already fetched order can be passed to skip the lookup.
+        """
+        order = order or await self.get_order(order_id)
         
         if not order:
             return {"found": False, "message": f"Order {order_id} not found"}
@@ -227,9 +1098,17 @@ class CosmosService:
         
         return tracking_info
     
-    async def initiate_return(self, order_id: str, reason: str) -> dict:
-        """Initiate a return request."""
-        order = await self.get_order(order_id)
+    async def initiate_return(
+        self,
+        order_id: str,
+        reason: str,
+        order: Optional[dict] = None
+    ) -> dict:
+        """Initiate a return request.
+        
+        An already fetched order can be passed to skip the lookup.
+        """
+        order = order or await self.get_order(order_id)
         
         if not order:
             return {"success": False, "message": f"Order {order_id} not found"}
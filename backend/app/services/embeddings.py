@@ -0,0 +1,135 @@
+"""Text embeddings for hybrid product retrieval.
+
+Azure OpenAI embeddings are used when an endpoint is configured. The local
+hashing embedder needs no service: it hashes words and character trigrams
+into a fixed number of dimensions, so it is deterministic and fast enough
+to embed large synthetic catalogs offline, but only captures lexical and
+spelling similarity rather than meaning.
+"""
+
+import os
+import zlib
+import logging
+from typing import Optional
+
+import aiohttp
+import numpy as np
+from azure.identity.aio import DefaultAzureCredential
+
+from services.product_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+
+def embedding_text(product: dict) -> str:
+    """Text of a product that is embedded for vector search."""
+    parts = [
+        product.get("name", ""),
+        product.get("category", ""),
+        " ".join(product.get("benefits") or []),
+        product.get("description", ""),
+    ]
+    return ". ".join(part for part in parts if part)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so inner products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HashingEmbedder:
+    """Deterministic local embedder based on feature hashing."""
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed_one(self, text: str, out: np.ndarray):
+        for word in tokenize(text):
+            features = [(word, 1.0)]
+            padded = f"<{word}>"
+            features.extend((padded[i:i + 3], 0.5) for i in range(len(padded) - 2))
+            for feature, weight in features:
+                h = zlib.crc32(feature.encode("utf-8"))
+                out[h % self.dimensions] += weight if h & 0x80000000 else -weight
+
+    def embed_sync(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            self._embed_one(text, vectors[row])
+        return normalize_rows(vectors)
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        return self.embed_sync(texts)
+
+    async def close(self):
+        pass
+
+
+class AzureOpenAIEmbedder:
+    """Embeddings from an Azure OpenAI deployment, authenticated with Entra ID."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        deployment: str,
+        dimensions: int,
+        api_version: str = "2024-06-01",
+        batch_size: int = 256
+    ):
+        self.url = (
+            f"{endpoint.rstrip('/')}/openai/deployments/{deployment}/embeddings"
+            f"?api-version={api_version}"
+        )
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.credential = DefaultAzureCredential()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        token = await self.credential.get_token(COGNITIVE_SERVICES_SCOPE)
+
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            async with self._session.post(
+                self.url,
+                json={"input": texts[start:start + self.batch_size], "dimensions": self.dimensions},
+                headers={"Authorization": f"Bearer {token.token}"}
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+            embeddings.extend(
+                item["embedding"] for item in sorted(data["data"], key=lambda item: item["index"])
+            )
+        return normalize_rows(np.array(embeddings, dtype=np.float32))
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+        await self.credential.close()
+
+
+def create_embedder():
+    """Create the embedder selected by EMBEDDING_BACKEND (azure or local).
+
+    Defaults to Azure OpenAI when OPENAI_ENDPOINT is set.
+    """
+    endpoint = os.getenv("OPENAI_ENDPOINT")
+    backend = os.getenv("EMBEDDING_BACKEND", "azure" if endpoint else "local").lower()
+
+    if backend == "azure" and endpoint:
+        return AzureOpenAIEmbedder(
+            endpoint,
+            os.getenv("EMBEDDING_DEPLOYMENT", "text-embedding-3-small"),
+            int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+        )
+    if backend not in ("azure", "local"):
+        logger.warning(f"Unknown EMBEDDING_BACKEND {backend}, using local")
+    elif backend == "azure":
+        logger.warning("OPENAI_ENDPOINT not set, using local embeddings")
+    return HashingEmbedder(int(os.getenv("EMBEDDING_DIMENSIONS", "256")))
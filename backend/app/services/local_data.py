@@ -0,0 +1,89 @@
+"""Loading of the sample data files into the service schema.
+
+The files under data/ use snake_case field names (customer_email,
+tracking_number, unit_price, ...) while the services and agent tools use
+the camelCase schema of the Cosmos DB documents. The loaders here map one
+onto the other so local data behaves like the cloud data.
+"""
+
+import json
+import re
+from functools import lru_cache
+
+# Sample data fields whose service name is not just the camelCase spelling
+ORDER_FIELDS = {
+    "customer_email": "email",
+    "created_at": "orderDate",
+    "delivered_at": "deliveredDate",
+}
+
+ITEM_FIELDS = {
+    "product_name": "name",
+    "unit_price": "price",
+}
+
+
+@lru_cache(maxsize=256)
+def camel_case(name: str) -> str:
+    """Convert a snake_case field name to camelCase."""
+    return re.sub(r"_([a-z0-9])", lambda m: m.group(1).upper(), name)
+
+
+def normalize_order(raw: dict) -> dict:
+    """Map an order from the sample data schema to the service schema."""
+    order = {}
+    for key, value in raw.items():
+        name = ORDER_FIELDS.get(key, camel_case(key))
+        if key == "items":
+            value = [
+                {ITEM_FIELDS.get(k, camel_case(k)): v for k, v in item.items()}
+                for item in value
+            ]
+        elif key in ("created_at", "delivered_at"):
+            # The tools report dates, not timestamps
+            value = value[:10]
+        order[name] = value
+    return order
+
+
+def load_orders(path: str) -> list[dict]:
+    """Load and normalize the orders of a JSON array file."""
+    with open(path, encoding="utf-8") as f:
+        return [normalize_order(order) for order in json.load(f)]
+
+
+# Product subcategories by the category used in search filters
+PRODUCT_CATEGORIES = {
+    "shampoo": ("Shampoo", "Conditioner", "Styling"),
+    "detergent": ("Laundry",),
+    "cleaner": ("Cleaning",),
+    "soap": ("Bar Soap", "Body Wash", "Body Scrub", "Hand Soap", "Cleanser"),
+}
+
+PRODUCT_FIELDS = {
+    "category": "department",
+    "features": "benefits",
+}
+
+
+def product_category(subcategory: str) -> str:
+    """Search filter category of a product subcategory."""
+    for category, subcategories in PRODUCT_CATEGORIES.items():
+        if subcategory in subcategories:
+            return category
+    return subcategory.lower().replace(" ", "-")
+
+
+def normalize_product(raw: dict) -> dict:
+    """Map a product from the sample data schema to the service schema."""
+    product = {PRODUCT_FIELDS.get(k, camel_case(k)): v for k, v in raw.items()}
+    product["category"] = product_category(raw.get("subcategory", raw.get("category", "")))
+    if isinstance(product.get("ingredients"), str):
+        product["ingredients"] = [i.strip() for i in product["ingredients"].split(",")]
+    return product
+
+
+def load_products(path: str) -> list[dict]:
+    """Load and normalize the products of a JSON array file."""
+    with open(path, encoding="utf-8") as f:
+        return [normalize_product(product) for product in json.load(f)]
@@ -0,0 +1,361 @@
+"""Local data backends used when Cosmos DB or Azure AI Search is not configured.
+
+The in-memory store serves the built-in mock data or small data files. The
+SQLite store keeps orders and products in indexed tables, so datasets with
+millions of orders (see backend/scripts/generate_data.py) can be served and
+profiled through the same code paths without Azure.
+"""
+
+import os
+import json
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+
+from services.local_data import load_orders, load_products
+from services.product_index import ProductIndex
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    email TEXT,
+    customer_id TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_email ON orders (email);
+CREATE INDEX IF NOT EXISTS orders_customer ON orders (customer_id);
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    category TEXT,
+    name TEXT NOT NULL,
+    search_text TEXT NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_category ON products (category);
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def searchable_text(product: dict) -> str:
+    """Text of a product stored with it for ad-hoc queries of the database."""
+    return " ".join([
+        product["name"],
+        product.get("description", ""),
+        " ".join(product.get("ingredients", [])),
+        " ".join(product.get("benefits", [])),
+    ]).lower()
+
+
+class InMemoryStore:
+    """Orders and products held in dictionaries."""
+
+    def __init__(self, orders: list[dict], products: list[dict]):
+        self._orders = {}
+        self._orders_by_email = defaultdict(list)
+        self._put_orders(orders)
+        self._set_products(products)
+
+    def _set_products(self, products: Iterable[dict]):
+        self._products = list(products)
+        self._products_by_id = {product["id"]: product for product in self._products}
+        self._index = ProductIndex(self._products)
+
+    def add_defaults(self, orders: list[dict] = (), products: list[dict] = ()):
+        """Serve these orders and products unless the store already holds some."""
+        if orders and not self._orders:
+            self._put_orders(orders)
+        if products and not self._products:
+            self._set_products(products)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _put_orders(self, orders: Iterable[dict]):
+        for order in orders:
+            self._orders[order["id"]] = order
+            if order.get("email"):
+                order_ids = self._orders_by_email[normalize_email(order["email"])]
+                if order["id"] not in order_ids:
+                    order_ids.append(order["id"])
+
+    async def get_order(self, order_id: str) -> Optional[dict]:
+        return self._orders.get(order_id)
+
+    async def get_order_ids_by_email(self, email: str, limit: int) -> list[str]:
+        """Get the most recent order IDs of an email, oldest first."""
+        return self._orders_by_email.get(normalize_email(email), [])[-limit:]
+
+    async def put_orders(self, orders: list[dict]):
+        self._put_orders(orders)
+
+    async def get_product(self, product_id: str) -> Optional[dict]:
+        return self._products_by_id.get(product_id)
+
+    async def list_products(self, top: int, skip: int = 0) -> list[dict]:
+        return self._products[skip:skip + top]
+
+    async def get_products(self, product_ids: list[str]) -> list[dict]:
+        """Get products in the order of their IDs, skipping unknown IDs."""
+        return [self._products_by_id[i] for i in product_ids if i in self._products_by_id]
+
+    async def rank_products(self, query: str, category: Optional[str], top: int) -> list[str]:
+        """IDs of the products matching a query, best first."""
+        return [product_id for product_id, _ in self._index.search(query, category, top)]
+
+    async def search_products(self, query: str, category: Optional[str], top: int) -> list[dict]:
+        """Rank products with the BM25 index, falling back to the category's products."""
+        product_ids = await self.rank_products(query, category, top)
+        if product_ids:
+            return await self.get_products(product_ids)
+
+        # If no results, return top products from category or all
+        if category:
+            results = [p for p in self._products if p["category"] == category]
+        else:
+            results = self._products
+        return results[:top]
+
+    def product_names(self) -> list[str]:
+        return [product["name"] for product in self._products]
+
+
+class SQLiteStore:
+    """Orders and products in an indexed SQLite database.
+
+    Queries run in worker threads over one shared connection. The database
+    is seeded on open from the data files, or from the defaults when its
+    tables are empty.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        orders: list[dict] = (),
+        products: list[dict] = (),
+        orders_path: Optional[str] = None,
+        products_path: Optional[str] = None
+    ):
+        self.path = path
+        self.default_orders = orders
+        self.default_products = products
+        self.orders_path = orders_path
+        self.products_path = products_path
+        self._conn: sqlite3.Connection = None
+        self._lock = threading.Lock()
+        self._open_lock = asyncio.Lock()
+        self._names: list[str] = []
+        self._index = ProductIndex()
+
+    def add_defaults(self, orders: list[dict] = (), products: list[dict] = ()):
+        """Seed empty tables with these orders and products when opened."""
+        if orders:
+            self.default_orders = orders
+        if products:
+            self.default_products = products
+
+    def connect(self):
+        """Open the database and create the schema."""
+        if self._conn:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    async def open(self):
+        """Connect and seed the database."""
+        async with self._open_lock:
+            if self._conn:
+                return
+            await asyncio.to_thread(self._open)
+
+    def _open(self):
+        self.connect()
+        if self.orders_path:
+            self._load_source("orders", self.orders_path, lambda path: self.bulk_load(orders=load_orders(path)))
+        elif not self._count("orders"):
+            self.bulk_load(orders=self.default_orders)
+        if self.products_path:
+            self._load_source("products", self.products_path, lambda path: self.bulk_load(products=load_products(path)))
+        elif not self._count("products"):
+            self.bulk_load(products=self.default_products)
+
+        self._names = [row[0] for row in self._conn.execute("SELECT name FROM products")]
+        self._index = ProductIndex(
+            json.loads(row[0]) for row in self._conn.execute("SELECT doc FROM products ORDER BY rowid")
+        )
+        logger.info(
+            f"SQLite data store {self.path}: {self._count('orders')} orders, "
+            f"{len(self._names)} products"
+        )
+
+    def _load_source(self, table: str, path: str, load: Callable[[str], None]):
+        """Bulk load a data file unless this version of it was loaded before."""
+        stat = os.stat(path)
+        name = f"{table}:{os.path.abspath(path)}"
+        row = self._conn.execute("SELECT mtime_ns, size FROM sources WHERE name = ?", (name,)).fetchone()
+        if row == (stat.st_mtime_ns, stat.st_size):
+            logger.info(f"{path} is already loaded into {self.path}")
+            return
+        load(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                (name, stat.st_mtime_ns, stat.st_size)
+            )
+
+    async def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _count(self, table: str) -> int:
+        return self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def bulk_load(
+        self,
+        orders: Iterable[dict] = (),
+        products: Iterable[dict] = (),
+        batch_size: int = 10000
+    ):
+        """Upsert normalized orders and products in batched transactions."""
+        def batches(rows):
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        order_rows = (
+            (o["id"], normalize_email(o.get("email", "")), o.get("customerId"), json.dumps(o))
+            for o in orders
+        )
+        product_rows = (
+            (p["id"], p.get("category"), p["name"], searchable_text(p), json.dumps(p))
+            for p in products
+        )
+        with self._lock:
+            for batch in batches(order_rows):
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?)", batch
+                    )
+            for batch in batches(product_rows):
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)", batch
+                    )
+
+    async def _query(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        def run():
+            with self._lock:
+                return self._conn.execute(sql, parameters).fetchall()
+        return await asyncio.to_thread(run)
+
+    async def get_order(self, order_id: str) -> Optional[dict]:
+        rows = await self._query("SELECT doc FROM orders WHERE id = ?", (order_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def get_order_ids_by_email(self, email: str, limit: int) -> list[str]:
+        """Get the most recent order IDs of an email, oldest first."""
+        rows = await self._query(
+            # rowid changes whenever an order is replaced, so order by date
+            "SELECT id FROM orders WHERE email = ? "
+            "ORDER BY json_extract(doc, '$.orderDate') DESC, id DESC LIMIT ?",
+            (normalize_email(email), limit)
+        )
+        return [row[0] for row in reversed(rows)]
+
+    async def put_orders(self, orders: list[dict]):
+        await asyncio.to_thread(self.bulk_load, orders=orders)
+
+    async def get_product(self, product_id: str) -> Optional[dict]:
+        rows = await self._query("SELECT doc FROM products WHERE id = ?", (product_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def list_products(self, top: int, skip: int = 0) -> list[dict]:
+        rows = await self._query(
+            "SELECT doc FROM products ORDER BY rowid LIMIT ? OFFSET ?", (top, skip)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    async def get_products(self, product_ids: list[str]) -> list[dict]:
+        """Get products in the order of their IDs, skipping unknown IDs."""
+        if not product_ids:
+            return []
+        rows = await self._query(
+            f"SELECT id, doc FROM products WHERE id IN ({', '.join('?' for _ in product_ids)})",
+            tuple(product_ids)
+        )
+        docs = dict(rows)
+        return [json.loads(docs[i]) for i in product_ids if i in docs]
+
+    async def rank_products(self, query: str, category: Optional[str], top: int) -> list[str]:
+        """IDs of the products matching a query, best first."""
+        return [product_id for product_id, _ in self._index.search(query, category, top)]
+
+    async def search_products(self, query: str, category: Optional[str], top: int) -> list[dict]:
+        """Rank products with the BM25 index, falling back to the category's products."""
+        product_ids = await self.rank_products(query, category, top)
+        if product_ids:
+            return await self.get_products(product_ids)
+
+        if category:
+            rows = await self._query(
+                "SELECT doc FROM products WHERE category = ? ORDER BY rowid LIMIT ?",
+                (category, top)
+            )
+        else:
+            rows = await self._query(
+                "SELECT doc FROM products ORDER BY rowid LIMIT ?", (top,)
+            )
+        return [json.loads(row[0]) for row in rows]
+
+    def product_names(self) -> list[str]:
+        return self._names
+
+
+def create_local_store(orders: list[dict] = (), products: list[dict] = ()):
+    """Create the local data backend selected by LOCAL_DATA_BACKEND.
+
+    The given orders and products are used unless LOCAL_ORDERS_PATH or
+    LOCAL_PRODUCTS_PATH point at data files such as data/orders.json.
+    """
+    backend = os.getenv("LOCAL_DATA_BACKEND", "memory").lower()
+    orders_path = os.getenv("LOCAL_ORDERS_PATH")
+    products_path = os.getenv("LOCAL_PRODUCTS_PATH")
+
+    if backend == "sqlite":
+        return SQLiteStore(
+            os.getenv("LOCAL_DATA_DB", ":memory:"),
+            orders=orders,
+            products=products,
+            orders_path=orders_path,
+            products_path=products_path
+        )
+    if backend != "memory":
+        logger.warning(f"Unknown LOCAL_DATA_BACKEND {backend}, using memory")
+
+    return InMemoryStore(
+        load_orders(orders_path) if orders_path else orders,
+        load_products(products_path) if products_path else products
+    )
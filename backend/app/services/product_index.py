@@ -0,0 +1,133 @@
+"""In-memory BM25 product search index.
+
+Products are tokenized once when the index is built into an inverted index
+partitioned by category, so a category-filtered query only reads that
+category's postings. Scoring is BM25F: term frequencies of the name,
+benefits, description and ingredients fields are length-normalized per
+field and weighted by the field boosts before BM25 saturation, so a term in
+a product name outweighs the same term in its ingredient list.
+"""
+
+import re
+import math
+import heapq
+from array import array
+from collections import Counter, defaultdict
+from typing import Iterable, Optional
+
+# Field weights: name > benefits > description > ingredients
+FIELD_BOOSTS = {
+    "name": 4.0,
+    "benefits": 2.5,
+    "description": 1.5,
+    "ingredients": 0.75,
+}
+
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my of on or "
+    "our so that the this to was we what which with you your any some something "
+    "need want looking recommend good best".split()
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def stem(token: str) -> str:
+    """Strip plural endings so "stains" matches "stain"."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased, stemmed terms of a text without stopwords."""
+    return [
+        stem(token) for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+def field_text(product: dict, field: str) -> str:
+    value = product.get(field) or ""
+    return " ".join(value) if isinstance(value, list) else str(value)
+
+
+class ProductIndex:
+    """BM25F inverted index over products, partitioned by category."""
+
+    def __init__(self, products: Iterable[dict] = ()):
+        self.ids: list[str] = []
+        self.size = 0
+        # category -> term -> (document numbers, saturated term weights)
+        self._postings: dict[str, dict[str, tuple[array, array]]] = {}
+        self._document_frequency: Counter = Counter()
+        self.build(products)
+
+    def build(self, products: Iterable[dict]):
+        """Replace the indexed products."""
+        fields = []
+        categories = []
+        self.ids = []
+        for product in products:
+            self.ids.append(product["id"])
+            categories.append(product.get("category") or "")
+            fields.append({field: tokenize(field_text(product, field)) for field in FIELD_BOOSTS})
+        self.size = len(self.ids)
+
+        average_length = {}
+        for field in FIELD_BOOSTS:
+            total = sum(len(doc[field]) for doc in fields)
+            average_length[field] = total / self.size if total else 1.0
+
+        postings = defaultdict(lambda: defaultdict(lambda: (array("i"), array("f"))))
+        document_frequency = Counter()
+        for number, (doc, category) in enumerate(zip(fields, categories)):
+            weights = defaultdict(float)
+            for field, boost in FIELD_BOOSTS.items():
+                tokens = doc[field]
+                if not tokens:
+                    continue
+                norm = 1 - B + B * len(tokens) / average_length[field]
+                for term, count in Counter(tokens).items():
+                    weights[term] += boost * count / norm
+            for term, weight in weights.items():
+                numbers, saturated = postings[category][term]
+                numbers.append(number)
+                saturated.append(weight * (K1 + 1) / (weight + K1))
+                document_frequency[term] += 1
+
+        self._postings = {category: dict(terms) for category, terms in postings.items()}
+        self._document_frequency = document_frequency
+
+    def _idf(self, term: str) -> float:
+        frequency = self._document_frequency.get(term, 0)
+        return math.log(1 + (self.size - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query: str, category: Optional[str] = None, top: int = 5) -> list[tuple[str, float]]:
+        """Get (product ID, score) of the best matches, best first."""
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self._document_frequency]
+        if not terms:
+            return []
+
+        if category:
+            partitions = [self._postings[category]] if category in self._postings else []
+        else:
+            partitions = list(self._postings.values())
+
+        scores = defaultdict(float)
+        for term in terms:
+            idf = self._idf(term)
+            for partition in partitions:
+                posting = partition.get(term)
+                if not posting:
+                    continue
+                for number, weight in zip(*posting):
+                    scores[number] += idf * weight
+
+        best = heapq.nlargest(top, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.ids[number], score) for number, score in best]
@@ -0,0 +1,53 @@
+"""Field projection of documents returned to callers.
+
+Projection is pushed down to Azure AI Search (select) and Cosmos DB
+queries where possible; these helpers apply the same projection to
+documents read whole (point reads, the local stores, caches), always
+building new dicts so shared cached documents are never modified.
+"""
+
+import os
+import re
+from typing import Optional
+
+# Top-level document property names safe to splice into a Cosmos DB query
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def parse_fields(value: Optional[str], default: list[str]) -> Optional[list[str]]:
+    """Parse a comma-separated field list; "*" selects whole documents."""
+    if value is None:
+        return list(default)
+    value = value.strip()
+    if value == "*":
+        return None
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+
+def fields_from_env(name: str, default: list[str]) -> Optional[list[str]]:
+    """Field list of an environment variable, or the default when unset."""
+    return parse_fields(os.getenv(name), default)
+
+
+def project(document: Optional[dict], fields: Optional[list[str]]) -> Optional[dict]:
+    """Copy of a document with only the given top-level fields, in field order."""
+    if document is None or fields is None:
+        return document
+    return {field: document[field] for field in fields if field in document}
+
+
+def project_all(documents: list[dict], fields: Optional[list[str]]) -> list[dict]:
+    """Project each document of a list."""
+    if fields is None:
+        return documents
+    return [project(document, fields) for document in documents]
+
+
+def cosmos_select(fields: Optional[list[str]], alias: str = "c") -> str:
+    """SELECT clause of a Cosmos DB query projecting the given fields."""
+    if fields is None:
+        return "SELECT *"
+    for field in fields:
+        if not FIELD_NAME.match(field):
+            raise ValueError(f"Invalid field name: {field!r}")
+    return "SELECT " + ", ".join(f"{alias}.{field}" for field in fields)
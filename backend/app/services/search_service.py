@@ -1,12 +1,23 @@
 """Azure AI Search service for product catalog."""
 
 import os
+import time
+import asyncio
 import logging
 from typing import Optional
 
+import numpy as np
+
+from azure.core.exceptions import HttpResponseError
 from azure.identity.aio import DefaultAzureCredential
 from azure.search.documents.aio import SearchClient
 from azure.search.documents.models import VectorizedQuery
+from services.catalog_snapshot import CatalogSnapshot, CatalogSnapshotCache
+from services.embeddings import create_embedder, embedding_text
+from services.local_store import InMemoryStore, create_local_store
+from services.projection import project_all
+from services.ttl_cache import TTLCache
+from services.vector_index import VectorIndex, reciprocal_rank_fusion
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +25,7 @@ logger = logging.getLogger(__name__)
 class SearchService:
     """Service for searching product catalog using Azure AI Search."""
     
-    def __init__(self):
+    def __init__(self, local_store=None):
         self.endpoint = os.getenv("SEARCH_ENDPOINT")
         self.index_name = "products"
         self.client: SearchClient = None
@@ -223,6 +234,53 @@ class SearchService:
                 "benefits": ["Economical", "Less plastic waste", "Moisturizing", "Various scents"]
             }
         ]
+        
+        # Without Azure AI Search products come from a local store, which
+        # can be shared with the Cosmos DB service
+        self._owns_local_store = local_store is None
+        if local_store is None:
+            local_store = create_local_store(products=self._mock_products)
+        else:
+            local_store.add_defaults(products=self._mock_products)
+        self.local_store = local_store
+        
+        # The whole catalog is kept as a snapshot that serves the product
+        # list and is refreshed in the background
+        self.catalog = CatalogSnapshotCache(self._fetch_all_products)
+        # (lowercase name, name) of the catalog's products, for entity matching
+        self._product_names: list[tuple[str, str]] = []
+        
+        # Optionally the catalog is loaded into an in-process BM25 index
+        # that answers searches without a round trip to Azure AI Search
+        self.local_index_enabled = os.getenv("SEARCH_LOCAL_INDEX", "false").lower() == "true"
+        self.catalog_index: Optional[InMemoryStore] = None
+        
+        # Hybrid retrieval adds a vector query to every keyword search. Azure
+        # AI Search fuses the two itself; locally they are fused here
+        self.hybrid_enabled = os.getenv("SEARCH_HYBRID", "true").lower() == "true"
+        self.vector_field = os.getenv("SEARCH_VECTOR_FIELD", "contentVector")
+        self.vector_candidates = int(os.getenv("SEARCH_VECTOR_CANDIDATES", "50"))
+        # Vector queries are skipped for a while when the index has no
+        # vector field yet (see scripts/index_products.py)
+        self.vector_retry_seconds = float(os.getenv("SEARCH_VECTOR_RETRY_SECONDS", "300"))
+        self.vector_queries_paused_until = 0.0
+        self.vectors_path = os.getenv("SEARCH_VECTORS_PATH")
+        self.vector_backend = os.getenv("VECTOR_INDEX_BACKEND", "exact").lower()
+        self.embedder = create_embedder() if self.hybrid_enabled else None
+        self.vector_index: Optional[VectorIndex] = None
+        # Agents repeat the same queries across sessions
+        self.query_embeddings = TTLCache(
+            max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+        )
+        
+        # Agents repeat the same searches across sessions; results are
+        # dropped whenever the catalog changes
+        self.search_cache = TTLCache(
+            max_size=int(os.getenv("SEARCH_CACHE_SIZE", "2000")),
+            ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+        )
+        self.search_cache_empty_ttl = float(os.getenv("SEARCH_CACHE_EMPTY_TTL_SECONDS", "30"))
     
     async def _ensure_initialized(self):
         """Initialize search client if not already done."""
@@ -231,6 +289,7 @@ class SearchService:
         
         if not self.endpoint:
             logger.warning("SEARCH_ENDPOINT not set, using mock data")
+            await self.local_store.open()
             self._initialized = True
             return
         
@@ -245,91 +304,245 @@ class SearchService:
             logger.info("Search service initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Search service: {e}")
+            await self.local_store.open()
             self._initialized = True  # Use mock data
     
+    async def start(self):
+        """Load the catalog snapshot and the in-process indexes built from it."""
+        await self._ensure_initialized()
+        self.catalog.listeners.append(self._apply_catalog)
+        try:
+            await self.catalog.get()
+        except Exception as e:
+            logger.error(f"Failed to load the product catalog: {e}")
+        self.catalog.start()
+    
+    async def close(self):
+        """Stop catalog refreshes and release the embedding client."""
+        await self.catalog.close()
+        if self.embedder:
+            await self.embedder.close()
+    
+    async def _apply_catalog(self, snapshot: CatalogSnapshot):
+        """Rebuild the in-process indexes from a new catalog snapshot."""
+        self._product_names = [
+            (name.lower(), name)
+            for name in dict.fromkeys(p["name"] for p in snapshot.products if p.get("name"))
+        ]
+        if self.client and self.local_index_enabled:
+            self.catalog_index = await asyncio.to_thread(InMemoryStore, [], snapshot.products)
+            logger.info(f"Loaded {len(snapshot.products)} products into the local search index")
+        if self.hybrid_enabled and (self.catalog_index or not self.client):
+            if self.vector_index and self.vectors_path:
+                return  # Precomputed vectors are not rebuilt
+            try:
+                self.vector_index = await self._build_vector_index(snapshot.products)
+                logger.info(f"Vector index of {len(self.vector_index)} products ({self.vector_index.backend})")
+            except Exception as e:
+                logger.error(f"Failed to build the vector index, searching by keyword only: {e}")
+        # Searches cached before the change may return stale products
+        self.search_cache.clear()
+    
+    async def _build_vector_index(self, products: list, batch_size: int = 1000) -> VectorIndex:
+        """Load precomputed product vectors or embed the catalog."""
+        if self.vectors_path:
+            return VectorIndex.load(self.vectors_path, self.vector_backend)
+        
+        vectors = [
+            await self.embedder.embed([embedding_text(p) for p in products[start:start + batch_size]])
+            for start in range(0, len(products), batch_size)
+        ]
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, self.embedder.dimensions), dtype=np.float32)
+        return VectorIndex(
+            [p["id"] for p in products],
+            matrix,
+            [p.get("category") or "" for p in products],
+            self.vector_backend
+        )
+    
+    async def embed_query(self, query: str) -> np.ndarray:
+        """Embed a search query, reusing embeddings of recent identical queries."""
+        key = " ".join(query.lower().split())
+        
+        async def load():
+            return (await self.embedder.embed([key]))[0]
+        
+        return await self.query_embeddings.get_or_load(key, load)
+    
+    async def _fetch_all_products(self, page_size: int = 1000) -> list:
+        """Page through every product of the search index or the local store.
+        
+        Azure AI Search allows skipping at most 100,000 documents, which
+        bounds the catalogs that can be paged this way.
+        """
+        await self._ensure_initialized()
+        products = []
+        while True:
+            if self.client:
+                results = await self.client.search(
+                    search_text="*",
+                    top=page_size,
+                    skip=len(products)
+                )
+                page = [dict(result) async for result in results]
+            else:
+                page = await self.local_store.list_products(top=page_size, skip=len(products))
+            products.extend(page)
+            if len(page) < page_size:
+                return products
+    
+    @staticmethod
+    def _search_key(
+        query: str,
+        category: Optional[str],
+        top: int,
+        select: Optional[list[str]] = None
+    ) -> str:
+        """Cache key of a search, equal for queries differing only in case and spacing."""
+        category = "" if category in (None, "", "all") else category
+        fields = "*" if select is None else ",".join(select)
+        return f"{category}|{top}|{fields}|{' '.join(query.lower().split())}"
+    
     async def search_products(
         self,
         query: str,
         category: Optional[str] = None,
-        top: int = 5
+        top: int = 5,
+        select: Optional[list[str]] = None
     ) -> list:
-        """Search products by query and optional category."""
+        """Search products by query and optional category.
+        
+        With select only those fields of each product are returned, and
+        Azure AI Search only retrieves them. Results are cached, briefly
+        when nothing was found, and concurrent identical searches share
+        one request to the index. Cached lists are shared between callers
+        and must not be modified.
+        """
         await self._ensure_initialized()
         
+        try:
+            return await self.search_cache.get_or_load(
+                self._search_key(query, category, top, select),
+                lambda: self._search(query, category, top, select),
+                ttl_for=lambda products: None if products else self.search_cache_empty_ttl
+            )
+        except Exception as e:
+            # Fallback results are not cached
+            logger.error(f"Search error: {e}")
+            return project_all(await self._search_mock_products(query, category, top), select)
+    
+    async def _search(
+        self,
+        query: str,
+        category: Optional[str],
+        top: int,
+        select: Optional[list[str]] = None
+    ) -> list:
+        """Search the catalog index, Azure AI Search or the local store."""
+        if self.catalog_index:
+            return project_all(await self._search_mock_products(query, category, top), select)
+        
         if self.client:
             try:
                 filter_str = f"category eq '{category}'" if category and category != "all" else None
                 
+                # Hybrid query: Azure AI Search fuses the keyword and vector
+                # rankings with reciprocal rank fusion
+                vector_queries = None
+                if self.hybrid_enabled and time.monotonic() >= self.vector_queries_paused_until:
+                    try:
+                        vector = await self.embed_query(query)
+                        vector_queries = [VectorizedQuery(
+                            vector=vector.tolist(),
+                            k_nearest_neighbors=max(top, self.vector_candidates),
+                            fields=self.vector_field
+                        )]
+                    except Exception as e:
+                        logger.warning(f"Query embedding failed, searching by keyword only: {e}")
+                
                 results = await self.client.search(
                     search_text=query,
                     filter=filter_str,
                     top=top,
-                    include_total_count=True
+                    select=select,
+                    include_total_count=True,
+                    vector_queries=vector_queries
                 )
                 
                 products = []
                 async for result in results:
                     products.append(dict(result))
                 
-                return products
-            except Exception as e:
-                logger.error(f"Search error: {e}")
-                return self._search_mock_products(query, category, top)
+                # Drop the @search.* metadata of selected results
+                return project_all(products, select)
+            except HttpResponseError as e:
+                if vector_queries and e.status_code == 400 and self.vector_field in (e.message or ""):
+                    # The index has no vector field yet; local hybrid ranking
+                    # is unaffected
+                    logger.warning(
+                        f"Vector query rejected, searching by keyword only for "
+                        f"{self.vector_retry_seconds:g}s: {e.message}"
+                    )
+                    self.vector_queries_paused_until = time.monotonic() + self.vector_retry_seconds
+                    return await self._search(query, category, top, select)
+                raise
         else:
-            return self._search_mock_products(query, category, top)
+            return project_all(await self._search_mock_products(query, category, top), select)
     
-    def _search_mock_products(
+    async def _search_mock_products(
         self,
         query: str,
         category: Optional[str] = None,
         top: int = 5
     ) -> list:
-        """Search mock products for development."""
-        query_lower = query.lower()
-        results = []
+        """Search the local catalog index, or the local product store for development."""
+        store = self.catalog_index or self.local_store
+        await store.open()
+        if category == "all":
+            category = None
         
-        for product in self._mock_products:
-            # Filter by category if specified
-            if category and category != "all":
-                if product["category"] != category:
-                    continue
-            
-            # Simple text matching
-            searchable = f"{product['name']} {product['description']} {' '.join(product.get('ingredients', []))} {' '.join(product.get('benefits', []))}".lower()
-            
-            if query_lower in searchable or any(word in searchable for word in query_lower.split()):
-                results.append(product)
+        if self.vector_index and self.hybrid_enabled:
+            try:
+                vector = await self.embed_query(query)
+            except Exception as e:
+                logger.warning(f"Query embedding failed, searching by keyword only: {e}")
+                vector = None
+            # Queries of only stopwords embed to zero and match nothing
+            if vector is not None and vector.any():
+                candidates = max(top, self.vector_candidates)
+                keyword_ids = await store.rank_products(query, category, candidates)
+                vector_ids = [i for i, _ in self.vector_index.search(vector, category, candidates)]
+                fused = reciprocal_rank_fusion([keyword_ids, vector_ids])[:top]
+                if fused:
+                    return await store.get_products([product_id for product_id, _ in fused])
         
-        # If no results, return top products from category or all
-        if not results:
-            if category and category != "all":
-                results = [p for p in self._mock_products if p["category"] == category]
-            else:
-                results = self._mock_products
+        return await store.search_products(query, category, top)
+    
+    def match_product_names(self, text: str) -> list:
+        """Find known catalog product names mentioned in text.
         
-        return results[:top]
+        Names come from the catalog snapshot, so they match the products
+        the search index returns. Until it has loaded only the local
+        catalog can be matched, and only when it is the one searched.
+        """
+        product_names = self._product_names
+        if not product_names and not self.client:
+            product_names = [(name.lower(), name) for name in self.local_store.product_names()]
+        text_lower = text.lower()
+        return [name for name_lower, name in product_names if name_lower in text_lower]
+    
+    async def get_catalog_snapshot(self) -> CatalogSnapshot:
+        """Get the catalog snapshot, or a snapshot of the local products if it cannot be loaded."""
+        try:
+            return await self.catalog.get()
+        except Exception as e:
+            logger.error(f"Error getting all products: {e}")
+            await self.local_store.open()
+            return CatalogSnapshot(await self.local_store.list_products(top=100))
     
     async def get_all_products(self) -> list:
         """Get all products from the catalog."""
-        await self._ensure_initialized()
-        
-        if self.client:
-            try:
-                results = await self.client.search(
-                    search_text="*",
-                    top=100
-                )
-                
-                products = []
-                async for result in results:
-                    products.append(dict(result))
-                
-                return products
-            except Exception as e:
-                logger.error(f"Error getting all products: {e}")
-                return self._mock_products
-        else:
-            return self._mock_products
+        return (await self.get_catalog_snapshot()).products
     
     async def get_product_by_id(self, product_id: str) -> Optional[dict]:
         """Get a specific product by ID."""
@@ -342,7 +555,15 @@ class SearchService:
             except:
                 return None
         else:
-            for product in self._mock_products:
-                if product["id"] == product_id:
-                    return product
-            return None
+            return await self.local_store.get_product(product_id)
+    
+    def get_metrics(self) -> dict:
+        """Get search service counters."""
+        return {
+            "hybrid": self.hybrid_enabled,
+            "vector_queries_paused": time.monotonic() < self.vector_queries_paused_until,
+            "vector_index": len(self.vector_index) if self.vector_index else 0,
+            "query_embeddings": self.query_embeddings.get_metrics(),
+            "search_cache": self.search_cache.get_metrics(),
+            "catalog": self.catalog.get_metrics(),
+        }
@@ -0,0 +1,231 @@
+"""Bounded in-memory store for conversation sessions without Cosmos DB.
+
+Sessions are kept in LRU order and evicted when they have been idle too
+long, or when the store exceeds its session count or memory budget. With a
+spill directory, evicted sessions are written to gzip-compressed files
+instead of being dropped and paged back in the next time they are accessed.
+"""
+
+import os
+import gzip
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import quote, unquote
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(value) -> int:
+    """Approximate memory footprint of a JSON value, in bytes of its encoding."""
+    return len(json.dumps(value, separators=(",", ":")))
+
+
+class SessionStore:
+    """LRU session store with idle expiry, a memory cap and disk spill."""
+
+    def __init__(self):
+        self.max_sessions = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "10000"))
+        self.max_bytes = int(os.getenv("SESSION_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.idle_ttl = float(os.getenv("SESSION_STORE_IDLE_TTL_SECONDS", "3600"))
+        self.spill_dir = os.getenv("SESSION_STORE_SPILL_DIR")
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+        # session ID -> (last access, estimated size, session)
+        self._sessions: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+        # Size of each session's state as last accounted for, since callers
+        # may change the state in place before updating it
+        self._state_sizes: dict[str, int] = {}
+        # Evicted sessions whose spill file is still being written
+        self._spilling: dict[str, dict] = {}
+        self.bytes = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+        self.page_ins = 0
+
+    def _spill_path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, quote(session_id, safe="") + ".json.gz")
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        """Get a session, paging it in from disk if it was spilled."""
+        entry = self._sessions.get(session_id)
+        if entry:
+            self.hits += 1
+            self._store(session_id, entry[2], entry[1])
+            return entry[2]
+
+        session = self._spilling.get(session_id)
+        if session is None:
+            session = await self._page_in(session_id)
+            entry = self._sessions.get(session_id)
+            if entry:
+                # Paged in by a concurrent call while this one waited
+                self.hits += 1
+                self._store(session_id, entry[2], entry[1])
+                return entry[2]
+        if session is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.page_ins += 1
+        self._store(session_id, session, estimate_size(session))
+        self._state_sizes[session_id] = estimate_size(session.get("state", {}))
+        await self._evict()
+        return session
+
+    async def put(self, session_id: str, session: dict):
+        """Store a new or replaced session."""
+        self._store(session_id, session, estimate_size(session))
+        self._state_sizes[session_id] = estimate_size(session.get("state", {}))
+        await self._evict()
+
+    async def append_message(self, session_id: str, message: dict):
+        """Append a message to a stored session."""
+        session = await self.get(session_id)
+        session["messages"].append(message)
+        self._store(session_id, session, self._sessions[session_id][1] + estimate_size(message))
+        await self._evict()
+
+    async def update_state(self, session_id: str, fields: dict) -> dict:
+        """Merge fields into the state of a stored session."""
+        session = await self.get(session_id)
+        state = session.setdefault("state", {})
+        state.update(fields)
+        state_size = estimate_size(state)
+        size = self._sessions[session_id][1] + state_size - self._state_sizes.get(session_id, 0)
+        self._state_sizes[session_id] = state_size
+        self._store(session_id, session, size)
+        await self._evict()
+        return state
+
+    async def delete(self, session_id: str):
+        """Remove a session from memory and from the spill directory."""
+        entry = self._sessions.pop(session_id, None)
+        if entry:
+            self.bytes -= entry[1]
+        self._state_sizes.pop(session_id, None)
+        if self.spill_dir:
+            try:
+                await asyncio.to_thread(os.remove, self._spill_path(session_id))
+            except FileNotFoundError:
+                pass
+
+    def sessions(self) -> list[tuple[str, dict]]:
+        """Sessions held in memory, least recently used first, without touching them."""
+        return [(session_id, entry[2]) for session_id, entry in self._sessions.items()]
+
+    async def spilled_sessions(self) -> list[tuple[str, dict]]:
+        """Sessions spilled to disk, read without paging them back in."""
+        if not self.spill_dir:
+            return []
+
+        def read():
+            sessions = []
+            for filename in os.listdir(self.spill_dir):
+                if not filename.endswith(".json.gz"):
+                    continue
+                session_id = unquote(filename[:-len(".json.gz")])
+                if session_id in self._sessions or session_id in self._spilling:
+                    continue
+                try:
+                    with gzip.open(os.path.join(self.spill_dir, filename), "rt", encoding="utf-8") as f:
+                        sessions.append((session_id, json.load(f)))
+                except FileNotFoundError:
+                    # Paged in since the directory was listed
+                    continue
+                except (OSError, ValueError) as e:
+                    logger.error(f"Failed to read spilled session {session_id}: {e}")
+            return sessions
+
+        spilling = list(self._spilling.items())
+        return spilling + await asyncio.to_thread(read)
+
+    def _store(self, session_id: str, session: dict, size: int):
+        previous = self._sessions.pop(session_id, None)
+        if previous:
+            self.bytes -= previous[1]
+        self._sessions[session_id] = (time.monotonic(), size, session)
+        self.bytes += size
+
+    async def _evict(self):
+        """Expire idle sessions, then evict the least recently used over the limits."""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, (last_access, size, session) = next(iter(self._sessions.items()))
+            if now - last_access > self.idle_ttl:
+                self.expirations += 1
+            elif (
+                len(self._sessions) > self.max_sessions
+                or (self.bytes > self.max_bytes and len(self._sessions) > 1)
+            ):
+                self.evictions += 1
+            else:
+                return
+
+            del self._sessions[session_id]
+            self._state_sizes.pop(session_id, None)
+            self.bytes -= size
+            if self.spill_dir:
+                await self._spill(session_id, session)
+
+    async def _spill(self, session_id: str, session: dict):
+        self._spilling[session_id] = session
+
+        def write():
+            path = self._spill_path(session_id)
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                json.dump(session, f, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+
+        try:
+            await asyncio.to_thread(write)
+            self.spills += 1
+        except OSError as e:
+            logger.error(f"Failed to spill session {session_id}: {e}")
+        finally:
+            self._spilling.pop(session_id, None)
+
+    async def _page_in(self, session_id: str) -> Optional[dict]:
+        if not self.spill_dir:
+            return None
+
+        def read():
+            path = self._spill_path(session_id)
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    session = json.load(f)
+            except FileNotFoundError:
+                return None
+            # The session lives in memory again until it is next evicted
+            os.remove(path)
+            return session
+
+        try:
+            return await asyncio.to_thread(read)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to page in session {session_id}: {e}")
+            return None
+
+    def get_metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "spills": self.spills,
+            "page_ins": self.page_ins,
+        }
@@ -0,0 +1,156 @@
+"""Bounded in-process cache with LRU eviction and per-entry expiry."""
+
+import time
+import asyncio
+import functools
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after a time-to-live.
+
+    Expiry times are wall-clock timestamps so entries can be exported and
+    restored across process restarts. Concurrent loads of the same missing
+    key are collapsed into a single load.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._loading: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a live value, counting a hit or a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_seconds: Optional[float] = None,
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None
+    ) -> Any:
+        """Get a value, loading it once for all concurrent callers on a miss.
+
+        None results are returned but not cached. ttl_for can choose the
+        time-to-live of a loaded value, e.g. a shorter one for empty results.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        task = self._loading.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # The load runs detached so cancelling the caller that started
+            # it does not cancel it for the others
+            task = asyncio.ensure_future(self._load(key, loader, ttl_seconds, ttl_for))
+            self._loading[key] = task
+            task.add_done_callback(functools.partial(self._finish_load, key))
+        return await asyncio.shield(task)
+
+    async def _load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_seconds: Optional[float],
+        ttl_for: Optional[Callable[[Any], Optional[float]]]
+    ) -> Any:
+        value = await loader()
+        # Skip caching if the key was deleted or refreshed meanwhile
+        if value is not None and self._loading.get(key) is asyncio.current_task():
+            self.set(key, value, ttl_for(value) if ttl_for else ttl_seconds)
+        return value
+
+    def _finish_load(self, key: str, task: asyncio.Task):
+        if self._loading.get(key) is task:
+            del self._loading[key]
+        if not task.cancelled():
+            # Callers receive any error through the shield; mark it
+            # retrieved in case they were all cancelled
+            task.exception()
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Store a value, evicting the least recently used entries if full."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def refresh(self, key: str, value: Any) -> bool:
+        """Replace a cached value with a newer version without extending its life.
+
+        Loads in flight are discarded since they may have read the older
+        version. Returns whether the key was cached.
+        """
+        self._loading.pop(key, None)
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        self._entries[key] = (entry[0], value)
+        return True
+
+    def delete(self, key: str):
+        """Remove a key, discarding the result of any load in flight."""
+        self._entries.pop(key, None)
+        self._loading.pop(key, None)
+
+    def clear(self):
+        """Remove all entries, discarding the results of loads in flight."""
+        self._entries.clear()
+        self._loading.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def export(self) -> list:
+        """Export live entries as [key, expires_at, value] in LRU order."""
+        now = time.time()
+        return [
+            [key, expires_at, value]
+            for key, (expires_at, value) in self._entries.items()
+            if expires_at > now
+        ]
+
+    def restore(self, entries: list):
+        """Restore entries produced by export, skipping expired ones."""
+        now = time.time()
+        for key, expires_at, value in entries:
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_metrics(self) -> dict:
+        """Get size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,97 @@
+"""In-memory vector index and rank fusion for hybrid product retrieval.
+
+Vectors are kept in one float32 matrix, sorted by category so a category
+filter scans a contiguous slice. Search is exact (brute-force inner product
+with NumPy) or, when the optional hnswlib package is installed and
+VECTOR_INDEX_BACKEND=hnsw, approximate over an HNSW graph.
+"""
+
+import logging
+from collections import defaultdict
+from typing import Optional
+
+import numpy as np
+
+from services.embeddings import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:  # HNSW is optional
+    hnswlib = None
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fuse rankings of IDs by summing 1 / (k + rank), best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class VectorIndex:
+    """Nearest-neighbour search over product vectors, partitioned by category."""
+
+    def __init__(self, ids: list[str], vectors: np.ndarray, categories: list[str], backend: str = "exact"):
+        order = sorted(range(len(ids)), key=lambda i: categories[i])
+        self.ids = [ids[i] for i in order]
+        self.categories = [categories[i] for i in order]
+        self.vectors = normalize_rows(np.asarray(vectors, dtype=np.float32)[order])
+        self.dimensions = self.vectors.shape[1] if len(ids) else 0
+
+        # category -> [start, end) rows
+        self._partitions: dict[str, tuple[int, int]] = {}
+        for row, category in enumerate(self.categories):
+            start, _ = self._partitions.get(category, (row, row))
+            self._partitions[category] = (start, row + 1)
+
+        self.backend = "exact"
+        self._hnsw = None
+        if backend == "hnsw" and len(ids):
+            if hnswlib is None:
+                logger.warning("hnswlib is not installed, using exact vector search")
+            else:
+                self._hnsw = hnswlib.Index(space="ip", dim=self.dimensions)
+                self._hnsw.init_index(max_elements=len(ids), ef_construction=200, M=16)
+                self._hnsw.add_items(self.vectors, np.arange(len(ids)))
+                self.backend = "hnsw"
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, vector: np.ndarray, category: Optional[str] = None, top: int = 5) -> list[tuple[str, float]]:
+        """Get (product ID, cosine similarity) of the nearest products, best first."""
+        if category:
+            if category not in self._partitions:
+                return []
+            start, end = self._partitions[category]
+        else:
+            start, end = 0, len(self.ids)
+        k = min(top, end - start)
+        if k <= 0:
+            return []
+
+        if self._hnsw is not None:
+            self._hnsw.set_ef(max(64, k * 2))
+            rows, distances = self._hnsw.knn_query(
+                vector,
+                k=k,
+                filter=(lambda row: start <= row < end) if category else None
+            )
+            return [(self.ids[row], 1.0 - float(d)) for row, d in zip(rows[0], distances[0])]
+
+        scores = self.vectors[start:end] @ vector
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(self.ids[start + row], float(scores[row])) for row in best]
+
+    def save(self, path: str):
+        """Write the vectors to a .npz file for loading at startup."""
+        np.savez(path, ids=np.array(self.ids), categories=np.array(self.categories), vectors=self.vectors)
+
+    @classmethod
+    def load(cls, path: str, backend: str = "exact") -> "VectorIndex":
+        with np.load(path) as data:
+            return cls(data["ids"].tolist(), data["vectors"], data["categories"].tolist(), backend)
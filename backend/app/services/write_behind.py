@@ -0,0 +1,134 @@
+"""Write-behind queue that batches item writes per partition.
+
+Writes are acknowledged as soon as they are queued and flushed in the
+background, either when a partition reaches the batch size or on a timer.
+Failed flushes are retried with exponential backoff and requeued, and
+pending items stay readable so callers keep read-your-writes semantics.
+"""
+
+import os
+import random
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+BatchWriter = Callable[[str, list[dict]], Awaitable[None]]
+
+
+class WriteBehindQueue:
+    """Buffers items per partition key and flushes them in batches."""
+
+    def __init__(self, write_batch: BatchWriter):
+        self.write_batch = write_batch
+        self.batch_size = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+        self.flush_interval = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_SECONDS", "0.5"))
+        self.max_attempts = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+        self._pending: dict[str, list[dict]] = defaultdict(list)
+        self._inflight: dict[str, list[dict]] = defaultdict(list)
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task = None
+        self._closing = False
+
+        # Counters
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.retries = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the background flush loop."""
+        if not self.running:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop accepting new flush cycles and drain everything pending."""
+        self._closing = True
+        self._wake.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    def enqueue(self, partition_key: str, item: dict):
+        """Queue an item for writing."""
+        self._pending[partition_key].append(item)
+        self.enqueued += 1
+        if len(self._pending[partition_key]) >= self.batch_size:
+            self._wake.set()
+
+    def unflushed(self, partition_key: str) -> list[dict]:
+        """Items of a partition that are queued or being written."""
+        return self._inflight.get(partition_key, []) + self._pending.get(partition_key, [])
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            await self.flush()
+            if self._closing:
+                remaining = sum(len(items) for items in self._pending.values())
+                if remaining:
+                    logger.error(f"Write-behind closed with {remaining} unwritten items")
+                return
+
+    async def flush(self):
+        """Flush every partition with pending items concurrently."""
+        partitions = [key for key, items in self._pending.items() if items]
+        await asyncio.gather(*(self._flush_partition(key) for key in partitions))
+
+    async def _flush_partition(self, partition_key: str):
+        while self._pending.get(partition_key):
+            batch = self._pending[partition_key][:self.batch_size]
+            del self._pending[partition_key][:len(batch)]
+            self._inflight[partition_key] = batch
+
+            try:
+                if not await self._write_with_retry(partition_key, batch):
+                    # Keep the items, in order, for the next flush cycle
+                    self._pending[partition_key][:0] = batch
+                    return
+            finally:
+                self._inflight.pop(partition_key, None)
+
+            self.flushed += len(batch)
+            self.batches += 1
+
+        self._pending.pop(partition_key, None)
+
+    async def _write_with_retry(self, partition_key: str, batch: list[dict]) -> bool:
+        delay = 0.1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.write_batch(partition_key, batch)
+                return True
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.failures += 1
+                    logger.error(f"Write-behind flush for {partition_key} failed: {e}")
+                    return False
+                self.retries += 1
+                await asyncio.sleep(delay + random.uniform(0, delay))
+                delay *= 2
+        return False
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": sum(len(items) for items in self._pending.values()),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
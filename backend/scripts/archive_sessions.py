@@ -0,0 +1,76 @@
+"""Archive conversation sessions that have been idle for a number of days.
+
+Messages of each idle session are written to one compressed JSONL blob and
+removed from Cosmos DB; the session document keeps its state and a marker
+naming the blob, and the messages are restored the next time the session's
+history is read. Configure the archive with ARCHIVE_BLOB_ENDPOINT,
+ARCHIVE_BLOB_CONNECTION_STRING (e.g. Azurite) or ARCHIVE_LOCAL_DIR.
+
+Each run also deletes the message items of sessions whose document the
+container TTL has expired, since message items do not expire themselves.
+
+Usage:
+    python scripts/archive_sessions.py --idle-days 30
+    ARCHIVE_BLOB_CONNECTION_STRING=UseDevelopmentStorage=true \\
+        python scripts/archive_sessions.py --idle-days 7 --dry-run
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from services.cosmos_service import CosmosService  # noqa: E402
+
+
+async def archive(idle_days: float, limit: int, concurrency: int, dry_run: bool):
+    cosmos_service = CosmosService()
+    started = time.perf_counter()
+    try:
+        session_ids = await cosmos_service.list_idle_sessions(idle_days, limit=limit)
+        if dry_run:
+            for session_id in session_ids:
+                print(session_id)
+            print(f"{len(session_ids)} sessions idle for more than {idle_days:g} days")
+            return
+
+        semaphore = asyncio.Semaphore(concurrency)
+        failed = 0
+
+        async def archive_one(session_id: str) -> bool:
+            nonlocal failed
+            async with semaphore:
+                try:
+                    return await cosmos_service.archive_session(session_id)
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to archive session {session_id}: {e}", file=sys.stderr)
+                    return False
+
+        archived = await asyncio.gather(*(archive_one(s) for s in session_ids))
+        purged = await cosmos_service.purge_expired_messages(limit=limit)
+        print(
+            f"Archived {sum(archived)} of {len(session_ids)} idle sessions "
+            f"({failed} failed) and purged the messages of {purged} expired sessions "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+    finally:
+        await cosmos_service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle-days", type=float, default=float(os.getenv("ARCHIVE_IDLE_DAYS", "30")))
+    parser.add_argument("--limit", type=int, default=1000, help="Maximum sessions to archive in one run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dry-run", action="store_true", help="List idle sessions without archiving")
+    args = parser.parse_args()
+
+    asyncio.run(archive(args.idle_days, args.limit, args.concurrency, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Benchmark local product retrieval: BM25, vector and hybrid search.
+
+Generates synthetic catalogs of each size (see generate_data.py), builds the
+indexes and times the same queries with and without a category filter. The
+linear scan is the substring matching the local store used before the
+BM25 index, kept here as the baseline. Vectors come from the deterministic
+local hashing embedder; query embedding time is included in the vector and
+hybrid timings.
+
+Usage:
+    python scripts/benchmark_search.py --products 10000 50000 100000
+    python scripts/benchmark_search.py --products 100000 --vector-backend hnsw
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from generate_data import generate_products  # noqa: E402
+from services.local_data import normalize_product  # noqa: E402
+from services.embeddings import HashingEmbedder, embedding_text  # noqa: E402
+from services.local_store import searchable_text  # noqa: E402
+from services.product_index import ProductIndex  # noqa: E402
+from services.vector_index import VectorIndex, reciprocal_rank_fusion  # noqa: E402
+
+QUERIES = [
+    "sulfate-free shampoo",
+    "HE detergent",
+    "gentle soap for sensitive skin",
+    "shampoo for dry damaged hair",
+    "fragrance free laundry",
+    "tea tree oil",
+    "something to remove tough stains",
+    "moisturizing body wash with shea butter",
+    "streak free glass cleaner",
+    "color safe conditioner",
+]
+
+
+def linear_scan(products: list[dict], query: str, category: str, top: int) -> list[dict]:
+    """Match any query word anywhere in a product, in catalog order."""
+    query_lower = query.lower()
+    results = []
+    for product in products:
+        if category and product["category"] != category:
+            continue
+        searchable = searchable_text(product)
+        if query_lower in searchable or any(word in searchable for word in query_lower.split()):
+            results.append(product)
+    return results[:top]
+
+
+def measure(search, queries: list[tuple[str, str]]) -> dict:
+    """Latency percentiles of running each query once, in milliseconds."""
+    timings = []
+    for query, category in queries:
+        started = time.perf_counter()
+        search(query, category)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "max": timings[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of the query set per catalog")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--vector-backend", choices=["exact", "hnsw"], default="exact")
+    parser.add_argument("--candidates", type=int, default=50, help="Candidates per ranking fused in hybrid search")
+    args = parser.parse_args()
+    embedder = HashingEmbedder(args.dimensions)
+
+    for count in args.products:
+        rng = random.Random(args.seed)
+        products = [normalize_product(p) for p in generate_products(count, rng)]
+        categories = sorted({p["category"] for p in products})
+        queries = [(q, None) for q in QUERIES] + [(q, rng.choice(categories)) for q in QUERIES]
+        queries = queries * args.repeat
+
+        started = time.perf_counter()
+        index = ProductIndex(products)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vectors = embedder.embed_sync([embedding_text(p) for p in products])
+        vector_index = VectorIndex(
+            [p["id"] for p in products], vectors, [p["category"] for p in products], args.vector_backend
+        )
+        vector_seconds = time.perf_counter() - started
+
+        def vector_search(query, category, top):
+            return vector_index.search(embedder.embed_sync([query])[0], category, top)
+
+        def hybrid_search(query, category):
+            keyword_ids = [i for i, _ in index.search(query, category, args.candidates)]
+            vector_ids = [i for i, _ in vector_search(query, category, args.candidates)]
+            return reciprocal_rank_fusion([keyword_ids, vector_ids])[:args.top]
+
+        results = {
+            "linear scan": measure(lambda q, c: linear_scan(products, q, c, args.top), queries),
+            "bm25 index": measure(lambda q, c: index.search(q, c, args.top), queries),
+            f"vector {vector_index.backend}": measure(lambda q, c: vector_search(q, c, args.top), queries),
+            "hybrid rrf": measure(hybrid_search, queries),
+        }
+
+        print(
+            f"{count} products, BM25 index built in {build_seconds:.2f}s, "
+            f"embedded and vector-indexed in {vector_seconds:.2f}s"
+        )
+        for name, timings in results.items():
+            print(
+                f"  {name:<12} p50 {timings['p50']:7.2f} ms  "
+                f"p95 {timings['p95']:7.2f} ms  max {timings['max']:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Generate synthetic orders and products for load testing without Azure.
+
+Products are variations of the sample catalog in data/products.json and
+orders reference them, so generated data exercises the same schema and
+code paths as the sample data. Output is either a SQLite database for
+LOCAL_DATA_BACKEND=sqlite or JSON files in the sample data format.
+
+Usage:
+    python scripts/generate_data.py --orders 1000000 --products 20000 --db local-data.db
+    LOCAL_DATA_BACKEND=sqlite LOCAL_DATA_DB=local-data.db uvicorn main:app --app-dir app
+
+    python scripts/generate_data.py --orders 10000 --json-dir /tmp/data
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from services.local_data import normalize_order, normalize_product  # noqa: E402
+from services.local_store import SQLiteStore  # noqa: E402
+
+SAMPLE_PRODUCTS = os.path.join(os.path.dirname(__file__), "..", "..", "data", "products.json")
+
+VARIANTS = [
+    "Classic", "Fresh", "Gentle", "Ultra", "Pure", "Daily", "Advanced", "Natural",
+    "Sensitive", "Citrus", "Lavender", "Coconut", "Eucalyptus", "Unscented", "Family",
+]
+
+STATUSES = [
+    ("delivered", 0.55),
+    ("shipped", 0.2),
+    ("processing", 0.1),
+    ("pending", 0.05),
+    ("cancelled", 0.05),
+    ("refunded", 0.05),
+]
+
+CARRIERS = ["UPS", "FedEx", "USPS", "DHL"]
+CITIES = [("Seattle", "WA"), ("Austin", "TX"), ("Denver", "CO"), ("Boston", "MA"), ("Chicago", "IL")]
+
+
+def generate_products(count: int, rng: random.Random):
+    """Yield products in the sample data schema."""
+    with open(SAMPLE_PRODUCTS, encoding="utf-8") as f:
+        templates = json.load(f)
+
+    for n in range(1, count + 1):
+        template = templates[(n - 1) % len(templates)]
+        variant = VARIANTS[(n - 1) // len(templates) % len(VARIANTS)]
+        edition = (n - 1) // (len(templates) * len(VARIANTS))
+        name = f"{variant} {template['name']}" + (f" {edition + 1}" if edition else "")
+        yield {
+            **template,
+            "id": f"PROD-{n:06d}",
+            "name": name,
+            "price": round(template["price"] * rng.uniform(0.8, 1.3), 2),
+            "rating": round(rng.uniform(3.5, 5.0), 1),
+            "reviews_count": rng.randint(0, 5000),
+            "in_stock": rng.random() > 0.1,
+        }
+
+
+def generate_orders(count: int, products: list[dict], rng: random.Random):
+    """Yield orders in the sample data schema, about three per customer."""
+    customers = max(1, count // 3)
+    statuses, weights = zip(*STATUSES)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    for n in range(1, count + 1):
+        customer = rng.randint(1, customers)
+        created = start + timedelta(minutes=n * 525600 / count)
+        status = rng.choices(statuses, weights)[0]
+        items = [
+            {
+                "product_id": product["id"],
+                "product_name": product["name"],
+                "quantity": rng.randint(1, 3),
+                "unit_price": product["price"],
+            }
+            for product in rng.sample(products, rng.randint(1, 3))
+        ]
+        subtotal = round(sum(i["quantity"] * i["unit_price"] for i in items), 2)
+        tax = round(subtotal * 0.09, 2)
+        city, state = CITIES[customer % len(CITIES)]
+        order = {
+            "id": f"ORD-{n:07d}",
+            "customer_id": f"CUST-{customer:07d}",
+            "customer_name": f"Customer {customer}",
+            "customer_email": f"customer{customer}@example.com",
+            "status": status,
+            "created_at": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "updated_at": (created + timedelta(days=2)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "shipping_address": {
+                "street": f"{customer % 9000 + 100} Main Street",
+                "city": city,
+                "state": state,
+                "zip": f"{10000 + customer % 89999:05d}",
+                "country": "USA",
+            },
+            "items": items,
+            "subtotal": subtotal,
+            "shipping": 5.99,
+            "tax": tax,
+            "total": round(subtotal + tax + 5.99, 2),
+        }
+        if status in ("shipped", "delivered"):
+            order["tracking_number"] = f"1Z{rng.randrange(10**16):016d}"
+            order["carrier"] = rng.choice(CARRIERS)
+            order["estimated_delivery"] = (created + timedelta(days=5)).strftime("%Y-%m-%d")
+        if status == "delivered":
+            order["delivered_at"] = (created + timedelta(days=4)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        yield order
+
+
+def write_json_array(path: str, records):
+    """Stream records into a JSON array file."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i, record in enumerate(records):
+            if i:
+                f.write(",\n")
+            json.dump(record, f)
+        f.write("\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--db", help="SQLite database to write")
+    output.add_argument("--json-dir", help="Directory for orders.json and products.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    products = list(generate_products(args.products, rng))
+    orders = generate_orders(args.orders, products, rng)
+
+    if args.db:
+        store = SQLiteStore(args.db)
+        store.connect()
+        store.bulk_load(products=(normalize_product(p) for p in products))
+        store.bulk_load(orders=(normalize_order(o) for o in orders))
+    else:
+        os.makedirs(args.json_dir, exist_ok=True)
+        write_json_array(os.path.join(args.json_dir, "products.json"), products)
+        write_json_array(os.path.join(args.json_dir, "orders.json"), orders)
+
+    print(
+        f"Generated {args.products} products and {args.orders} orders "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
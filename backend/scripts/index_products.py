@@ -0,0 +1,149 @@
+"""Embed the product catalog and index it for hybrid search.
+
+With --search-endpoint the Azure AI Search products index is created or
+updated with a vector field (HNSW) and field weights matching the local
+BM25 index, and the products are uploaded with their embeddings. With
+--vectors the embeddings are written to a .npz file that the backend
+loads through SEARCH_VECTORS_PATH instead of embedding the local catalog
+at startup.
+
+Embeddings come from Azure OpenAI when OPENAI_ENDPOINT is set, otherwise
+from the local hashing embedder (see EMBEDDING_BACKEND).
+
+Usage:
+    python scripts/index_products.py --search-endpoint https://srch-xyz.search.windows.net
+    python scripts/index_products.py --products ../data/products.json --vectors product-vectors.npz
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from azure.identity.aio import DefaultAzureCredential  # noqa: E402
+from azure.search.documents.aio import SearchClient  # noqa: E402
+from azure.search.documents.indexes.aio import SearchIndexClient  # noqa: E402
+from azure.search.documents.indexes.models import (  # noqa: E402
+    HnswAlgorithmConfiguration,
+    ScoringProfile,
+    SearchableField,
+    SearchField,
+    SearchFieldDataType,
+    SearchIndex,
+    SimpleField,
+    TextWeights,
+    VectorSearch,
+    VectorSearchProfile,
+)
+
+from services.embeddings import create_embedder, embedding_text  # noqa: E402
+from services.local_data import load_products  # noqa: E402
+from services.product_index import FIELD_BOOSTS  # noqa: E402
+from services.vector_index import VectorIndex  # noqa: E402
+
+SAMPLE_PRODUCTS = os.path.join(os.path.dirname(__file__), "..", "..", "data", "products.json")
+
+
+def build_index(name: str, vector_field: str, dimensions: int) -> SearchIndex:
+    """Products index schema with a vector field and field weights."""
+    strings = SearchFieldDataType.Collection(SearchFieldDataType.String)
+    return SearchIndex(
+        name=name,
+        fields=[
+            SimpleField(name="id", type=SearchFieldDataType.String, key=True, filterable=True),
+            SearchableField(name="name", type=SearchFieldDataType.String),
+            SimpleField(name="category", type=SearchFieldDataType.String, filterable=True, facetable=True),
+            SimpleField(name="subcategory", type=SearchFieldDataType.String, filterable=True),
+            SimpleField(name="department", type=SearchFieldDataType.String, filterable=True),
+            SimpleField(name="price", type=SearchFieldDataType.Double, filterable=True, sortable=True),
+            SearchableField(name="description", type=SearchFieldDataType.String),
+            SearchableField(name="ingredients", collection=True, type=strings),
+            SearchableField(name="benefits", collection=True, type=strings),
+            SimpleField(name="size", type=SearchFieldDataType.String),
+            SimpleField(name="rating", type=SearchFieldDataType.Double, filterable=True, sortable=True),
+            SimpleField(name="reviewsCount", type=SearchFieldDataType.Int32, sortable=True),
+            SimpleField(name="inStock", type=SearchFieldDataType.Boolean, filterable=True),
+            SearchField(
+                name=vector_field,
+                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                searchable=True,
+                hidden=True,
+                vector_search_dimensions=dimensions,
+                vector_search_profile_name="products-vector"
+            ),
+        ],
+        vector_search=VectorSearch(
+            algorithms=[HnswAlgorithmConfiguration(name="products-hnsw")],
+            profiles=[VectorSearchProfile(name="products-vector", algorithm_configuration_name="products-hnsw")]
+        ),
+        scoring_profiles=[ScoringProfile(name="field-boosts", text_weights=TextWeights(weights=FIELD_BOOSTS))],
+        default_scoring_profile="field-boosts"
+    )
+
+
+async def index_products(args):
+    products = load_products(args.products)
+    embedder = create_embedder()
+    started = time.perf_counter()
+    try:
+        vectors = []
+        for start in range(0, len(products), args.batch_size):
+            batch = products[start:start + args.batch_size]
+            vectors.append(await embedder.embed([embedding_text(p) for p in batch]))
+        vectors = np.vstack(vectors)
+    finally:
+        await embedder.close()
+    print(f"Embedded {len(products)} products ({vectors.shape[1]} dimensions) in {time.perf_counter() - started:.1f}s")
+
+    if args.vectors:
+        index = VectorIndex([p["id"] for p in products], vectors, [p["category"] for p in products])
+        index.save(args.vectors)
+        print(f"Wrote {args.vectors}")
+
+    if args.search_endpoint:
+        schema = build_index(args.index, args.vector_field, vectors.shape[1])
+        fields = {field.name for field in schema.fields}
+        credential = DefaultAzureCredential()
+        try:
+            async with SearchIndexClient(args.search_endpoint, credential) as index_client:
+                await index_client.create_or_update_index(schema)
+            async with SearchClient(args.search_endpoint, args.index, credential) as client:
+                for start in range(0, len(products), args.batch_size):
+                    documents = [
+                        {
+                            **{k: v for k, v in product.items() if k in fields},
+                            args.vector_field: vector.tolist(),
+                        }
+                        for product, vector in zip(
+                            products[start:start + args.batch_size],
+                            vectors[start:start + args.batch_size]
+                        )
+                    ]
+                    await client.merge_or_upload_documents(documents)
+        finally:
+            await credential.close()
+        print(f"Indexed {len(products)} products into {args.index}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", default=SAMPLE_PRODUCTS, help="Products JSON file in the sample data format")
+    parser.add_argument("--search-endpoint", default=os.getenv("SEARCH_ENDPOINT"))
+    parser.add_argument("--index", default="products")
+    parser.add_argument("--vector-field", default=os.getenv("SEARCH_VECTOR_FIELD", "contentVector"))
+    parser.add_argument("--vectors", help="Write the embeddings to this .npz file")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if not args.search_endpoint and not args.vectors:
+        parser.error("Give --search-endpoint (or set SEARCH_ENDPOINT) or --vectors")
+
+    asyncio.run(index_products(args))
+
+
+if __name__ == "__main__":
+    main()
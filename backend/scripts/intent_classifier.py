@@ -0,0 +1,121 @@
+"""Train and evaluate the local intent classifier offline.
+
+Uses the triage outputs the orchestrator logs when TRIAGE_LOG_PATH is set.
+
+Usage:
+    python scripts/intent_classifier.py eval triage_log.jsonl
+    python scripts/intent_classifier.py train triage_log.jsonl intent_model.json
+"""
+
+import os
+import sys
+import time
+import argparse
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from agents.intent_classifier import (  # noqa: E402
+    EnsembleIntentClassifier,
+    KeywordIntentClassifier,
+    TfidfIntentClassifier,
+    load_examples,
+    save_model,
+)
+
+
+def split(examples: list[dict], test_fraction: float) -> tuple[list[dict], list[dict]]:
+    """Deterministically split examples by a hash of the message text."""
+    train, test = [], []
+    for example in examples:
+        bucket = zlib.crc32(example["message"].encode("utf-8")) % 100
+        (test if bucket < test_fraction * 100 else train).append(example)
+    return train, test
+
+
+def evaluate(name: str, classifier, examples: list[dict], threshold: float) -> dict:
+    """Report accuracy against the LLM labels and the triage latency saved."""
+    correct = covered = covered_correct = 0
+    saved_ms = local_ms = 0.0
+
+    for example in examples:
+        started = time.perf_counter()
+        prediction = classifier.predict(example["message"])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        local_ms += elapsed_ms
+
+        is_correct = prediction["classification"] == example["classification"]
+        correct += is_correct
+        if prediction["confidence"] >= threshold:
+            covered += 1
+            covered_correct += is_correct
+            saved_ms += example.get("latency_ms", 0.0) - elapsed_ms
+
+    n = len(examples) or 1
+    return {
+        "classifier": name,
+        "accuracy": correct / n,
+        "coverage": covered / n,
+        "fast_path_accuracy": covered_correct / covered if covered else 0.0,
+        "local_ms_per_message": local_ms / n,
+        "saved_ms_per_message": saved_ms / n,
+        "saved_s_total": saved_ms / 1000,
+    }
+
+
+def train(examples: list[dict]) -> tuple[KeywordIntentClassifier, TfidfIntentClassifier]:
+    keyword = KeywordIntentClassifier()
+    keyword.calibrate(examples)
+    tfidf = TfidfIntentClassifier()
+    tfidf.fit(examples)
+    return keyword, tfidf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    eval_parser = subparsers.add_parser("eval", help="Evaluate on a held-out split")
+    eval_parser.add_argument("log", help="Triage log (JSON lines)")
+    eval_parser.add_argument("--threshold", type=float, default=float(
+        os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.85")
+    ))
+    eval_parser.add_argument("--test-fraction", type=float, default=0.2)
+
+    train_parser = subparsers.add_parser("train", help="Train on all logged outputs")
+    train_parser.add_argument("log", help="Triage log (JSON lines)")
+    train_parser.add_argument("model", help="Output model path (INTENT_MODEL_PATH)")
+
+    args = parser.parse_args()
+    examples = load_examples(args.log)
+    if not examples:
+        sys.exit(f"No labelled examples in {args.log}")
+
+    if args.command == "train":
+        keyword, tfidf = train(examples)
+        save_model(args.model, keyword, tfidf)
+        print(f"Trained on {len(examples)} examples, saved to {args.model}")
+        return
+
+    train_examples, test_examples = split(examples, args.test_fraction)
+    if not test_examples or not train_examples:
+        sys.exit("Not enough examples for a train/test split")
+    keyword, tfidf = train(train_examples)
+
+    print(f"{len(train_examples)} train / {len(test_examples)} test examples, "
+          f"threshold {args.threshold}")
+    print(f"{'classifier':<10} {'acc':>6} {'cover':>6} {'fp_acc':>7} "
+          f"{'local_ms':>9} {'saved_ms':>9} {'saved_s':>9}")
+    for name, classifier in [
+        ("keyword", keyword),
+        ("tfidf", tfidf),
+        ("ensemble", EnsembleIntentClassifier([keyword, tfidf])),
+    ]:
+        r = evaluate(name, classifier, test_examples, args.threshold)
+        print(f"{r['classifier']:<10} {r['accuracy']:>6.1%} {r['coverage']:>6.1%} "
+              f"{r['fast_path_accuracy']:>7.1%} {r['local_ms_per_message']:>9.3f} "
+              f"{r['saved_ms_per_message']:>9.1f} {r['saved_s_total']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Migrate conversation documents to append-only message items.
+
+Sessions written before messages were stored as individual items embed a
+"messages" array in the session document. Sessions are also migrated lazily
+the first time their history is read; this script migrates all of them.
+
+Usage:
+    COSMOS_ENDPOINT=https://... python scripts/migrate_conversations.py
+"""
+
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from services.cosmos_service import CosmosService  # noqa: E402
+
+
+async def main():
+    cosmos_service = CosmosService()
+    await cosmos_service._ensure_initialized()
+    if not cosmos_service.client:
+        sys.exit("COSMOS_ENDPOINT is not set")
+
+    container = cosmos_service.database.get_container_client(
+        cosmos_service.conversations_container
+    )
+    items = container.query_items(
+        query="SELECT c.sessionId FROM c WHERE IS_DEFINED(c.messages)"
+    )
+    session_ids = [item["sessionId"] async for item in items]
+    print(f"Found {len(session_ids)} sessions to migrate")
+
+    migrated = 0
+    for session_id in session_ids:
+        migrated += await cosmos_service.migrate_session(session_id)
+    print(f"Migrated {migrated} messages")
+
+    await cosmos_service.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Backend modules are imported relative to backend/app, as in the app itself
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
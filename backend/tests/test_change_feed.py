@@ -0,0 +1,102 @@
+import asyncio
+
+from services.change_feed import ChangeFeedProcessor, FileCheckpointStore, LeaseLostError
+
+
+class FakeSource:
+    """Change feed whose continuation is the number of changes read."""
+
+    def __init__(self, changes: list[dict], page_size: int = 2):
+        self.changes = changes
+        self.page_size = page_size
+
+    async def read(self, continuation):
+        start = int(continuation or 0)
+        page = self.changes[start:start + self.page_size]
+        return page, str(start + len(page))
+
+
+class LostLeaseStore(FileCheckpointStore):
+    """Checkpoint store whose lease is taken over after the first checkpoint."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.saves = 0
+
+    async def save(self, name: str, continuation: str):
+        self.saves += 1
+        if self.saves > 1:
+            raise LeaseLostError(name)
+        await super().save(name, continuation)
+
+
+def changes(count: int) -> list[dict]:
+    return [{"id": f"p{index}"} for index in range(count)]
+
+
+def test_processor_resumes_from_its_checkpoint(tmp_path):
+    async def main():
+        path = str(tmp_path / "checkpoints.json")
+        source = FakeSource(changes(5))
+        handled = []
+
+        async def handler(items):
+            handled.extend(item["id"] for item in items)
+
+        processor = ChangeFeedProcessor("products", source, [handler], FileCheckpointStore(path))
+        assert await processor._hold_lease()
+        assert not await processor.process_once()
+        assert not await processor.process_once()
+        assert await FileCheckpointStore(path).load("products") == "4"
+
+        # A restarted processor continues after the checkpointed changes
+        restarted = ChangeFeedProcessor("products", source, [handler], FileCheckpointStore(path))
+        assert await restarted._hold_lease()
+        while not await restarted.process_once():
+            pass
+        assert handled == ["p0", "p1", "p2", "p3", "p4"]
+
+    asyncio.run(main())
+
+
+def test_failed_handler_does_not_advance_the_checkpoint(tmp_path):
+    async def main():
+        path = str(tmp_path / "checkpoints.json")
+        attempts = []
+
+        async def handler(items):
+            attempts.append([item["id"] for item in items])
+            if len(attempts) == 1:
+                raise RuntimeError("index unavailable")
+
+        processor = ChangeFeedProcessor("products", FakeSource(changes(2)), [handler], FileCheckpointStore(path))
+        await processor._hold_lease()
+        try:
+            await processor.process_once()
+        except RuntimeError:
+            pass
+        assert await FileCheckpointStore(path).load("products") is None
+
+        await processor.process_once()
+        assert attempts == [["p0", "p1"], ["p0", "p1"]]
+        assert await FileCheckpointStore(path).load("products") == "2"
+
+    asyncio.run(main())
+
+
+def test_processor_stops_when_its_lease_is_taken_over(tmp_path):
+    async def main():
+        store = LostLeaseStore(str(tmp_path / "checkpoints.json"))
+
+        async def handler(items):
+            pass
+
+        processor = ChangeFeedProcessor("products", FakeSource(changes(5)), [handler], store)
+        await processor._hold_lease()
+        assert not await processor.process_once()
+        # The checkpoint could not be written: stop and leave the batch to the new owner
+        assert await processor.process_once()
+        assert not processor.leased
+        assert await store.load("products") == "2"
+
+    asyncio.run(main())
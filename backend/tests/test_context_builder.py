@@ -0,0 +1,53 @@
+import asyncio
+
+from agents.context_builder import ContextBuilder, count_tokens
+
+
+class FakeCosmosService:
+    def __init__(self):
+        self.state = {}
+
+    async def get_session_state(self, session_id: str) -> dict:
+        return self.state
+
+    async def update_session_state(self, session_id: str, **fields):
+        self.state.update(fields)
+
+
+def test_pinned_entities_keep_the_most_recent(monkeypatch):
+    monkeypatch.setenv("CONTEXT_MAX_PINNED_ENTITIES", "2")
+
+    async def main():
+        builder = ContextBuilder(FakeCosmosService())
+        history = []
+        for order_id in ["ORD-1", "ORD-2", "ORD-3", "ORD-1"]:
+            history += [
+                {"role": "user", "content": f"Where is {order_id}?"},
+                {"role": "assistant", "content": "Let me check.", "agent": "order"},
+            ]
+        history.append({"role": "user", "content": "thanks"})
+        context = await builder.build("s1", "order", history)
+        assert "Order IDs: ORD-3, ORD-1" in context["instructions"]
+        assert "ORD-2" not in context["instructions"].split("Details")[-1]
+
+    asyncio.run(main())
+
+
+def test_pinned_entities_count_against_the_budget(monkeypatch):
+    monkeypatch.setenv("CONTEXT_TOKEN_BUDGET", "60")
+
+    async def window(first_message: str) -> int:
+        history = [
+            {"role": "user", "content": first_message},
+            {"role": "assistant", "content": "word " * 20, "agent": "order"},
+            {"role": "user", "content": "word " * 20},
+        ]
+        context = await ContextBuilder(FakeCosmosService()).build("s1", "order", history)
+        return len(context["messages"])
+
+    async def main():
+        # Two messages fit the budget, unless pinned entities take part of it
+        assert await window("Hello there, I have a question about my delivery") == 2
+        assert await window("My email is someone@example.com, order ORD-12345") == 1
+
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+import re
+import copy
+import uuid
+import asyncio
+
+from azure.cosmos.exceptions import (
+    CosmosBatchOperationError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+
+from services.cosmos_service import CosmosService
+
+DAY = 86400
+
+VALUE_QUERY = re.compile(r"SELECT (DISTINCT |TOP 1 )?VALUE c\.(\w+)")
+
+
+class FakeContainer:
+    """Conversations container applying per-item TTL as Cosmos DB does."""
+
+    def __init__(self, default_ttl: int):
+        self.default_ttl = default_ttl
+        self.now = 0
+        self.items: dict[tuple[str, str], dict] = {}
+
+    def advance(self, seconds: int):
+        self.now += seconds
+        for key, item in list(self.items.items()):
+            ttl = item.get("ttl", self.default_ttl)
+            if ttl != -1 and item["_ts"] + ttl <= self.now:
+                del self.items[key]
+
+    def _write(self, partition_key: str, item: dict):
+        self.items[(partition_key, item["id"])] = {**item, "_ts": self.now, "_etag": uuid.uuid4().hex}
+
+    def _patch(self, partition_key: str, item_id: str, operations: list) -> dict:
+        item = copy.deepcopy(self.items[(partition_key, item_id)])
+        for operation in operations:
+            *parents, name = operation["path"].strip("/").split("/")
+            target = item
+            for parent in parents:
+                target = target[parent]
+            target[name] = operation["value"]
+        self._write(partition_key, item)
+        return item
+
+    async def read(self):
+        return {"defaultTtl": self.default_ttl}
+
+    async def create_item(self, body: dict):
+        if (body["sessionId"], body["id"]) in self.items:
+            raise CosmosResourceExistsError(message="Conflict")
+        self._write(body["sessionId"], body)
+
+    async def read_item(self, item: str, partition_key: str):
+        try:
+            return dict(self.items[(partition_key, item)])
+        except KeyError:
+            raise CosmosResourceNotFoundError(message="Not found")
+
+    async def patch_item(self, item: str, partition_key: str, patch_operations: list):
+        if (partition_key, item) not in self.items:
+            raise CosmosResourceNotFoundError(message="Not found")
+        return self._patch(partition_key, item, patch_operations)
+
+    async def execute_item_batch(self, batch_operations: list, partition_key: str):
+        for kind, args in batch_operations:
+            if kind == "patch" and (partition_key, args[0]) not in self.items:
+                raise CosmosBatchOperationError(error_index=0, headers={}, status_code=404, message="Not found")
+        for kind, args in batch_operations:
+            if kind == "upsert":
+                self._write(partition_key, args[0])
+            elif kind == "patch":
+                self._patch(partition_key, args[0], args[1])
+            elif kind == "delete":
+                del self.items[(partition_key, args[0])]
+
+    def query_items(self, query: str, parameters=None, partition_key=None, **kwargs):
+        # Filters are left to the service, except the message type of
+        # VALUE queries; partition_key=None queries every partition
+        value = VALUE_QUERY.match(query)
+
+        async def items():
+            if value and value.group(1) == "TOP 1 ":
+                values = [
+                    item[value.group(2)] for (key, _), item in self.items.items()
+                    if key == partition_key and item.get("type") == "message"
+                ]
+                if values:
+                    yield max(values)
+                return
+            seen = set()
+            for (key, _), item in list(self.items.items()):
+                if partition_key is not None and key != partition_key:
+                    continue
+                if not value:
+                    yield dict(item)
+                elif item.get("type") == "message" and item[value.group(2)] not in seen:
+                    if value.group(1):
+                        seen.add(item[value.group(2)])
+                    yield item[value.group(2)]
+        return items()
+
+
+class FakeDatabase:
+    def __init__(self, container: FakeContainer):
+        self.container = container
+
+    def get_container_client(self, name: str) -> FakeContainer:
+        return self.container
+
+
+def create_service(container: FakeContainer) -> CosmosService:
+    service = CosmosService()
+    service.client = object()
+    service.database = FakeDatabase(container)
+    service._initialized = True
+    return service
+
+
+def test_history_of_an_active_session_outlives_the_item_ttl():
+    async def main():
+        container = FakeContainer(default_ttl=DAY)
+        service = create_service(container)
+        await service.add_message("s1", "user", "first question")
+        await service.add_message("s1", "assistant", "first answer")
+        for day in range(3):
+            container.advance(DAY - 60)
+            await service.add_message("s1", "user", f"question on day {day + 2}")
+        container.advance(DAY - 60)
+
+        history = await service.get_conversation_history("s1")
+        assert [m["content"] for m in history][:2] == ["first question", "first answer"]
+        assert len(history) == 5
+
+    asyncio.run(main())
+
+
+def test_history_of_an_expired_session_is_empty_and_purged():
+    async def main():
+        container = FakeContainer(default_ttl=DAY)
+        service = create_service(container)
+        await service.add_message("s1", "user", "hello")
+        container.advance(DAY + 60)
+
+        assert await service.get_conversation_history("s1") == []
+        page = await service.get_conversation_history_page("s1")
+        assert page["messages"] == []
+
+        assert await service.purge_expired_messages() == 1
+        assert not container.items
+
+    asyncio.run(main())
+
+
+def test_history_version_ignores_session_state_updates():
+    async def main():
+        container = FakeContainer(default_ttl=DAY)
+        service = create_service(container)
+        await service.add_message("s1", "user", "hello")
+        version = await service.get_history_version("s1")
+
+        await service.update_session_state("s1", activeAgent="order")
+        assert await service.get_history_version("s1") == version
+
+        await service.add_message("s1", "assistant", "hi")
+        assert await service.get_history_version("s1") != version
+
+    asyncio.run(main())
@@ -0,0 +1,34 @@
+import asyncio
+
+from agents.prefetch import RequestContext
+
+
+def test_caller_timeout_does_not_cancel_the_prefetch():
+    async def main():
+        context = RequestContext()
+        release = asyncio.Event()
+
+        async def lookup():
+            await release.wait()
+            return "order"
+
+        context.prefetch(("order", "ORD-1"), lookup())
+        try:
+            await asyncio.wait_for(context.get(("order", "ORD-1")), timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+
+        release.set()
+        assert await context.get(("order", "ORD-1")) == (True, "order")
+
+    asyncio.run(main())
+
+
+def test_cancelled_prefetch_is_a_miss():
+    async def main():
+        context = RequestContext()
+        context.prefetch(("order", "ORD-1"), asyncio.sleep(10))
+        context.close()
+        assert await context.get(("order", "ORD-1")) == (False, None)
+
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import asyncio
+
+from agents.intent_classifier import KeywordIntentClassifier
+from agents.routing import StickyRouter
+
+
+class FakeCosmosService:
+    def __init__(self):
+        self.writes = []
+
+    async def update_session_state(self, session_id: str, **fields):
+        self.writes.append(fields)
+
+
+def user(content: str) -> dict:
+    return {"role": "user", "content": content}
+
+
+def assistant(content: str, agent: str) -> dict:
+    return {"role": "assistant", "content": content, "agent": agent}
+
+
+def test_sticky_turns_are_counted_from_history_without_writes(monkeypatch):
+    monkeypatch.setenv("STICKY_ROUTING_MAX_TURNS", "2")
+
+    async def main():
+        cosmos_service = FakeCosmosService()
+        router = StickyRouter(cosmos_service, KeywordIntentClassifier())
+        state = {}
+        history = [user("Where is my order ORD-1?")]
+        assert router.get_route(state, history, history[-1]["content"]) is None
+        await router.record("s1", state, history, {"classification": "ORDER"}, "order")
+        assert len(cosmos_service.writes) == 1
+
+        history += [assistant("It shipped.", "order"), user("and when will it arrive?")]
+        route = router.get_route(state, history, history[-1]["content"])
+        assert route["classification"] == "ORDER" and route["turns"] == 2
+
+        # The route has been followed for the maximum number of turns
+        history += [assistant("Tomorrow.", "order"), user("ok, thanks")]
+        assert router.get_route(state, history, history[-1]["content"]) is None
+        assert len(cosmos_service.writes) == 1
+
+    asyncio.run(main())
+
+
+def test_unchanged_general_route_is_not_rewritten():
+    async def main():
+        cosmos_service = FakeCosmosService()
+        router = StickyRouter(cosmos_service, KeywordIntentClassifier())
+        state = {}
+        history = [user("hello")]
+        await router.record("s1", state, history, {"classification": "GENERAL"}, "triage")
+        history += [assistant("Hi!", "triage"), user("how are you?")]
+        await router.record("s1", state, history, {"classification": "GENERAL"}, "triage")
+        assert len(cosmos_service.writes) == 1
+
+    asyncio.run(main())
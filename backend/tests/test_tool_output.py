@@ -0,0 +1,50 @@
+import json
+
+from agents.context_builder import count_tokens
+from agents.tool_output import ToolOutputShaper
+
+
+def product(index: int) -> dict:
+    return {
+        "id": f"PROD-{index}",
+        "name": f"Hydrating Serum {index}",
+        "price": 29.99,
+        "description": "A lightweight serum with hyaluronic acid. " * 20,
+    }
+
+
+def test_long_list_is_cut_within_the_budget(monkeypatch):
+    monkeypatch.setenv("TOOL_OUTPUT_MAX_TOKENS", "200")
+
+    shaped = ToolOutputShaper().shape({"products": [product(i) for i in range(20)]})
+    assert shaped.truncated
+    assert shaped.tokens_after <= 200 < shaped.tokens_before
+    assert count_tokens(shaped.output) == shaped.tokens_after
+
+    products = json.loads(shaped.output)["products"]
+    assert products[0]["id"] == "PROD-0"
+    assert products[-1]["truncated"] == 20 - (len(products) - 1)
+
+
+def test_oversized_first_item_is_reduced_not_dropped(monkeypatch):
+    monkeypatch.setenv("TOOL_OUTPUT_MAX_TOKENS", "40")
+    monkeypatch.setenv("TOOL_OUTPUT_MAX_STRING_CHARS", "10000")
+
+    shaped = ToolOutputShaper().shape([product(0), product(1)])
+    assert shaped.tokens_after <= 40
+
+    first, marker = json.loads(shaped.output)
+    assert marker == {"truncated": 1}
+    # The small fields are kept whole, the long description is shortened
+    assert first["id"] == "PROD-0" and first["price"] == 29.99
+    assert first["description"].endswith("…")
+    assert len(first["description"]) < len(product(0)["description"])
+
+
+def test_output_within_the_budget_is_only_compacted(monkeypatch):
+    monkeypatch.setenv("TOOL_OUTPUT_MAX_TOKENS", "1500")
+
+    result = {"id": "ORD-1", "status": "shipped"}
+    shaped = ToolOutputShaper().shape(result)
+    assert not shaped.truncated
+    assert shaped.output == '{"id":"ORD-1","status":"shipped"}'
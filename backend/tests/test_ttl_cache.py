@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from services.ttl_cache import TTLCache
+
+
+def test_waiter_gets_value_when_leader_is_cancelled():
+    async def scenario():
+        cache = TTLCache(max_size=10, ttl_seconds=60)
+        release = asyncio.Event()
+        loads = 0
+
+        async def loader():
+            nonlocal loads
+            loads += 1
+            await release.wait()
+            return "value"
+
+        leader = asyncio.create_task(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        release.set()
+        assert await waiter == "value"
+        assert loads == 1
+        assert cache.get("key") == "value"
+
+    asyncio.run(scenario())
+
+
+def test_load_error_reaches_all_callers_and_is_not_cached():
+    async def scenario():
+        cache = TTLCache(max_size=10, ttl_seconds=60)
+
+        async def loader():
+            await asyncio.sleep(0)
+            raise RuntimeError("unavailable")
+
+        results = await asyncio.gather(
+            cache.get_or_load("key", loader),
+            cache.get_or_load("key", loader),
+            return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert cache.get("key") is None
+
+    asyncio.run(scenario())
+
+
+def test_delete_discards_load_in_flight():
+    async def scenario():
+        cache = TTLCache(max_size=10, ttl_seconds=60)
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return "stale"
+
+        load = asyncio.create_task(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+        cache.delete("key")
+        release.set()
+        assert await load == "stale"
+        assert cache.get("key") is None
+
+    asyncio.run(scenario())
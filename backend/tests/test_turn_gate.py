@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from agents.turn_gate import SessionBusyError, SessionTurnGate
+
+
+class FakeCosmosService:
+    """Session leases as the Cosmos service keeps them, without expiry."""
+
+    def __init__(self):
+        self.owners: dict[str, str] = {}
+        self.renewals = 0
+
+    async def acquire_session_lease(self, session_id: str, owner: str, duration: float) -> bool:
+        holder = self.owners.setdefault(session_id, owner)
+        if holder == owner:
+            self.renewals += 1
+        return holder == owner
+
+    async def release_session_lease(self, session_id: str, owner: str):
+        if self.owners.get(session_id) == owner:
+            del self.owners[session_id]
+
+
+def test_reject_fails_a_turn_while_the_session_is_busy(monkeypatch):
+    monkeypatch.setenv("SESSION_CONCURRENCY_POLICY", "reject")
+
+    async def main():
+        gate = SessionTurnGate(FakeCosmosService())
+        turn = await gate.begin("s1", "hello")
+        with pytest.raises(SessionBusyError):
+            await gate.begin("s1", "hello")
+        # Other sessions are not affected
+        other = await gate.begin("s2", "hello")
+
+        turn.complete("hi")
+        await turn.release()
+        await other.release()
+        next_turn = await gate.begin("s1", "hello again")
+        await next_turn.release()
+        assert gate.get_metrics()["rejected"] == 1
+
+    asyncio.run(main())
+
+
+def test_coalesce_shares_the_running_turn_result(monkeypatch):
+    monkeypatch.setenv("SESSION_CONCURRENCY_POLICY", "coalesce")
+
+    async def main():
+        gate = SessionTurnGate(FakeCosmosService())
+        leader = await gate.begin("s1", "where is my order?")
+        repeat = await gate.begin("s1", " where is my order? ")
+        assert repeat.coalesced
+
+        # A different message queues behind the running turn
+        queued = asyncio.create_task(gate.begin("s1", "cancel it"))
+        await asyncio.sleep(0.01)
+        assert not queued.done()
+
+        leader.complete("It shipped.")
+        assert await repeat.result() == "It shipped."
+        await repeat.release()
+        assert not queued.done()
+
+        await leader.release()
+        turn = await asyncio.wait_for(queued, timeout=1)
+        assert not turn.coalesced
+        turn.complete("Cancelled.")
+        await turn.release()
+        assert gate.get_metrics()["coalesced"] == 1
+
+    asyncio.run(main())
+
+
+def test_release_after_failure_admits_the_next_turn(monkeypatch):
+    monkeypatch.setenv("SESSION_CONCURRENCY_POLICY", "coalesce")
+
+    async def main():
+        gate = SessionTurnGate(FakeCosmosService())
+        leader = await gate.begin("s1", "hello")
+        repeat = await gate.begin("s1", "hello")
+        queued = asyncio.create_task(gate.begin("s1", "hello?"))
+
+        leader.fail(RuntimeError("agent run failed"))
+        await leader.release()
+        # Releasing again must not release the session lock a second time
+        await leader.release()
+
+        with pytest.raises(RuntimeError):
+            await repeat.result()
+        turn = await asyncio.wait_for(queued, timeout=1)
+        await turn.release()
+        assert gate.get_metrics()["active"] == 0
+        assert not gate._locks
+
+    asyncio.run(main())
+
+
+def test_release_without_a_result_fails_coalesced_turns(monkeypatch):
+    monkeypatch.setenv("SESSION_CONCURRENCY_POLICY", "coalesce")
+
+    async def main():
+        gate = SessionTurnGate(FakeCosmosService())
+        leader = await gate.begin("s1", "hello")
+        repeat = await gate.begin("s1", "hello")
+        await leader.release()
+        with pytest.raises(SessionBusyError):
+            await repeat.result()
+
+    asyncio.run(main())
+
+
+def test_lease_is_renewed_while_the_turn_runs(monkeypatch):
+    monkeypatch.setenv("SESSION_LOCK_DISTRIBUTED", "true")
+    monkeypatch.setenv("SESSION_LEASE_SECONDS", "0.06")
+
+    async def main():
+        cosmos_service = FakeCosmosService()
+        gate = SessionTurnGate(cosmos_service)
+        turn = await gate.begin("s1", "hello")
+        await asyncio.sleep(0.1)
+        assert cosmos_service.renewals >= 3
+
+        turn.complete("hi")
+        await turn.release()
+        assert "s1" not in cosmos_service.owners
+        renewals = cosmos_service.renewals
+        await asyncio.sleep(0.05)
+        assert cosmos_service.renewals == renewals
+        assert gate.get_metrics()["leases_lost"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+import asyncio
+
+from services.write_behind import WriteBehindQueue
+
+
+def test_close_flushes_every_partition_in_order(monkeypatch):
+    monkeypatch.setenv("WRITE_BEHIND_BATCH_SIZE", "2")
+    monkeypatch.setenv("WRITE_BEHIND_FLUSH_INTERVAL_SECONDS", "60")
+
+    async def main():
+        written = []
+
+        async def write_batch(partition_key, batch):
+            await asyncio.sleep(0)
+            written.append((partition_key, [item["id"] for item in batch]))
+
+        queue = WriteBehindQueue(write_batch)
+        queue.start()
+        for index in range(5):
+            queue.enqueue("s1", {"id": f"a{index}"})
+        queue.enqueue("s2", {"id": "b0"})
+        await queue.close()
+
+        assert [ids for key, ids in written if key == "s1"] == [["a0", "a1"], ["a2", "a3"], ["a4"]]
+        assert [ids for key, ids in written if key == "s2"] == [["b0"]]
+        assert queue.unflushed("s1") == [] and queue.unflushed("s2") == []
+        assert queue.get_metrics()["pending"] == 0
+
+    asyncio.run(main())
+
+
+def test_failed_batch_is_requeued_ahead_of_newer_items(monkeypatch):
+    monkeypatch.setenv("WRITE_BEHIND_MAX_ATTEMPTS", "1")
+
+    async def main():
+        written = []
+        failures = [RuntimeError("throttled")]
+
+        async def write_batch(partition_key, batch):
+            if failures:
+                raise failures.pop()
+            written.extend(item["id"] for item in batch)
+
+        queue = WriteBehindQueue(write_batch)
+        queue.enqueue("s1", {"id": "m1"})
+        queue.enqueue("s1", {"id": "m2"})
+        await queue.flush()
+        assert written == []
+        assert [item["id"] for item in queue.unflushed("s1")] == ["m1", "m2"]
+
+        queue.enqueue("s1", {"id": "m3"})
+        await queue.flush()
+        assert written == ["m1", "m2", "m3"]
+        assert queue.get_metrics()["failures"] == 1
+
+    asyncio.run(main())